@@ -1,34 +1,191 @@
-from flask import Flask, render_template
-from flask_sqlalchemy import SQLAlchemy
-from dotenv import load_dotenv
-from flask_bcrypt import Bcrypt
-from flask_login import LoginManager
+# SmartRoute application package
+# Importing Toll loads neither Flask nor SQLAlchemy. The extensions (db,
+# bcrypt, login_manager) are created unbound on first access - `from Toll
+# import db` in the model and builder modules - so any module can import them
+# on its own without building the app. The app itself is built by
+# create_app() - called explicitly, or on first access to Toll.app - which
+# binds the extensions and registers the routes. The Google Maps client is a
+# proxy that is only constructed when a call is made.
+#
+# create_app() writes the schema only into an empty database. An existing one
+# is upgraded (new tables, the edge store's route_data changes) by an explicit
+# `python -m Toll.edge_store migrate`; startup only warns when that is due.
+#
+# Under gunicorn, Toll.wsgi with preload_app=True builds everything once in
+# the master so workers share it copy-on-write (see gunicorn.conf.py).
+# create_app() starts no background threads - a thread started in the master
+# would not survive the fork. The refresh scheduler runs in-process only under
+# the single-process dev server (run.py); with gunicorn it is its own process.
+
+import logging
 import os
-from googlemaps import Client
+import threading
+
+from dotenv import load_dotenv
+
+from Toll.startup import timed, report
+
+logger = logging.getLogger(__name__)
+
+with timed('dotenv'):
+    # Toll/.env first, the working directory's .env as a fallback
+    if not load_dotenv(os.path.join(os.path.dirname(__file__), '.env')):
+        load_dotenv()
+
 
-# Load environment variables from the correct path
-load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
-load_dotenv()  # Also try loading from current directory
-app = Flask(__name__)
+class LazyGoogleMapsClient:
+    """
+    Stand-in for googlemaps.Client that builds the real client on first use
 
+    Truthiness mirrors the old `gmaps = None` convention: False when no usable
+    API key is configured, without constructing anything.
+    """
 
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///toll.db')
-app.config['SECRET_KEY'] = os.getenv("SECRET_KEY") or os.urandom(24).hex()
-try:
+    def __init__(self):
+        self._client = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        if self._loaded:
+            return self._client is not None
+        from Toll.fake_providers import fake_providers_enabled
+        api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+        return fake_providers_enabled() or bool(api_key and api_key != "your_actual_api_key_here")
+
+    def _load(self):
+        if not self._loaded:
+            with self._lock, timed('gmaps client'):
+                if not self._loaded:
+                    self._client = _build_gmaps_client()
+                    self._loaded = True
+        return self._client
+
+    def __getattr__(self, name):
+        client = self._load()
+        if client is None:
+            raise RuntimeError("Google Maps client not configured (set GOOGLE_MAPS_API_KEY)")
+        return getattr(client, name)
+
+
+def _build_gmaps_client():
+    from Toll.fake_providers import FakeGoogleMapsClient, fake_providers_enabled
     api_key = os.getenv("GOOGLE_MAPS_API_KEY")
-    if api_key and api_key != "your_actual_api_key_here":
-        gmaps = Client(key=api_key)
-    else:
-        gmaps = None
-except Exception:
-    gmaps = None
-db = SQLAlchemy(app)
-bcrypt=Bcrypt(app)
-login_manager = LoginManager(app)
-login_manager.login_view = "login_page"
-login_manager.login_message_category = "info"
-
-
-from Toll import routes
-with app.app_context():
-    db.create_all()
\ No newline at end of file
+    try:
+        if fake_providers_enabled():
+            # Local stand-in for load tests - no quota used
+            return FakeGoogleMapsClient.from_env()
+        if api_key and api_key != "your_actual_api_key_here":
+            from googlemaps import Client
+            return Client(key=api_key)
+    except Exception:
+        pass
+    return None
+
+
+gmaps = LazyGoogleMapsClient()
+
+_EXTENSIONS = ('db', 'bcrypt', 'login_manager')
+_create_lock = threading.RLock()
+
+
+def _extension(name):
+    """Create db, bcrypt or login_manager unbound on first use; create_app() binds them"""
+    with _create_lock:
+        if name not in globals():
+            with timed(f'extension: {name}'):
+                if name == 'db':
+                    from flask_sqlalchemy import SQLAlchemy
+                    extension = SQLAlchemy()
+                elif name == 'bcrypt':
+                    from flask_bcrypt import Bcrypt
+                    extension = Bcrypt()
+                else:
+                    from flask_login import LoginManager
+                    extension = LoginManager()
+                    extension.login_view = "login_page"
+                    extension.login_message_category = "info"
+            globals()[name] = extension
+        return globals()[name]
+
+
+def create_app(preload=False):
+    """
+    Build (once) and return the Flask application
+
+    Args:
+        preload (bool): Also load routing data and provider clients now - use
+                        in a pre-fork master so workers inherit them
+
+    Returns:
+        Flask: The configured app with all routes registered
+    """
+    global app
+    with _create_lock:
+        if 'app' not in globals():
+            extensions = [_extension(name) for name in _EXTENSIONS]
+            with timed('flask app'):
+                from flask import Flask
+
+                flask_app = Flask(__name__)
+                flask_app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URL', 'sqlite:///toll.db')
+                flask_app.config['SECRET_KEY'] = os.getenv("SECRET_KEY") or os.urandom(24).hex()
+                proxies = int(os.getenv('TRUSTED_PROXY_COUNT', 0))
+                if proxies:
+                    # Client address/scheme/host from the X-Forwarded-* headers our proxies set
+                    from werkzeug.middleware.proxy_fix import ProxyFix
+                    flask_app.wsgi_app = ProxyFix(flask_app.wsgi_app, x_for=proxies, x_proto=proxies,
+                                                  x_host=proxies)
+                for extension in extensions:
+                    extension.init_app(flask_app)
+                # Published before the routes are imported: routes.py imports it from Toll
+                app = flask_app
+
+            with timed('routes'):
+                from Toll import routes
+            with timed('database schema'):
+                from sqlalchemy import inspect
+                from Toll.edge_store import pending_migrations
+                db = _extension('db')
+                with app.app_context():
+                    if not inspect(db.engine).get_table_names():
+                        db.create_all()
+                    elif pending := pending_migrations():
+                        logger.warning(f"Database schema out of date ({', '.join(pending)}); "
+                                       f"run `python -m Toll.edge_store migrate`")
+            created = True
+        else:
+            created = False
+
+        if preload:
+            preload_resources()
+        if created or preload:
+            logger.info(f"SmartRoute startup timing:\n{report()}")
+    return app
+
+
+def preload_resources():
+    """Load everything the first request would otherwise pay for"""
+    with timed('preload: precomputed routes'):
+        from Toll.smart_routing import smart_router
+        smart_router.precomputed_data
+    from Toll.smart_routing import ROUTING_MODE
+    if ROUTING_MODE == 'hierarchical':
+        with timed('preload: hierarchical tables'):
+            from Toll.hierarchical_routing import get_network, UNITS
+            for preference in UNITS:
+                get_network(preference)
+    with timed('preload: time buckets'):
+        from Toll.time_dependent import load_time_buckets
+        load_time_buckets(build=True)
+    if gmaps:
+        gmaps._load()
+
+
+def __getattr__(name):
+    # Backwards compatible `from Toll import app` (run.py, scripts)
+    if name == 'app':
+        return create_app()
+    if name in _EXTENSIONS:
+        return _extension(name)
+    raise AttributeError(f"module 'Toll' has no attribute {name!r}")
@@ -0,0 +1,289 @@
+# All-pairs shortest paths with interchangeable backends
+# Every caller (floyd_warshall.py, the matrix builders, weighted and
+# hierarchical routing) goes through all_pairs(), which returns the same
+# thing whichever engine ran:
+#
+#   dist[i, j]  cost of the best i -> j path, np.inf when unreachable
+#   next[i, j]  first hop on that path, -1 when unreachable and on the diagonal
+#
+# Backends:
+#   python  triple loop over lists - no dependencies, fine for a handful of cities
+#   numpy   Floyd-Warshall vectorized over rows (n numpy passes)
+#   numba   compiled Floyd-Warshall kernel, when numba is installed
+#   scipy   scipy.sparse.csgraph: Floyd-Warshall for dense graphs, Dijkstra
+#           (Johnson with negative edges) for sparse ones, when scipy is installed
+#
+# select_backend() picks one from the number of nodes and the edge density;
+# APSP_BACKEND forces a backend. Paths may differ between backends when two
+# routes cost exactly the same, costs never do - `python -m Toll.apsp` checks
+# that every available backend agrees on random graphs and times them.
+#
+# Configuration (environment, read at startup):
+#   APSP_BACKEND             python | numpy | numba | scipy | auto (default auto)
+
+from collections import namedtuple
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BACKEND = os.getenv('APSP_BACKEND', 'auto')
+
+# Below this many nodes interpreter overhead dominates and plain Python wins
+SMALL_N = 12
+# Up to this many nodes a dense graph is solved fastest by the numpy backend
+MEDIUM_N = 64
+# Graphs with fewer edges than this fraction of n^2 count as sparse
+SPARSE_DENSITY = 0.1
+
+Backend = namedtuple('Backend', ['name', 'solve', 'available'])
+BACKENDS = {}
+
+
+def register_backend(name, available=lambda: True):
+    """Decorator adding solve(dist) -> (dist, next) to the registry"""
+    def register(solve):
+        BACKENDS[name] = Backend(name, solve, available)
+        return solve
+    return register
+
+
+def _has_module(name):
+    def available():
+        try:
+            __import__(name)
+        except ImportError:
+            return False
+        return True
+    return available
+
+
+def _initial_next(dist):
+    n = len(dist)
+    nxt = np.where(np.isfinite(dist), np.arange(n)[None, :], -1)
+    np.fill_diagonal(nxt, -1)
+    return nxt
+
+
+@register_backend('python')
+def _solve_python(dist):
+    n = len(dist)
+    d = dist.tolist()
+    nxt = _initial_next(dist).tolist()
+    for k in range(n):
+        row_k = d[k]
+        for i in range(n):
+            d_ik = d[i][k]
+            if d_ik == float('inf'):
+                continue
+            row_i, next_i = d[i], nxt[i]
+            for j in range(n):
+                through = d_ik + row_k[j]
+                if through < row_i[j]:
+                    row_i[j] = through
+                    next_i[j] = next_i[k]
+    return np.array(d, dtype=float), np.array(nxt, dtype=np.int64)
+
+
+@register_backend('numpy')
+def _solve_numpy(dist):
+    d = dist.copy()
+    nxt = _initial_next(dist)
+    for k in range(len(d)):
+        through = d[:, k, None] + d[None, k, :]
+        better = through < d
+        d = np.where(better, through, d)
+        nxt = np.where(better, nxt[:, k, None], nxt)
+    return d, nxt
+
+
+_numba_kernel = None
+
+
+@register_backend('numba', available=_has_module('numba'))
+def _solve_numba(dist):
+    global _numba_kernel
+    if _numba_kernel is None:
+        from numba import njit
+
+        @njit(cache=True)
+        def kernel(d, nxt):
+            n = d.shape[0]
+            for k in range(n):
+                for i in range(n):
+                    d_ik = d[i, k]
+                    if d_ik == np.inf:
+                        continue
+                    for j in range(n):
+                        through = d_ik + d[k, j]
+                        if through < d[i, j]:
+                            d[i, j] = through
+                            nxt[i, j] = nxt[i, k]
+
+        _numba_kernel = kernel
+    d = dist.copy()
+    nxt = _initial_next(dist)
+    _numba_kernel(d, nxt)
+    return d, nxt
+
+
+@register_backend('scipy', available=_has_module('scipy'))
+def _solve_scipy(dist):
+    from scipy.sparse.csgraph import csgraph_from_dense, shortest_path
+
+    n = len(dist)
+    edges = np.isfinite(dist)
+    np.fill_diagonal(edges, False)
+    density = edges.sum() / max(1, n * n)
+    if density >= SPARSE_DENSITY:
+        method = 'FW'
+    else:
+        method = 'J' if (dist[edges] < 0).any() else 'D'
+
+    # Solving the reversed graph turns scipy's predecessors into first hops:
+    # the node before i on j -> i in the reversed graph follows i on i -> j
+    graph = csgraph_from_dense(np.ascontiguousarray(dist.T), null_value=np.inf)
+    d, pred = shortest_path(graph, method=method, directed=True, return_predecessors=True)
+    nxt = pred.T.astype(np.int64)
+    nxt[nxt < 0] = -1
+    return np.ascontiguousarray(d.T), nxt
+
+
+def available_backends():
+    return [name for name, backend in BACKENDS.items() if backend.available()]
+
+
+def select_backend(n, density):
+    """
+    Fastest available backend for a graph
+
+    Args:
+        n (int): Number of nodes
+        density (float): Edges / n^2
+
+    Returns:
+        str: Backend name
+    """
+    available = available_backends()
+    if n < SMALL_N:
+        return 'python'
+    if density < SPARSE_DENSITY and 'scipy' in available:
+        return 'scipy'
+    if n < MEDIUM_N:
+        return 'numpy'
+    for name in ('numba', 'scipy'):
+        if name in available:
+            return name
+    return 'numpy'
+
+
+def all_pairs(matrix, backend=None):
+    """
+    All-pairs shortest paths
+
+    Args:
+        matrix (array-like): N x N edge costs, inf (or None) for no edge
+        backend (str): Backend name or 'auto'; defaults to APSP_BACKEND
+
+    Returns:
+        tuple: (dist, next) as described at the top of this module
+    """
+    dist = np.array([[np.inf if v is None else v for v in row] for row in matrix], dtype=float) \
+        if isinstance(matrix, list) else np.array(matrix, dtype=float)
+    np.fill_diagonal(dist, np.minimum(np.diagonal(dist), 0))
+    n = len(dist)
+
+    name = backend or BACKEND
+    if name == 'auto':
+        edges = np.isfinite(dist).sum() - n
+        name = select_backend(n, edges / max(1, n * n))
+    chosen = BACKENDS.get(name)
+    if chosen is None or not chosen.available():
+        raise ValueError(f"APSP backend {name!r} is not available (have: {', '.join(available_backends())})")
+    return chosen.solve(dist)
+
+
+def path(next_node, start, end):
+    """Node indices of the start -> end path, [] when unreachable"""
+    if start == end:
+        return [start]
+    if next_node[start][end] < 0:
+        return []
+    nodes = [start]
+    while start != end and len(nodes) <= len(next_node):
+        start = int(next_node[start][end])
+        nodes.append(start)
+    return nodes if start == end else []
+
+
+def _random_graph(n, density, rng, zero_fraction=0.05):
+    matrix = np.where(rng.random((n, n)) < density, rng.uniform(1, 100, (n, n)), np.inf)
+    matrix[rng.random((n, n)) < zero_fraction * density] = 0
+    np.fill_diagonal(matrix, 0)
+    return matrix
+
+
+def verify_backends(sizes=(1, 2, 7, 30, 90), densities=(0.02, 0.3, 1.0), seed=7):
+    """
+    Cross-check every available backend on random graphs
+
+    Returns:
+        list: Failure descriptions, empty when all backends agree
+    """
+    rng = np.random.default_rng(seed)
+    failures = []
+    for n in sizes:
+        for density in densities:
+            matrix = _random_graph(n, density, rng)
+            reference, _ = _solve_python(matrix.copy())
+            for name in available_backends():
+                dist, nxt = all_pairs(matrix, backend=name)
+                label = f"{name} n={n} density={density}"
+                if not np.array_equal(np.isinf(dist), np.isinf(reference)) or \
+                        not np.allclose(dist[np.isfinite(dist)], reference[np.isfinite(reference)]):
+                    failures.append(f"{label}: costs differ")
+                    continue
+                if (np.diagonal(nxt) != -1).any() or ((nxt == -1) != (np.isinf(dist) | np.eye(n, dtype=bool))).any():
+                    failures.append(f"{label}: -1 sentinel misplaced")
+                    continue
+                for i in range(n):
+                    for j in range(n):
+                        if i != j and np.isfinite(dist[i, j]):
+                            hops = path(nxt, i, j)
+                            cost = sum(matrix[a, b] for a, b in zip(hops, hops[1:]))
+                            if not hops or not np.isclose(cost, dist[i, j]):
+                                failures.append(f"{label}: path {i}->{j} does not add up")
+                                break
+    return failures
+
+
+def main(argv=None):
+    print(f"Available APSP backends: {', '.join(available_backends())}")
+    failures = verify_backends()
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print("✅ All backends agree on costs, paths and sentinels")
+
+    rng = np.random.default_rng(1)
+    for n, density in ((8, 1.0), (24, 1.0), (200, 1.0), (200, 0.03), (600, 0.01)):
+        matrix = _random_graph(n, density, rng)
+        timings = []
+        for name in available_backends():
+            if name == 'python' and n > 200:
+                continue
+            started = time.perf_counter()
+            all_pairs(matrix, backend=name)
+            timings.append(f"{name} {(time.perf_counter() - started) * 1000:.1f}ms")
+        edges = np.isfinite(matrix).sum() - n
+        print(f"n={n:4d} density={density:<5} auto={select_backend(n, edges / n / n):6s} " + '  '.join(timings))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# Fingerprinted, precompressed static assets
+# `python -m Toll.assets` copies every file under Toll/static to
+# Toll/static/dist/<name>.<content hash><ext>, next to .gz and (when the
+# brotli package is installed) .br versions compressed once at build time,
+# and writes dist/manifest.json mapping the original names to the hashed ones.
+#
+# At runtime url_for('static', filename=...) in templates resolves to the
+# hashed file under /assets/ when the manifest lists it, and those responses
+# carry a one-year immutable Cache-Control plus the best encoding the client
+# accepts - a changed file gets a new name, so browsers never revalidate.
+# Without a build the plain /static URLs keep working as before.
+#
+# Usage: python -m Toll.assets
+
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import shutil
+import sys
+
+from flask import abort, request, send_from_directory, url_for
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = os.path.join(os.path.dirname(__file__), 'static')
+DIST_DIR = os.path.join(STATIC_DIR, 'dist')
+MANIFEST_PATH = os.path.join(DIST_DIR, 'manifest.json')
+
+# Only text formats gain from compression
+COMPRESSIBLE = {'.css', '.js', '.svg', '.json', '.html', '.txt', '.map'}
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+# Content-Encoding -> file suffix, in order of preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _fingerprint(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build_assets(static_dir=STATIC_DIR, dist_dir=DIST_DIR):
+    """
+    Fingerprint and precompress every static file
+
+    Returns:
+        dict: The manifest, original relative path -> hashed relative path
+    """
+    brotli = _brotli()
+    if brotli is None:
+        print("⚠️  brotli not installed (pip install brotli) - writing gzip only")
+
+    shutil.rmtree(dist_dir, ignore_errors=True)
+    manifest = {}
+    saved = 0
+    for root, dirs, files in os.walk(static_dir):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != dist_dir]
+        for name in sorted(files):
+            source = os.path.join(root, name)
+            logical = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(logical)
+            hashed = f"{stem}.{_fingerprint(source)}{ext}"
+            target = os.path.join(dist_dir, hashed)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+            manifest[logical] = hashed
+
+            if ext.lower() not in COMPRESSIBLE:
+                continue
+            with open(source, 'rb') as f:
+                raw = f.read()
+            variants = {'.gz': gzip.compress(raw, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                variants['.br'] = brotli.compress(raw, quality=11)
+            for suffix, data in variants.items():
+                if len(data) < len(raw):
+                    with open(target + suffix, 'wb') as f:
+                        f.write(data)
+            best = min(len(data) for data in variants.values())
+            saved += len(raw) - min(best, len(raw))
+            print(f"✓ {logical} → {hashed} ({len(raw):,} → {best:,} bytes)")
+
+    with open(os.path.join(dist_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    print(f"💾 {len(manifest)} assets written to {dist_dir} ({saved:,} bytes saved per cold page load)")
+    return manifest
+
+
+def load_manifest(path=MANIFEST_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def init_app(app):
+    """Resolve static URLs in templates to hashed assets when a build exists"""
+    manifest = load_manifest()
+    if not manifest:
+        logger.info("No asset manifest found; serving /static unversioned (run python -m Toll.assets)")
+        return
+
+    def asset_url_for(endpoint, **values):
+        if endpoint == 'static' and values.get('filename') in manifest:
+            return url_for('hashed_asset', filename=manifest[values.pop('filename')], **values)
+        return url_for(endpoint, **values)
+
+    app.jinja_env.globals['url_for'] = asset_url_for
+    logger.info(f"Serving {len(manifest)} fingerprinted assets from {DIST_DIR}")
+
+
+def serve_asset(filename):
+    """A hashed asset in the best encoding the client accepts, cacheable forever"""
+    path = os.path.join(DIST_DIR, filename)
+    if filename.endswith(('.gz', '.br')) or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    served, encoding = filename, None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            served, encoding = filename + suffix, name
+            break
+
+    response = send_from_directory(DIST_DIR, served, mimetype=mimetype, max_age=31536000)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Cache-Control'] = IMMUTABLE
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+if __name__ == '__main__':
+    build_assets()
+    sys.exit(0)
@@ -0,0 +1,184 @@
+# Async routing service
+# The Directions call (route, traffic-aware time, highways) and the Routes API
+# call (real toll prices) are independent, so they are issued concurrently
+# instead of back to back. Both go through one pooled requests.Session, and the
+# result is returned as soon as the fields the caller needs are present - the
+# slower call is abandoned rather than awaited.
+#
+# The provider clients are blocking, so each call runs on a shared thread pool;
+# the coroutine itself only waits, which lets one event loop (an ASGI worker)
+# keep many route requests in flight. Flask views are synchronous and call
+# get_route_sync(), which runs the fan-out on a short-lived loop of their own.
+#
+# Configuration (environment, read at startup):
+#   ASYNC_PROVIDER_POOL     max pooled connections and concurrent provider calls (default 32)
+#   ASYNC_ROUTE_TIMEOUT_S   how long to wait for the required fields (default 8)
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Toll import gmaps
+from Toll.direct_routing import get_direct_route
+from Toll.fake_providers import fake_providers_enabled
+from Toll.metrics import span
+from Toll.routes_api import RoutesAPI
+
+logger = logging.getLogger(__name__)
+
+POOL_SIZE = int(os.getenv('ASYNC_PROVIDER_POOL', 32))
+ROUTE_TIMEOUT_S = float(os.getenv('ASYNC_ROUTE_TIMEOUT_S', 8))
+
+# What a route answer needs by default; 'highways' and 'route_summary' are extras
+REQUIRED_FIELDS = ('distance_km', 'duration_hours', 'toll_cost')
+
+
+def _pooled_session(pool_size):
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+class AsyncRoutingService:
+    """
+    Concurrent provider fan-out for one route request
+
+    One instance is shared by the whole process: it owns the connection pool
+    and the thread pool the blocking provider calls run on.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, directions_client=None, routes_api=None):
+        self.session = _pooled_session(pool_size)
+        self.executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='provider')
+        self.directions_client = directions_client or self._directions_client()
+        if routes_api is None:
+            routes_api = RoutesAPI() if fake_providers_enabled() else RoutesAPI(http=self.session)
+        self.routes_api = routes_api
+
+    def _directions_client(self):
+        """googlemaps client sharing this service's connection pool"""
+        api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+        if fake_providers_enabled() or not api_key or api_key == "your_actual_api_key_here":
+            return gmaps
+        from googlemaps import Client
+        return Client(key=api_key, requests_session=self.session)
+
+    async def get_route(self, source, destination, preference='distance',
+                        required=REQUIRED_FIELDS, timeout=ROUTE_TIMEOUT_S):
+        """
+        Route data from Directions and Routes API, fetched concurrently
+
+        Args:
+            source (str): Starting city
+            destination (str): Destination city
+            preference (str): 'distance', 'time', or 'toll'
+            required (tuple): Fields to wait for before returning
+            timeout (float): Seconds to wait for the required fields
+
+        Returns:
+            dict: Merged route data (same keys as get_direct_route), or None
+                  if neither provider answered
+        """
+        loop = asyncio.get_running_loop()
+        calls = {
+            loop.run_in_executor(self.executor, self._directions, source, destination, preference): 'directions',
+            loop.run_in_executor(self.executor, self._tolls, source, destination, preference): 'routes_api',
+        }
+        result = {}
+        pending = set(calls)
+        deadline = loop.time() + timeout
+
+        with span('provider.fan_out'):
+            while pending and not all(field in result for field in required):
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    try:
+                        _merge(result, calls[future], future.result())
+                    except Exception as e:
+                        logger.error(f"{calls[future]} call failed for {source} → {destination}: {e}")
+
+        for future in pending:
+            # Still running on the thread pool; nobody waits for it
+            future.cancel()
+            logger.info(f"Returned {source} → {destination} without waiting for {calls[future]}")
+
+        if not result:
+            return None
+        # Directions answered but the toll call did not: keep its estimate
+        if 'toll_cost' not in result and 'estimated_toll_cost' in result:
+            result['toll_cost'] = result['estimated_toll_cost']
+            result['toll_source'] = 'estimated'
+        result.setdefault('route', [source, destination])
+        result['data_sources'] = sorted(result['data_sources'])
+        return result
+
+    def _directions(self, source, destination, preference):
+        return get_direct_route(source, destination, preference, client=self.directions_client)
+
+    def _tolls(self, source, destination, preference):
+        return self.routes_api.get_route_with_tolls(source, destination, preference)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.session.close()
+
+
+def _merge(result, provider, data):
+    """Fold one provider's answer into the combined result"""
+    if not data:
+        return
+    result.setdefault('data_sources', set()).add(provider)
+
+    if provider == 'directions':
+        # Directions owns the route shape and the traffic-aware figures
+        result.update({
+            'route': data['route'],
+            'distance_km': data['distance_km'],
+            'duration_hours': data['duration_hours'],
+            'estimated_toll_cost': data['toll_cost'],
+            'highways': data.get('highways', []),
+            'route_summary': data.get('route_summary', ''),
+            'is_direct': True
+        })
+    elif data.get('route_found'):
+        # Routes API owns the toll price; its distance/time only fill gaps
+        result['toll_cost'] = data['toll_cost_inr'] or data['distance_km'] * 2.5
+        result['toll_source'] = 'routes_api' if data['toll_cost_inr'] else 'distance_estimate'
+        result.setdefault('distance_km', data['distance_km'])
+        result.setdefault('duration_hours', data['duration_hours'])
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def routing_service():
+    """The process-wide AsyncRoutingService, created on first use"""
+    global _service
+    if _service is None:
+        # Request threads race here on a cold worker; a second service would
+        # leak its own connection and thread pools
+        with _service_lock:
+            if _service is None:
+                _service = AsyncRoutingService()
+    return _service
+
+
+async def get_route_async(source, destination, preference='distance', required=REQUIRED_FIELDS):
+    return await routing_service().get_route(source, destination, preference, required)
+
+
+def get_route_sync(source, destination, preference='distance', required=REQUIRED_FIELDS):
+    """get_route_async for synchronous callers (Flask views); runs it on its own event loop"""
+    return asyncio.run(get_route_async(source, destination, preference, required))
@@ -0,0 +1,253 @@
+# Batch and many-to-many route queries
+# Answers hundreds of (source, destination, preference) queries in one call.
+# Queries are processed in fixed-size chunks: each chunk is looked up in the
+# precomputed (3, n, n) cost tensor with one NumPy fancy-indexing operation,
+# and only the misses (cities outside the network, unreachable pairs) are sent
+# to the live providers through a bounded thread pool. Results are yielded as
+# NDJSON lines, so a batch of any size runs in memory proportional to a chunk.
+#
+# Live calls cost provider quota, so a batch may send at most
+# BATCH_MAX_LIVE_MISSES misses to the providers, and each one also takes a
+# route rate-limit token (the caller's allow_live). Misses beyond either are
+# answered with status 'live_limited' and no provider call.
+#
+# Configuration (environment, read at startup):
+#   BATCH_MAX_QUERIES          largest accepted batch (default 10000)
+#   BATCH_MAX_LIVE_MISSES      misses per batch sent to the live providers (default 50)
+#   BATCH_PROVIDER_CONCURRENCY live provider calls in flight across all batches (default 8)
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import islice, product
+import json
+import logging
+import os
+
+import numpy as np
+
+from Toll.metrics import span, CACHE_REQUESTS, ROUTING_STRATEGY
+from Toll.providers import get_hedged_route
+from Toll.smart_routing import smart_router
+from Toll.static_data import CITIES, DISTANCE_MATRIX, TIME_MATRIX, TOLL_MATRIX
+
+logger = logging.getLogger(__name__)
+
+METRICS = ('distance', 'time', 'toll')
+UNITS = {'distance': 'km', 'time': 'hours', 'toll': 'INR'}
+CHUNK_SIZE = 1000
+MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', 10000))
+MAX_LIVE_MISSES = int(os.getenv('BATCH_MAX_LIVE_MISSES', 50))
+PROVIDER_CONCURRENCY = int(os.getenv('BATCH_PROVIDER_CONCURRENCY', 8))
+
+_provider_pool = ThreadPoolExecutor(max_workers=PROVIDER_CONCURRENCY, thread_name_prefix='batch-provider')
+_tables_cache = {}
+
+
+class BatchRequestError(ValueError):
+    """Malformed batch request; the message is safe to return to the client"""
+
+
+def parse_batch(payload):
+    """
+    Validate a batch request body
+
+    Args:
+        payload (dict): Either {"pairs": [{"source", "destination", "preference"?}, ...]}
+                        or {"origins": [...], "destinations": [...]}, with an
+                        optional top-level "preference" (default 'distance')
+                        and "live" flag (default true)
+
+    Returns:
+        tuple: (iterator of (source, destination, preference), query count, live)
+    """
+    if not isinstance(payload, dict):
+        raise BatchRequestError("Request body must be a JSON object")
+
+    default_pref = payload.get('preference', 'distance')
+    live = bool(payload.get('live', True))
+
+    if 'pairs' in payload:
+        pairs = payload['pairs']
+        if not isinstance(pairs, list):
+            raise BatchRequestError("'pairs' must be a list")
+        queries = []
+        for i, pair in enumerate(pairs):
+            if not isinstance(pair, dict) or not pair.get('source') or not pair.get('destination'):
+                raise BatchRequestError(f"pairs[{i}] needs a source and a destination")
+            queries.append((_city(pair['source']), _city(pair['destination']),
+                            _preference(pair.get('preference', default_pref))))
+        count = len(queries)
+        queries = iter(queries)
+    elif 'origins' in payload and 'destinations' in payload:
+        origins, destinations = payload['origins'], payload['destinations']
+        if not isinstance(origins, list) or not isinstance(destinations, list):
+            raise BatchRequestError("'origins' and 'destinations' must be lists")
+        preference = _preference(default_pref)
+        count = len(origins) * len(destinations)
+        # Generated lazily - a 100 x 100 request never materializes 10,000 tuples
+        queries = ((src, dst, preference) for src, dst in
+                   product([_city(c) for c in origins], [_city(c) for c in destinations]))
+    else:
+        raise BatchRequestError("Provide either 'pairs' or 'origins' and 'destinations'")
+
+    if count > MAX_QUERIES:
+        raise BatchRequestError(f"Batch has {count} queries, the limit is {MAX_QUERIES}")
+    return queries, count, live
+
+
+def _city(name):
+    if not isinstance(name, str) or not name.strip():
+        raise BatchRequestError(f"Invalid city name: {name!r}")
+    return name.strip().title()
+
+
+def _preference(preference):
+    if preference not in METRICS:
+        raise BatchRequestError(f"preference must be one of {', '.join(METRICS)}")
+    return preference
+
+
+def load_cost_tables():
+    """
+    Precomputed costs as a (3, n, n) tensor ordered as METRICS
+
+    Uses the Floyd-Warshall results in precomputed_routes.json when present,
+    otherwise the static offline matrices.
+
+    Returns:
+        tuple: (tensor, {city: index}, paths dict or None, data source label)
+    """
+    data = smart_router.precomputed_data
+    key = data.get('last_updated') if data else 'static'
+    if key in _tables_cache:
+        return _tables_cache[key]
+
+    if data:
+        cities = data['cities']
+        tensor = np.full((len(METRICS), len(cities), len(cities)), np.inf)
+        for m, metric in enumerate(METRICS):
+            rows = data[f'{metric}_matrix']
+            for i, src in enumerate(cities):
+                row = rows.get(src, {})
+                tensor[m, i] = [row.get(dst, np.inf) for dst in cities]
+        paths = {metric: data.get(f'{metric}_paths', {}) for metric in METRICS}
+        tables = (tensor, {c: i for i, c in enumerate(cities)}, paths, 'Floyd-Warshall Precomputed')
+    else:
+        tensor = np.array([DISTANCE_MATRIX, TIME_MATRIX, TOLL_MATRIX], dtype=float)
+        tables = (tensor, {c: i for i, c in enumerate(CITIES)}, None, 'Static matrix')
+
+    tensor.setflags(write=False)
+    _tables_cache.clear()
+    _tables_cache[key] = tables
+    return tables
+
+
+def run_batch(queries, live=True, allow_live=None):
+    """
+    Answer queries chunk by chunk
+
+    Args:
+        queries (iterable): (source, destination, preference) tuples
+        live (bool): Send misses to the live providers
+        allow_live (callable): Asked before each live call; False (e.g. the
+                               rate limit is spent) ends live calls for the batch
+
+    Yields:
+        dict: One result per query, tagged with its position in the batch
+    """
+    tensor, city_index, paths, data_source = load_cost_tables()
+    metric_index = {m: i for i, m in enumerate(METRICS)}
+    queries = iter(queries)
+    offset = 0
+    live_left = MAX_LIVE_MISSES if live else 0
+
+    def admit():
+        nonlocal live_left
+        if live_left > 0 and allow_live is not None and not allow_live():
+            live_left = 0
+        if live_left <= 0:
+            return False
+        live_left -= 1
+        return True
+
+    while True:
+        chunk = list(islice(queries, CHUNK_SIZE))
+        if not chunk:
+            return
+
+        with span('batch.lookup'):
+            src = np.array([city_index.get(s, -1) for s, _, _ in chunk])
+            dst = np.array([city_index.get(d, -1) for _, d, _ in chunk])
+            pref = np.array([metric_index[p] for _, _, p in chunk])
+            known = (src >= 0) & (dst >= 0)
+            costs = np.full(len(chunk), np.inf)
+            costs[known] = tensor[pref[known], src[known], dst[known]]
+            hit = np.isfinite(costs)
+        CACHE_REQUESTS.inc(int(hit.sum()), cache='batch_matrix', result='hit')
+        CACHE_REQUESTS.inc(int((~hit).sum()), cache='batch_matrix', result='miss')
+        ROUTING_STRATEGY.inc(int(hit.sum()), strategy='batch_precomputed')
+
+        misses = []
+        for i, (source, destination, preference) in enumerate(chunk):
+            if not hit[i]:
+                misses.append((offset + i, source, destination, preference))
+                continue
+            route = [source, destination]
+            if paths is not None:
+                route = paths[preference].get(source, {}).get(destination, route)
+            yield {
+                'index': offset + i, 'source': source, 'destination': destination,
+                'preference': preference, 'cost': float(costs[i]), 'unit': UNITS[preference],
+                'route': route, 'data_source': data_source, 'status': 'ok'
+            }
+
+        yield from _answer_misses(misses, live, admit)
+        offset += len(chunk)
+
+
+def _answer_misses(misses, live, admit):
+    if not live:
+        ROUTING_STRATEGY.inc(len(misses), strategy='batch_offline')
+        for index, source, destination, preference in misses:
+            yield _not_found(index, source, destination, preference)
+        return
+
+    futures = {}
+    for miss in misses:
+        if admit():
+            futures[_provider_pool.submit(get_hedged_route, *miss[1:])] = miss
+        else:
+            yield dict(_not_found(*miss), status='live_limited')
+    ROUTING_STRATEGY.inc(len(futures), strategy='batch_live')
+    ROUTING_STRATEGY.inc(len(misses) - len(futures), strategy='batch_live_limited')
+    for future in as_completed(futures):
+        index, source, destination, preference = futures[future]
+        try:
+            data = future.result()
+        except Exception as e:
+            logger.error(f"Batch live lookup failed for {source} → {destination}: {e}")
+            data = None
+        if not data:
+            yield _not_found(index, source, destination, preference)
+            continue
+        cost_field = {'distance': 'distance_km', 'time': 'duration_hours', 'toll': 'toll_cost'}[preference]
+        yield {
+            'index': index, 'source': source, 'destination': destination,
+            'preference': preference, 'cost': data[cost_field], 'unit': UNITS[preference],
+            'route': data['route'], 'data_source': data.get('data_source', 'Live provider'), 'status': 'ok'
+        }
+
+
+def _not_found(index, source, destination, preference):
+    return {'index': index, 'source': source, 'destination': destination,
+            'preference': preference, 'status': 'not_found'}
+
+
+def stream_ndjson(results, count):
+    """NDJSON lines for each result plus a closing summary line"""
+    answered = limited = 0
+    for result in results:
+        answered += result['status'] == 'ok'
+        limited += result['status'] == 'live_limited'
+        yield json.dumps(result) + '\n'
+    yield json.dumps({'summary': {'queries': count, 'answered': answered, 'live_limited': limited,
+                                  'not_found': count - answered - limited}}) + '\n'
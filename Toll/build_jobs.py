@@ -0,0 +1,232 @@
+# Resumable matrix builds
+# A matrix build makes one provider call per ordered city pair - hours of
+# quota for a large network. Each build is a named job whose pairs are
+# checkpointed in the build_pair table as they are fetched, so a crash, a
+# Ctrl-C or an exhausted quota loses at most the pair in flight. Re-running
+# the same job resumes it: only pairs that are pending, failed (up to
+# BUILD_MAX_ATTEMPTS) or older than BUILD_MAX_AGE_DAYS are fetched again,
+# and the all-pairs step runs once the manifest has nothing left to do.
+# A quota error (429 / OVER_QUERY_LIMIT / RESOURCE_EXHAUSTED) stops the run
+# at once and does not count as an attempt, so quota never makes a build
+# give up on a pair.
+#
+# Configuration (environment, read at startup):
+#   BUILD_MAX_AGE_DAYS       fetched pairs older than this are refreshed (default 30)
+#   BUILD_MAX_ATTEMPTS       failed pairs are retried up to this many times (default 3)
+#   BUILD_MAX_CONSECUTIVE_FAILURES  stop the run after this many failures in a row,
+#                            e.g. an exhausted quota (default 10)
+#
+# Usage: python -m Toll.build_jobs status [job]
+#        python -m Toll.build_jobs run comprehensive|routes_api [--fresh] [--preference time]
+
+from datetime import datetime, timedelta
+import logging
+import os
+import sys
+import time
+
+from sqlalchemy import func, insert, select
+
+from Toll import db
+from Toll.edge_store import _app_context, normalize_city
+from Toll.models import BuildPair
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE_DAYS = float(os.getenv('BUILD_MAX_AGE_DAYS', 30))
+MAX_ATTEMPTS = int(os.getenv('BUILD_MAX_ATTEMPTS', 3))
+MAX_CONSECUTIVE_FAILURES = int(os.getenv('BUILD_MAX_CONSECUTIVE_FAILURES', 10))
+
+PENDING, FETCHED, FAILED = 'pending', 'fetched', 'failed'
+
+# Provider statuses that mean "stop for today", not "this pair has no route"
+QUOTA_STATUSES = {'OVER_QUERY_LIMIT', 'OVER_DAILY_LIMIT', 'RESOURCE_EXHAUSTED', 429}
+
+
+class BuildAborted(Exception):
+    """The run stopped early; the job can be resumed later"""
+
+
+def is_quota_error(error):
+    from Toll.metrics import provider_error_status
+    return provider_error_status(error) in QUOTA_STATUSES
+
+
+class BuildJob:
+    """Checkpointed fetches of every ordered pair of a city list"""
+
+    def __init__(self, name, cities, max_age_days=MAX_AGE_DAYS):
+        self.name = name
+        self.cities = [normalize_city(c) for c in cities]
+        self.max_age = timedelta(days=max_age_days)
+
+    def _pairs(self):
+        return BuildPair.query.filter_by(job=self.name)
+
+    def start(self, resume=True):
+        """
+        Register the job's pairs in the manifest
+
+        Args:
+            resume (bool): Keep earlier checkpoints; False marks every pair pending again
+
+        Returns:
+            BuildJob: self
+        """
+        with _app_context():
+            table = BuildPair.__table__
+            known = set(db.session.execute(
+                select(table.c.source, table.c.destination).where(table.c.job == self.name)).all())
+            missing = [{'job': self.name, 'source': src, 'destination': dst, 'status': PENDING, 'attempts': 0}
+                       for src in self.cities for dst in self.cities
+                       if src != dst and (src, dst) not in known]
+            if missing:
+                db.session.execute(insert(table), missing)
+            if not resume:
+                self._pairs().update({'status': PENDING, 'attempts': 0, 'error': None})
+            db.session.commit()
+        logger.info(f"Build job {self.name}: {len(missing)} new pairs, resume={resume}")
+        return self
+
+    def todo(self):
+        """(source, destination) pairs still to fetch: pending, retryable failures and stale ones"""
+        stale_before = datetime.utcnow() - self.max_age
+        cities = set(self.cities)
+        with _app_context():
+            rows = self._pairs().filter(
+                (BuildPair.status == PENDING)
+                | ((BuildPair.status == FAILED) & (BuildPair.attempts < MAX_ATTEMPTS))
+                | ((BuildPair.status == FETCHED) & (BuildPair.fetched_at < stale_before))
+            ).order_by(BuildPair.id).all()
+        return [(r.source, r.destination) for r in rows if r.source in cities and r.destination in cities]
+
+    def checkpoint(self, source, destination, distance_km, time_hours, toll_inr):
+        """Durably record one fetched pair"""
+        with _app_context():
+            self._pairs().filter_by(source=source, destination=destination).update({
+                'status': FETCHED, 'distance': distance_km, 'time': time_hours, 'toll': toll_inr,
+                'attempts': BuildPair.attempts + 1, 'error': None, 'fetched_at': datetime.utcnow()
+            })
+            db.session.commit()
+
+    def fail(self, source, destination, error, count_attempt=True):
+        """
+        Record a failed fetch
+
+        Args:
+            count_attempt (bool): False for failures that say nothing about the
+                                  pair (quota): the pair stays as it was, with
+                                  the error noted, and is retried on resume
+        """
+        with _app_context():
+            pair = self._pairs().filter_by(source=source, destination=destination)
+            if count_attempt:
+                pair.update({'status': FAILED, 'attempts': BuildPair.attempts + 1, 'error': str(error)[:200]})
+            else:
+                pair.update({'error': str(error)[:200]})
+            db.session.commit()
+
+    def manifest(self):
+        """Pair counts per status, plus fetched pairs that are due for a refresh"""
+        stale_before = datetime.utcnow() - self.max_age
+        with _app_context():
+            counts = dict(db.session.query(BuildPair.status, func.count())
+                          .filter(BuildPair.job == self.name).group_by(BuildPair.status).all())
+            stale = self._pairs().filter(BuildPair.status == FETCHED, BuildPair.fetched_at < stale_before).count()
+            exhausted = self._pairs().filter(BuildPair.status == FAILED, BuildPair.attempts >= MAX_ATTEMPTS).count()
+        return {
+            'job': self.name,
+            'pairs': sum(counts.values()),
+            PENDING: counts.get(PENDING, 0),
+            FETCHED: counts.get(FETCHED, 0),
+            FAILED: counts.get(FAILED, 0),
+            'stale': stale,
+            'gave_up': exhausted
+        }
+
+    def edges(self):
+        """Fetched pairs as (source, destination, km, hours, INR, fetched_at), ready for upsert_edges"""
+        with _app_context():
+            rows = self._pairs().filter_by(status=FETCHED).order_by(BuildPair.id).all()
+        return [(r.source, r.destination, r.distance, r.time, r.toll, r.fetched_at) for r in rows]
+
+    def run(self, fetch, resume=True, delay=0.1):
+        """
+        Fetch every outstanding pair
+
+        Args:
+            fetch (callable): fetch(source, destination) -> (km, hours, INR), or
+                              None when no route exists; exceptions mark the pair failed
+            resume (bool): See start()
+            delay (float): Seconds between provider calls
+
+        Returns:
+            dict: The manifest after the run; raises BuildAborted on quota
+                  errors or too many consecutive failures
+        """
+        self.start(resume)
+        todo = self.todo()
+        print(f"🔁 {self.name}: {len(todo)} pairs to fetch ({self.manifest()[FETCHED]} already checkpointed)")
+
+        consecutive_failures = 0
+        for source, destination in todo:
+            try:
+                values = fetch(source, destination)
+                error = None if values is not None else 'no route returned'
+            except Exception as e:
+                values, error = None, e
+
+            if values is None:
+                quota = isinstance(error, Exception) and is_quota_error(error)
+                self.fail(source, destination, error, count_attempt=not quota)
+                if quota:
+                    raise BuildAborted(f"{self.name}: provider quota exhausted - rerun to resume")
+                consecutive_failures += 1
+                if consecutive_failures >= MAX_CONSECUTIVE_FAILURES:
+                    raise BuildAborted(f"{self.name}: {consecutive_failures} failures in a row "
+                                       f"(last: {error}) - rerun to resume")
+            else:
+                self.checkpoint(source, destination, *values)
+                consecutive_failures = 0
+                print(f"✓ {source} → {destination}: {values[0]:.0f}km, {values[1]:.1f}h, ₹{values[2]:.0f}")
+
+            if delay:
+                time.sleep(delay)
+
+        return self.manifest()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Inspect or run resumable matrix builds")
+    commands = parser.add_subparsers(dest='command', required=True)
+    status = commands.add_parser('status', help="Show the manifest of build jobs")
+    status.add_argument('job', nargs='?')
+    run = commands.add_parser('run', help="Run or resume a build")
+    run.add_argument('builder', choices=('comprehensive', 'routes_api'))
+    run.add_argument('--fresh', action='store_true', help="Ignore earlier checkpoints")
+    run.add_argument('--preference', default='distance', choices=('distance', 'time', 'toll'))
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        with _app_context():
+            names = [args.job] if args.job else [j for (j,) in db.session.query(BuildPair.job).distinct()]
+        for name in names:
+            print(BuildJob(name, []).manifest())
+        return 0
+
+    try:
+        if args.builder == 'comprehensive':
+            from Toll.matrix_builder import build_comprehensive_matrices
+            return 0 if build_comprehensive_matrices(resume=not args.fresh) else 1
+        from Toll.routes_api import build_matrix_with_routes_api
+        build_matrix_with_routes_api(args.preference, resume=not args.fresh)
+        return 0
+    except BuildAborted as e:
+        print(f"⏸️  {e}")
+        return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
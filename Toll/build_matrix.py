@@ -1,5 +1,10 @@
+import logging
 import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
 from Toll.map_service import get_route_details
+from Toll.edge_store import load_edge_tensor, upsert_edges
+
+logger = logging.getLogger(__name__)
 
 
 def build_matrix(preference='distance', cities=None):
@@ -23,6 +28,7 @@ def build_matrix(preference='distance', cities=None):
     
     # Add caching to avoid repeated API calls
     cache = {}
+    edges = []
     n = len(cities)
     matrix = np.full((n, n), np.inf)  # Initialize with infinity
     
@@ -52,6 +58,13 @@ def build_matrix(preference='distance', cities=None):
                 continue  # Keep as infinity if no route
             
             print(f"API data for {cities[i]} to {cities[j]}: {data}")
+
+            if 'distance_value' in data and 'duration_value' in data:
+                # Keep every metric in the edge store, whatever this build is for
+                distance_km = data['distance_value'] / 1000
+                hours = data['duration_value'] / 3600
+                edges.append((cities[i], cities[j], distance_km, hours, distance_km * 2.5))
+                edges.append((cities[j], cities[i], distance_km, hours, distance_km * 2.5))
             
             try:
                 # Set cost based on user preference
@@ -94,75 +107,30 @@ def build_matrix(preference='distance', cities=None):
                         matrix[i][j] = matrix[j][i] = cost
             except (ValueError, IndexError, KeyError):
                 continue  # Skip invalid data
-        
+
+    try:
+        upsert_edges(edges)
+    except SQLAlchemyError as e:
+        logger.error(f"Could not store edges in route_data: {e}")
     
     return matrix, cities
 
 
 
-'''import sqlite3
-from Toll.floyd_warshall import floyd_warshall
-import os
-
-
-
-
+def build_matrix_from_db(preference, cities=None):
+    """
+    Builds a N x N cost matrix from the edges stored in route_data.
 
-def build_matrix_from_db(preference):
-    basedir = os.path.abspath(os.path.dirname(__file__))
-    db_path =os.path.join(basedir,"toll.db")
-    print('USing database at : ',db_path)
-    conn=sqlite3.connect(db_path)
-    cursor=conn.cursor()
-    cursor.execute('SELECT id,source,destination,time,distance,toll FROM route_data')
-    data=cursor.fetchall()
-    print("data : ",data)
-    print("DB exists: ",os.path.exists(db_path))
-    
-    cities=set()
-    for row in data:
-        try:
-            id,src,dst,time,dist,toll=row
-            src=str(src).strip().title()
-            dst=str(dst).strip().title()
-            if not src or not dst or src=='source' or dst=='destination':
-               continue
-            cities.add(src)
-            cities.add(dst)
-        except Exception as e:
-            print("Skipping error due to error:", row,e)
-            continue
-        
-        
-    
-    cities=sorted(list(cities))
-    city_index={city:i for i ,city in enumerate(cities)}
+    Args:
+        preference (str): "distance" (km), "time" (hrs), or "toll" (₹)
+        cities (list): Optional list of city names. If None, uses every stored city.
 
-    n=len(cities)
-    INF=10**9
-    matrix=[[INF]*n for i in range(n)]
-    
-    
-    for j in range(n):
-        matrix[j][j]=0
-    for row in data:
-        try:
-            id,src,dst,time, dist,toll=row
-            src=str(src).strip().title()
-            dst=str(dst).strip().title()
-            if src not in city_index or dst not in city_index:
-               continue
-            i=city_index[str(src)]
-            k=city_index[str(dst)]
-            if preference=='time':
-                matrix[i][k]=time
-            elif preference=='distance':
-                matrix[i][k]=dist
-            elif preference=='toll':
-                matrix[i][k]=toll
-        except Exception as e:
-            print("Error while building matrix from row:", row,e)
-            continue
-    conn.close()
-    return matrix,cities'''
+    Returns:
+        tuple: (np.ndarray: Cost matrix with inf for missing edges, list: cities used)
+    """
+    valid_preferences = ['distance', 'time', 'toll']
+    if preference not in valid_preferences:
+        raise ValueError(f"Invalid preference. Must be one of: {valid_preferences}")
 
+    tensor, cities = load_edge_tensor(cities)
+    return tensor[valid_preferences.index(preference)], cities
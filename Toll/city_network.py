@@ -13,6 +13,32 @@ CITIES = [
     "Surat", "Kanpur", "Lucknow", "Nagpur", "Indore", "Bhopal", "Coimbatore", "Kochi"
 ]
 
+# Region of each network city, used by hierarchical routing to split the
+# network into regional all-pairs tables joined by border cities
+CITY_REGIONS = {
+    "Delhi": "North", "Jaipur": "North", "Agra": "North", "Amritsar": "North",
+    "Manali": "North", "Shimla": "North", "Rishikesh": "North", "Lucknow": "North",
+    "Kanpur": "North", "Varanasi": "North",
+    "Kolkata": "East",
+    "Mumbai": "West", "Pune": "West", "Ahmedabad": "West", "Surat": "West", "Goa": "West",
+    "Nagpur": "Central", "Indore": "Central", "Bhopal": "Central",
+    "Bangalore": "South", "Chennai": "South", "Hyderabad": "South", "Coimbatore": "South",
+    "Kochi": "South"
+}
+
+# (lat, lon) of each network city, so off-network places can be snapped to
+# their nearest hubs without geocoding the hubs (see hub_snapping.py)
+CITY_COORDINATES = {
+    "Mumbai": (19.0760, 72.8777), "Delhi": (28.6139, 77.2090), "Bangalore": (12.9716, 77.5946),
+    "Chennai": (13.0827, 80.2707), "Kolkata": (22.5726, 88.3639), "Hyderabad": (17.3850, 78.4867),
+    "Pune": (18.5204, 73.8567), "Ahmedabad": (23.0225, 72.5714), "Goa": (15.4909, 73.8278),
+    "Jaipur": (26.9124, 75.7873), "Agra": (27.1767, 78.0081), "Varanasi": (25.3176, 82.9739),
+    "Amritsar": (31.6340, 74.8723), "Manali": (32.2432, 77.1892), "Shimla": (31.1048, 77.1734),
+    "Rishikesh": (30.0869, 78.2676), "Surat": (21.1702, 72.8311), "Kanpur": (26.4499, 80.3319),
+    "Lucknow": (26.8467, 80.9462), "Nagpur": (21.1458, 79.0882), "Indore": (22.7196, 75.8577),
+    "Bhopal": (23.2599, 77.4126), "Coimbatore": (11.0168, 76.9558), "Kochi": (9.9312, 76.2673)
+}
+
 # Step 2 & 3: Precomputed matrices (would be built from Google Maps data)
 # These represent the Floyd-Warshall results after processing
 
@@ -97,10 +123,14 @@ def get_network_cities():
 
 def get_network_coverage():
     """Get statistics about the precomputed network"""
+    from Toll.refresh_scheduler import freshness
+    freshness = freshness()
     total_routes = len(CITIES) * (len(CITIES) - 1)  # All pairs except same city
     return {
         'total_cities': len(CITIES),
         'total_precomputed_routes': total_routes,
-        'network_regions': ['North', 'South', 'East', 'West', 'Central'],
-        'last_updated': 'Static data - needs API refresh'
+        'network_regions': sorted(set(CITY_REGIONS.values())),
+        'last_updated': freshness['newest_edge'] or 'Static data - needs API refresh',
+        'oldest_edge': freshness['oldest_edge'],
+        'stored_edges': freshness['stored_edges']
     }
\ No newline at end of file
@@ -0,0 +1,440 @@
+# Contraction hierarchies for road-level graphs
+# Dense Floyd-Warshall only scales to a few dozen cities. A contraction
+# hierarchy is preprocessed once: nodes are ordered by importance and
+# contracted one by one, adding shortcut edges that preserve shortest paths.
+# A query is then a bidirectional Dijkstra that only climbs "upward" in the
+# order, settling a few hundred nodes even on country-sized graphs. Queries
+# run in scipy's compiled Dijkstra over the CSR arrays when scipy is installed
+# and fall back to an interpreter search otherwise; preprocessing is a
+# one-off offline step and stays in Python.
+#
+# Graphs are passed in CSR form (indptr, indices, weights) with integer node ids,
+# the same layout the offline road-network ingest writes.
+
+import heapq
+import importlib.util
+import logging
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+INF = float('inf')
+
+# Witness searches give up after settling this many nodes; a missed witness
+# only costs an extra (harmless) shortcut
+WITNESS_SETTLE_LIMIT = 500
+PRIORITY_SETTLE_LIMIT = 50
+
+# Queries use scipy's Dijkstra between these sizes: below, its call overhead
+# beats the search; above, its O(n) per-query arrays do. Outside the range,
+# or without scipy, the interpreter search runs
+SCIPY_MIN_NODES = 400
+SCIPY_MAX_NODES = 500_000
+
+
+def edges_to_csr(n, sources, targets, weights):
+    """
+    Build CSR arrays from parallel edge lists, keeping the cheapest parallel edge
+
+    Returns:
+        tuple: (indptr, indices, weights) numpy arrays
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    weights = np.asarray(weights, dtype=np.float64)
+
+    # Sort by (source, target, weight) and drop parallel edges after the first
+    order = np.lexsort((weights, targets, sources))
+    sources, targets, weights = sources[order], targets[order], weights[order]
+    keep = np.ones(len(sources), dtype=bool)
+    keep[1:] = (sources[1:] != sources[:-1]) | (targets[1:] != targets[:-1])
+    sources, targets, weights = sources[keep], targets[keep], weights[keep]
+
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.add.at(indptr, sources + 1, 1)
+    return np.cumsum(indptr), targets.astype(np.int32), weights.astype(np.float32)
+
+
+class ContractionHierarchy:
+    """
+    Preprocessed hierarchy: node ranks plus upward forward/backward graphs
+
+    fwd holds edges u -> v with rank[u] < rank[v], stored in row u.
+    bwd holds edges v -> u with rank[v] > rank[u], stored reversed in row u,
+    so the backward search from a target also only climbs upward.
+    middle is the contracted node a shortcut bypasses, -1 for original edges.
+    """
+
+    def __init__(self, rank, fwd, bwd):
+        self.rank = rank
+        self.fwd_indptr, self.fwd_indices, self.fwd_weights, self.fwd_middle = fwd
+        self.bwd_indptr, self.bwd_indices, self.bwd_weights, self.bwd_middle = bwd
+        self._adjacency = None
+        self._matrices = None
+        self._middles = None
+
+    @property
+    def node_count(self):
+        return len(self.rank)
+
+    # ------------------------------------------------------------------
+    # Preprocessing
+    # ------------------------------------------------------------------
+
+    @classmethod
+    def build(cls, indptr, indices, weights):
+        """
+        Contract a directed CSR graph into a hierarchy
+
+        Args:
+            indptr, indices, weights: CSR adjacency of the road graph
+
+        Returns:
+            ContractionHierarchy
+        """
+        started = time.perf_counter()
+        n = len(indptr) - 1
+        out_adj = [dict() for _ in range(n)]
+        in_adj = [dict() for _ in range(n)]
+        middle = {}
+
+        for u in range(n):
+            for k in range(indptr[u], indptr[u + 1]):
+                v, w = int(indices[k]), float(weights[k])
+                if u != v and w < out_adj[u].get(v, INF):
+                    out_adj[u][v] = w
+                    in_adj[v][u] = w
+
+        contracted = [False] * n
+        deleted_neighbours = [0] * n
+        rank = np.full(n, -1, dtype=np.int32)
+
+        def priority(v):
+            shortcuts = _find_shortcuts(v, out_adj, in_adj, PRIORITY_SETTLE_LIMIT)
+            return len(shortcuts) - len(in_adj[v]) - len(out_adj[v]) + deleted_neighbours[v]
+
+        # fwd_rows[u]: edges u -> x with rank[u] < rank[x]
+        # bwd_rows[u]: edges x -> u with rank[x] > rank[u], stored reversed
+        fwd_rows = [[] for _ in range(n)]
+        bwd_rows = [[] for _ in range(n)]
+
+        heap = [(priority(v), v) for v in range(n)]
+        heapq.heapify(heap)
+        shortcut_count = 0
+        next_rank = 0
+
+        while heap:
+            _, v = heapq.heappop(heap)
+            if contracted[v]:
+                continue
+
+            # Lazy update: re-evaluate, contract only if still the cheapest
+            current = priority(v)
+            if heap and current > heap[0][0]:
+                heapq.heappush(heap, (current, v))
+                continue
+
+            for u, x, cost in _find_shortcuts(v, out_adj, in_adj, WITNESS_SETTLE_LIMIT):
+                if cost < out_adj[u].get(x, INF):
+                    out_adj[u][x] = cost
+                    in_adj[x][u] = cost
+                    middle[(u, x)] = v
+                    shortcut_count += 1
+
+            # Every remaining neighbour ranks higher than v, so v's edges are
+            # final: move them into the upward graphs and out of the working set
+            for x, w in out_adj[v].items():
+                fwd_rows[v].append((x, w, middle.pop((v, x), -1)))
+                del in_adj[x][v]
+            for u, w in in_adj[v].items():
+                bwd_rows[v].append((u, w, middle.pop((u, v), -1)))
+                del out_adj[u][v]
+            for neighbour in set(in_adj[v]) | set(out_adj[v]):
+                deleted_neighbours[neighbour] += 1
+            out_adj[v] = {}
+            in_adj[v] = {}
+
+            contracted[v] = True
+            rank[v] = next_rank
+            next_rank += 1
+
+        logger.info(f"Contracted {n} nodes with {shortcut_count} shortcuts "
+                    f"in {time.perf_counter() - started:.1f}s")
+        return cls(rank, _rows_to_csr(fwd_rows), _rows_to_csr(bwd_rows))
+
+    # ------------------------------------------------------------------
+    # Persistence
+    # ------------------------------------------------------------------
+
+    def save(self, path):
+        """Write the hierarchy as compact arrays in one .npz file"""
+        np.savez(
+            path,
+            rank=self.rank,
+            fwd_indptr=self.fwd_indptr, fwd_indices=self.fwd_indices,
+            fwd_weights=self.fwd_weights, fwd_middle=self.fwd_middle,
+            bwd_indptr=self.bwd_indptr, bwd_indices=self.bwd_indices,
+            bwd_weights=self.bwd_weights, bwd_middle=self.bwd_middle
+        )
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        return cls(
+            data['rank'],
+            (data['fwd_indptr'], data['fwd_indices'], data['fwd_weights'], data['fwd_middle']),
+            (data['bwd_indptr'], data['bwd_indices'], data['bwd_weights'], data['bwd_middle'])
+        )
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    def query(self, source, target, lower_bound=None):
+        """
+        Shortest path between two node ids
+
+        Args:
+            source, target (int): Node ids
+            lower_bound (callable): Optional admissible lower_bound(a, b) on the
+                a -> b cost, e.g. cost_model.node_lower_bound(); prunes the
+                interpreter search, which is the one country-sized graphs use
+
+        Returns:
+            tuple: (cost, [node ids]) or (inf, []) if unreachable
+        """
+        if source == target:
+            return 0.0, [source]
+        if SCIPY_MIN_NODES <= self.node_count <= SCIPY_MAX_NODES and _scipy_available():
+            return self._query_scipy(source, target)
+        return self._query_python(source, target, lower_bound)
+
+    def _query_scipy(self, source, target):
+        """
+        Both upward searches run in scipy's compiled Dijkstra
+
+        The upward graphs are acyclic and small per source, but scipy still
+        allocates node-sized result arrays, hence the SCIPY_*_NODES range.
+        """
+        from scipy.sparse.csgraph import dijkstra
+
+        forward, backward = self._upward_matrices()
+        dist_f, pred_f = dijkstra(forward, indices=source, return_predecessors=True)
+        dist_b, pred_b = dijkstra(backward, indices=target, return_predecessors=True)
+        total = dist_f + dist_b
+        meet = int(np.argmin(total))
+        if not np.isfinite(total[meet]):
+            return INF, []
+
+        # The backward tree is rooted at the target, so its predecessors
+        # already point from the meeting node towards the target
+        to_source = _tree_path(pred_f, meet)
+        to_target = _tree_path(pred_b, meet)
+        path = [to_source[-1]]
+        for u, v in zip(to_source[::-1], to_source[-2::-1]):
+            path.extend(self._expand(u, v))
+        for u, v in zip(to_target, to_target[1:]):
+            path.extend(self._expand(u, v))
+        return float(total[meet]), path
+
+    def _query_python(self, source, target, lower_bound=None):
+        """Bidirectional upward Dijkstra in the interpreter (no scipy)"""
+        dist = ({source: 0.0}, {target: 0.0})
+        pred = ({source: -1}, {target: -1})
+        heaps = ([(0.0, source)], [(0.0, target)])
+        graphs = self._upward_rows()
+        best = INF
+        meet = -1
+
+        while heaps[0] or heaps[1]:
+            top_f = heaps[0][0][0] if heaps[0] else INF
+            top_b = heaps[1][0][0] if heaps[1] else INF
+            if min(top_f, top_b) >= best:
+                break
+
+            side = 0 if top_f <= top_b else 1
+            d, u = heapq.heappop(heaps[side])
+            if d > dist[side][u]:
+                continue
+
+            other = dist[1 - side]
+            if u in other and d + other[u] < best:
+                best = d + other[u]
+                meet = u
+
+            # No path through u can beat best: its edges need no relaxing
+            if lower_bound is not None and best < INF:
+                rest = lower_bound(u, target) if side == 0 else lower_bound(source, u)
+                if d + float(rest[0]) >= best:
+                    continue
+
+            for v, w in graphs[side][u]:
+                nd = d + w
+                if nd < dist[side].get(v, INF):
+                    dist[side][v] = nd
+                    pred[side][v] = u
+                    heapq.heappush(heaps[side], (nd, v))
+                    if v in other and nd + other[v] < best:
+                        best = nd + other[v]
+                        meet = v
+
+        if meet < 0:
+            return INF, []
+
+        forward_pred, backward_pred = pred
+        to_source, node = [meet], meet
+        while forward_pred[node] >= 0:
+            node = forward_pred[node]
+            to_source.append(node)
+        to_target, node = [meet], meet
+        while backward_pred[node] >= 0:
+            node = backward_pred[node]
+            to_target.append(node)
+
+        path = [to_source[-1]]
+        for u, v in zip(to_source[::-1], to_source[-2::-1]):
+            path.extend(self._expand(u, v))
+        for u, v in zip(to_target, to_target[1:]):
+            path.extend(self._expand(u, v))
+        return best, path
+
+    def _upward_matrices(self):
+        """The upward graphs as scipy CSR matrices, built once"""
+        if self._matrices is None:
+            from scipy.sparse import csr_matrix
+            n = self.node_count
+            # Explicit zero weights stay edges as long as nothing prunes them
+            self._matrices = tuple(
+                csr_matrix((weights.astype(np.float64), indices, indptr), shape=(n, n))
+                for indptr, indices, weights in (
+                    (self.fwd_indptr, self.fwd_indices, self.fwd_weights),
+                    (self.bwd_indptr, self.bwd_indices, self.bwd_weights)
+                )
+            )
+        return self._matrices
+
+    def _upward_rows(self):
+        """
+        Per-node (target, weight) lists for both upward graphs, built once
+
+        Slicing numpy rows inside the interpreter search loop cost more than
+        the search itself.
+        """
+        if self._adjacency is None:
+            self._adjacency = tuple(
+                _csr_rows(indptr, indices, weights)
+                for indptr, indices, weights in (
+                    (self.fwd_indptr, self.fwd_indices, self.fwd_weights),
+                    (self.bwd_indptr, self.bwd_indices, self.bwd_weights)
+                )
+            )
+        return self._adjacency
+
+    def distance(self, source, target):
+        return self.query(source, target)[0]
+
+    def _expand(self, u, v):
+        """Original nodes after u on hierarchy edge u -> v, shortcuts unpacked"""
+        middles = self._shortcut_middles()
+        nodes = []
+        stack = [(u, v)]
+        while stack:
+            a, b = stack.pop()
+            m = middles.get((a, b), -1)
+            if m < 0:
+                nodes.append(b)
+            else:
+                # Push the second half first so the first half unpacks first
+                stack.append((m, b))
+                stack.append((a, m))
+        return nodes
+
+    def _shortcut_middles(self):
+        """{(u, v): middle} for every shortcut edge, in original edge direction"""
+        if self._middles is None:
+            middles = {}
+            fwd_rows = np.repeat(np.arange(self.node_count), np.diff(self.fwd_indptr))
+            bwd_rows = np.repeat(np.arange(self.node_count), np.diff(self.bwd_indptr))
+            fwd = np.flatnonzero(self.fwd_middle >= 0)
+            bwd = np.flatnonzero(self.bwd_middle >= 0)
+            middles.update(zip(zip(fwd_rows[fwd].tolist(), self.fwd_indices[fwd].tolist()),
+                               self.fwd_middle[fwd].tolist()))
+            # bwd row u holds edge x -> u stored reversed
+            middles.update(zip(zip(self.bwd_indices[bwd].tolist(), bwd_rows[bwd].tolist()),
+                               self.bwd_middle[bwd].tolist()))
+            self._middles = middles
+        return self._middles
+
+
+def _find_shortcuts(v, out_adj, in_adj, settle_limit):
+    """Shortcuts (u, x, cost) needed if v is contracted now"""
+    ins = list(in_adj[v].items())
+    outs = list(out_adj[v].items())
+    if not ins or not outs:
+        return []
+
+    max_out = max(w for _, w in outs)
+    targets = {x for x, _ in outs}
+    shortcuts = []
+    for u, w_in in ins:
+        witness = _witness_search(u, v, w_in + max_out, targets, out_adj, settle_limit)
+        for x, w_out in outs:
+            if x != u and witness.get(x, INF) > w_in + w_out:
+                shortcuts.append((u, x, w_in + w_out))
+    return shortcuts
+
+
+def _witness_search(source, skip, max_cost, targets, out_adj, settle_limit):
+    """Bounded Dijkstra from source over uncontracted nodes, avoiding `skip`"""
+    dist = {source: 0.0}
+    heap = [(0.0, source)]
+    settled = 0
+    remaining = len(targets)
+    while heap and remaining:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        if settled >= settle_limit:
+            break
+        settled += 1
+        if u in targets:
+            remaining -= 1
+        for v, w in out_adj[u].items():
+            if v == skip:
+                continue
+            nd = d + w
+            if nd <= max_cost and nd < dist.get(v, INF):
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def _scipy_available():
+    return importlib.util.find_spec('scipy') is not None
+
+
+def _tree_path(predecessors, node):
+    """Nodes from `node` back to the root of a scipy predecessor tree"""
+    path = [node]
+    while predecessors[node] >= 0:
+        node = int(predecessors[node])
+        path.append(node)
+    return path
+
+
+def _csr_rows(indptr, indices, weights):
+    edges = list(zip(indices.tolist(), weights.tolist()))
+    bounds = indptr.tolist()
+    return [edges[lo:hi] for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+
+def _rows_to_csr(rows):
+    indptr = np.zeros(len(rows) + 1, dtype=np.int64)
+    indptr[1:] = np.cumsum([len(row) for row in rows])
+    flat = [edge for row in rows for edge in row]
+    indices = np.array([e[0] for e in flat], dtype=np.int32)
+    weights = np.array([e[1] for e in flat], dtype=np.float32)
+    middles = np.array([e[2] for e in flat], dtype=np.int32)
+    return indptr, indices, weights, middles
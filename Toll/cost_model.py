@@ -0,0 +1,297 @@
+# Offline cost model: instant distance / time / toll estimates for any pair
+# A linear model on the great-circle distance d between two geocoded places,
+# fitted with one vectorized least-squares solve per metric:
+#
+#     metric ~ intercept + d * circuity[region] + d * class[distance band]
+#
+# circuity[region] - how winding the roads are (or how slow, or how tolled)
+#                    in the regions of the two ends, averaged; places outside
+#                    the network take the region of their nearest hub
+# class[band]      - highway class of the trip, by distance band: short trips
+#                    run on state roads, long ones mostly on national highways
+#                    and expressways (faster per km, tolled per km); the
+#                    shortest band is the baseline
+#
+# Training rows come from what is already stored, no API calls: the static
+# 8-city matrices, every route_data edge between places with known
+# coordinates, and learned travel times (travel_stat, distance and time only).
+# Regions or bands with little data are pulled towards the overall per-km
+# rate by ridge rows, so a region without observations still gets a sane
+# estimate. Data rows are weighted by 1/target (relative error) and the ridge
+# rows by 1/overall rate, so the pull means the same for km, hours and INR.
+# The model is refitted when the edge store changes.
+#
+# A prediction is a few dozen floating point operations; routes.py uses it as
+# a labelled estimate off the static network when live routing fails or the
+# request may not make provider calls (rate limited). Places are then located
+# from the coordinate table and the geocoded_place cache only - an estimate
+# never triggers a geocoding call. Predictions are floored at physical
+# bounds: road distance is never below the great-circle distance, driving
+# never faster than MAX_SPEED_KMH on it, and a toll never negative.
+# lower_bounds() exposes the same bounds as admissible search heuristics;
+# node_lower_bound() wraps them for ContractionHierarchy.query and
+# HierarchicalNetwork.query, which use them to prune.
+#
+# Configuration (environment, read at startup):
+#   COST_MODEL_MAX_SPEED_KMH  speed bound for the time lower bound (default 120)
+#   COST_MODEL_PRIOR_WEIGHT   strength of the pull towards the overall rate (default 2)
+#   COST_MODEL_REFIT_S        refit at most this often while the data changes (default 3600)
+#
+# Usage: python -m Toll.cost_model   (fit, report held-out error and an example)
+
+from collections import namedtuple
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+
+from Toll.hub_snapping import geocode, haversine_km
+from Toll import edge_store
+from Toll.city_network import CITY_COORDINATES, CITY_REGIONS
+from Toll.edge_store import METRICS, _app_context
+from Toll.metrics import span
+
+logger = logging.getLogger(__name__)
+
+MAX_SPEED_KMH = float(os.getenv('COST_MODEL_MAX_SPEED_KMH', 120))
+PRIOR_WEIGHT = float(os.getenv('COST_MODEL_PRIOR_WEIGHT', 2))
+REFIT_S = float(os.getenv('COST_MODEL_REFIT_S', 3600))
+
+# Upper edges (great-circle km) of the highway-class bands; the last is open
+BAND_EDGES_KM = (100, 300, 800)
+REGIONS = sorted(set(CITY_REGIONS.values()))
+
+_HUB_NAMES = [city for city in CITY_COORDINATES if city in CITY_REGIONS]
+_HUB_COORDS = np.array([CITY_COORDINATES[city] for city in _HUB_NAMES])
+_HUB_REGION = np.array([REGIONS.index(CITY_REGIONS[city]) for city in _HUB_NAMES])
+
+Training = namedtuple('Training', ['lat1', 'lon1', 'lat2', 'lon2', 'targets'])
+
+
+def _region_index(lat, lon):
+    """Region of each point: that of its nearest network city"""
+    lat, lon = np.atleast_1d(lat), np.atleast_1d(lon)
+    distances = haversine_km(lat[:, None], lon[:, None], _HUB_COORDS[None, :, 0], _HUB_COORDS[None, :, 1])
+    return _HUB_REGION[np.argmin(distances, axis=1)]
+
+
+def features(lat1, lon1, lat2, lon2):
+    """
+    Design matrix for pairs of points
+
+    Returns:
+        tuple: (X of shape (pairs, features), great-circle km of shape (pairs,))
+    """
+    lat1, lon1, lat2, lon2 = (np.atleast_1d(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    d = haversine_km(lat1, lon1, lat2, lon2)
+    regions = np.zeros((len(d), len(REGIONS)))
+    rows = np.arange(len(d))
+    regions[rows, _region_index(lat1, lon1)] += 0.5
+    regions[rows, _region_index(lat2, lon2)] += 0.5
+    bands = np.searchsorted(BAND_EDGES_KM, d)[:, None] == np.arange(1, len(BAND_EDGES_KM) + 1)[None, :]
+    X = np.hstack([np.ones((len(d), 1)), d[:, None] * regions, d[:, None] * bands])
+    return X, d
+
+
+def training_data():
+    """
+    Observed pairs with coordinates for both ends
+
+    Returns:
+        Training: Coordinates and targets of shape (rows, 3) ordered as
+                  METRICS, NaN where a source has no value
+    """
+    from Toll import static_data
+    from Toll.models import GeocodedPlace, RouteData, TravelStat
+    from Toll.travel_learning import MIN_SAMPLES
+
+    rows = []
+    cities = static_data.CITIES
+    for i, source in enumerate(cities):
+        for j, destination in enumerate(cities):
+            if i != j:
+                rows.append((source, destination, static_data.DISTANCE_MATRIX[i][j],
+                             static_data.TIME_MATRIX[i][j], static_data.TOLL_MATRIX[i][j]))
+
+    with _app_context():
+        coords = dict(CITY_COORDINATES)
+        coords.update({p.name: (p.lat, p.lon) for p in GeocodedPlace.query.all()})
+        rows.extend((r.source, r.destination, r.distance, r.time, r.toll) for r in RouteData.query.all())
+        rows.extend((s.source, s.destination, s.distance_km, s.hours_mean, np.nan)
+                    for s in TravelStat.query.filter(TravelStat.samples >= MIN_SAMPLES).all())
+
+    rows = [r for r in rows if r[0] in coords and r[1] in coords and r[0] != r[1]]
+    points = np.array([coords[r[0]] + coords[r[1]] for r in rows], dtype=float).reshape(-1, 4)
+    targets = np.array([r[2:] for r in rows], dtype=float).reshape(-1, len(METRICS))
+    return Training(points[:, 0], points[:, 1], points[:, 2], points[:, 3], targets)
+
+
+class CostModel:
+    """Per-metric linear coefficients over features()"""
+
+    def __init__(self, coef, relative_error, rows):
+        self.coef = coef  # (features, 3)
+        self.relative_error = relative_error  # RMS relative training error per metric
+        self.rows = rows
+
+    @classmethod
+    def fit(cls, data):
+        """One regularized least-squares solve per metric"""
+        X, d = features(data.lat1, data.lon1, data.lat2, data.lon2)
+        n_features = X.shape[1]
+        coef = np.zeros((n_features, len(METRICS)))
+        regions = slice(1, 1 + len(REGIONS))
+
+        # Ridge rows: region rates towards the overall rate, band adjustments towards 0
+        # (in metric units per km; scaled per metric below)
+        prior_X = np.zeros((n_features - 1, n_features))
+        prior_X[:, 1:] = np.eye(n_features - 1) * PRIOR_WEIGHT
+        for k in range(len(METRICS)):
+            known = np.isfinite(data.targets[:, k])
+            y = data.targets[known, k]
+            if not known.any():
+                continue
+            # Rows scaled by 1/target: errors are minimized relative to trip size,
+            # so long trips do not drown out short ones
+            w = 1 / np.maximum(y, 1e-3)[:, None]
+            overall = np.linalg.lstsq(np.column_stack([np.ones(known.sum()), d[known]]) * w, y * w[:, 0],
+                                      rcond=None)[0][1]
+            prior_y = np.zeros(n_features - 1)
+            prior_y[regions.start - 1:regions.stop - 1] = PRIOR_WEIGHT * overall
+            # The data residuals are relative; make the ridge residuals relative to
+            # the overall rate too, or the pull would depend on the metric's unit
+            prior_w = 1 / max(abs(overall), 1e-6)
+            coef[:, k] = np.linalg.lstsq(np.vstack([X[known] * w, prior_X * prior_w]),
+                                         np.concatenate([y * w[:, 0], prior_y * prior_w]), rcond=None)[0]
+
+        model = cls(coef, np.zeros(len(METRICS)), len(d))
+        predicted = model.predict(data.lat1, data.lon1, data.lat2, data.lon2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            relative = (predicted - data.targets) / data.targets
+        relative[~np.isfinite(relative)] = np.nan
+        model.relative_error = np.sqrt(np.nanmean(relative ** 2, axis=0)) if len(d) else model.relative_error
+        return model
+
+    def predict(self, lat1, lon1, lat2, lon2):
+        """
+        Estimated (distance km, hours, toll INR) for pairs of points
+
+        Returns:
+            np.ndarray: Shape (pairs, 3) ordered as METRICS, never below
+                        lower_bounds()
+        """
+        X, d = features(lat1, lon1, lat2, lon2)
+        return np.maximum(X @ self.coef, _bounds(d))
+
+
+def _bounds(d):
+    """Smallest possible distance / time / toll over great-circle km d"""
+    return np.column_stack([d, d / MAX_SPEED_KMH, np.zeros_like(d)])
+
+
+def lower_bounds(lat1, lon1, lat2, lon2):
+    """
+    Admissible (never overestimating) distance km / hours / toll INR for pairs
+    of points, for A*-style pruning
+
+    Returns:
+        np.ndarray: Shape (pairs, 3) ordered as METRICS
+    """
+    return _bounds(np.atleast_1d(haversine_km(lat1, lon1, lat2, lon2)))
+
+
+def node_lower_bound(lat, lon, metric, scale=1.0):
+    """
+    lower_bounds() over node indices, in the form the searches take
+
+    Args:
+        lat, lon (array-like): Coordinates of every node of the graph
+        metric (str): 'distance', 'time' or 'toll' - what the edge weights measure
+        scale (float): Weight units per km / hour / INR (1000 for metres,
+                       3600 for seconds)
+
+    Returns:
+        callable: lower_bound(a, b) -> np.ndarray of admissible a -> b costs;
+                  a and b are node indices (arrays broadcast)
+    """
+    lat, lon = np.asarray(lat, dtype=float), np.asarray(lon, dtype=float)
+    column = METRICS.index(metric)
+
+    def lower_bound(a, b):
+        return lower_bounds(lat[a], lon[a], lat[b], lon[b])[:, column] * scale
+    return lower_bound
+
+
+_model = None
+_model_key = None
+_fitted_at = 0.0
+
+
+def get_model():
+    """The model for the current data, refitted when the edge store changed"""
+    global _model, _model_key, _fitted_at
+    key = edge_store.edge_version
+    if _model is None or (key != _model_key and time.monotonic() - _fitted_at >= REFIT_S):
+        with span('cost_model.fit'):
+            _model = CostModel.fit(training_data())
+        _model_key, _fitted_at = key, time.monotonic()
+        logger.info(f"Cost model fitted on {_model.rows} pairs")
+    return _model
+
+
+def estimate_route(source, destination, live=False):
+    """
+    Model estimate between two places
+
+    Args:
+        source (str): Starting place
+        destination (str): Destination place
+        live (bool): Geocode places missing from the table and cache; off by
+                     default, since estimates stand in for live calls
+
+    Returns:
+        dict or None: distance_km, duration_hours, toll_cost and the model's
+                      relative error per metric; None if a place cannot be located
+    """
+    source_coords, destination_coords = geocode(source, live), geocode(destination, live)
+    if source_coords is None or destination_coords is None:
+        return None
+    model = get_model()
+    distance, hours, toll = model.predict(*source_coords, *destination_coords)[0]
+    return {
+        'route': [source, destination],
+        'distance_km': float(distance),
+        'duration_hours': float(hours),
+        'toll_cost': float(toll),
+        'relative_error': dict(zip(METRICS, (float(e) for e in model.relative_error))),
+        'data_source': 'Cost model estimate'
+    }
+
+
+def main(argv=None):
+    data = training_data()
+    print(f"📋 {len(data.targets)} training pairs")
+    rng = np.random.default_rng(0)
+    held_out = rng.random(len(data.targets)) < 0.2
+    train = Training(*(v[~held_out] for v in data))
+    model = CostModel.fit(train)
+    predicted = model.predict(data.lat1[held_out], data.lon1[held_out], data.lat2[held_out], data.lon2[held_out])
+    actual = data.targets[held_out]
+    with np.errstate(invalid='ignore'):
+        errors = np.nanmean(np.abs(predicted - actual) / actual, axis=0)
+    for metric, error in zip(METRICS, errors):
+        print(f"✓ {metric:8s} held-out mean error {error:.1%}")
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        model.predict(*CITY_COORDINATES['Pune'], *CITY_COORDINATES['Nagpur'])
+    print(f"⏱️  {(time.perf_counter() - started) * 1000:.1f} µs per prediction")
+    distance, hours, toll = CostModel.fit(data).predict(*CITY_COORDINATES['Pune'], *CITY_COORDINATES['Nagpur'])[0]
+    print(f"✅ Pune → Nagpur: {distance:.0f} km, {hours:.1f} h, ₹{toll:.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,10 +4,11 @@
 from Toll import gmaps
 import logging
 import re
+from Toll.metrics import span, record_provider_call, provider_error_status
 
 logger = logging.getLogger(__name__)
 
-def get_direct_route(source, destination, preference='distance'):
+def get_direct_route(source, destination, preference='distance', client=None):
     """
     Get direct route using single Google Directions API call
     
@@ -15,26 +16,34 @@ def get_direct_route(source, destination, preference='distance'):
         source (str): Starting city
         destination (str): Destination city  
         preference (str): 'distance', 'time', or 'toll'
+        client: googlemaps.Client to use, defaults to the app-wide client
     
     Returns:
         dict: Complete route data from single API call
     """
-    if not gmaps:
+    client = client if client is not None else gmaps
+    if not client:
         logger.error("Google Maps client not initialized")
         return None
     
     try:
         # Always request all alternatives without avoiding tolls;
         # for 'toll' preference we compare estimated costs across routes.
-        directions = gmaps.directions(
-            origin=f"{source}, India",
-            destination=f"{destination}, India",
-            mode="driving",
-            avoid=None,
-            departure_time='now',
-            traffic_model='best_guess',
-            alternatives=True
-        )
+        with span('provider.directions'):
+            try:
+                directions = client.directions(
+                    origin=f"{source}, India",
+                    destination=f"{destination}, India",
+                    mode="driving",
+                    avoid=None,
+                    departure_time='now',
+                    traffic_model='best_guess',
+                    alternatives=True
+                )
+            except Exception as e:
+                record_provider_call('directions', provider_error_status(e))
+                raise
+        record_provider_call('directions', 'ok')
 
         if not directions:
             return None
@@ -85,6 +94,10 @@ def get_direct_route(source, destination, preference='distance'):
         
         # Calculate realistic toll based on actual route
         toll_cost = calculate_route_toll(distance_km, highways, best_route.get('summary', ''))
+
+        # Keep the measurement: it improves the precomputed matrices for free
+        from Toll.travel_learning import travel_log
+        travel_log.record(source, destination, distance_km, duration_hours)
         
         return {
             'route': [source, destination],
@@ -93,8 +106,11 @@ def get_direct_route(source, destination, preference='distance'):
             'toll_cost': toll_cost,
             'highways': highways,
             'route_summary': best_route.get('summary', ''),
+            'overview_polyline': best_route.get('overview_polyline', {}).get('points', ''),
             'is_direct': True,
-            'api_calls_used': 1,  # vs 28+ with Floyd-Warshall
+            # This function makes exactly one call (vs 28+ with Floyd-Warshall);
+            # HedgedRouter overwrites it with the calls a request really made
+            'api_calls_used': 1,
             'data_source': 'Google Directions API'
         }
         
@@ -0,0 +1,245 @@
+# RouteData as the canonical edge store
+# Every city-to-city measurement the matrix builders fetch is upserted into
+# route_data (unique on source, destination), names normalized on write, so a
+# full (3, n, n) cost tensor can be rebuilt with one indexed query and a few
+# vectorized NumPy operations instead of calling Google again.
+#
+# Existing databases are upgraded (new tables, the route_data changes below)
+# by an explicit step; the app only creates the schema in an empty database
+# and otherwise just warns at startup:
+#   python -m Toll.edge_store migrate
+
+from contextlib import nullcontext
+from datetime import datetime
+import logging
+import sys
+
+import numpy as np
+from flask import has_app_context
+from sqlalchemy import inspect, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+
+from Toll import create_app, db
+from Toll.metrics import span
+from Toll.models import RouteData
+
+logger = logging.getLogger(__name__)
+
+# Metric axis of the tensor; matches weighted_routing.METRICS
+METRICS = ('distance', 'time', 'toll')
+BATCH_SIZE = 500
+
+# Bumped on every write so in-process caches built from the edges can tell
+# they are stale
+edge_version = 0
+
+_UPSERT_DIALECTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def normalize_city(name):
+    return str(name).strip().title()
+
+
+def _app_context():
+    """The builders run as scripts as well as inside requests"""
+    return nullcontext() if has_app_context() else create_app().app_context()
+
+
+def upsert_edges(edges, batch_size=BATCH_SIZE):
+    """
+    Insert or update edges in route_data
+
+    Args:
+        edges (iterable): (source, destination, distance_km, time_hours, toll_inr) tuples,
+                          optionally with a sixth fetched_at (defaults to now)
+        batch_size (int): Rows per INSERT ... ON CONFLICT statement
+
+    Returns:
+        int: Number of edges written
+    """
+    now = datetime.utcnow()
+    rows = [{
+        'source': normalize_city(src),
+        'destination': normalize_city(dst),
+        'distance': float(distance),
+        'time': float(hours),
+        'toll': float(toll),
+        'fetched_at': fetched_at[0] if fetched_at else now
+    } for src, dst, distance, hours, toll, *fetched_at in edges]
+    if not rows:
+        return 0
+
+    with _app_context(), span('db.upsert_edges'):
+        insert = _UPSERT_DIALECTS.get(db.engine.dialect.name)
+        table = RouteData.__table__
+        if insert is None:
+            # No native upsert: fall back to the ORM's per-row merge
+            for row in rows:
+                existing = RouteData.query.filter_by(source=row['source'], destination=row['destination']).first()
+                db.session.add(RouteData(**row) if existing is None else _update(existing, row))
+        else:
+            stmt = insert(table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['source', 'destination'],
+                set_={column: stmt.excluded[column] for column in ('distance', 'time', 'toll', 'fetched_at')}
+            )
+            for start in range(0, len(rows), batch_size):
+                db.session.execute(stmt, rows[start:start + batch_size])
+        db.session.commit()
+
+    global edge_version
+    edge_version += 1
+    logger.info(f"Upserted {len(rows)} edges into route_data")
+    return len(rows)
+
+
+def _update(existing, row):
+    for column, value in row.items():
+        setattr(existing, column, value)
+    return existing
+
+
+def load_edge_lists(cities=None):
+    """
+    All stored edges as parallel arrays - sparse, for networks too large for a dense tensor
+
+    Args:
+        cities (list): Cities to include, in index order; defaults to every
+                       city in route_data, sorted
+
+    Returns:
+        tuple: (cities, source indices, destination indices,
+                values of shape (3, edges) ordered as METRICS)
+    """
+    table = RouteData.__table__
+    query = select(table.c.source, table.c.destination, table.c.distance, table.c.time, table.c.toll)
+    if cities is not None:
+        cities = [normalize_city(c) for c in cities]
+        query = query.where(table.c.source.in_(cities), table.c.destination.in_(cities))
+
+    with _app_context(), span('db.load_edges'):
+        rows = db.session.execute(query).all()
+
+    if cities is None:
+        cities = sorted({r[0] for r in rows} | {r[1] for r in rows})
+    if not rows:
+        empty = np.zeros(0, dtype=np.int64)
+        return list(cities), empty, empty, np.zeros((len(METRICS), 0))
+
+    sources, destinations, distance, hours, toll = zip(*rows)
+    # Names are normalized on write, so they map straight onto positions
+    names = np.array(cities)
+    order = np.argsort(names)
+    src = order[np.searchsorted(names, sources, sorter=order)]
+    dst = order[np.searchsorted(names, destinations, sorter=order)]
+    return list(cities), src, dst, np.array([distance, hours, toll], dtype=float)
+
+
+def load_edge_tensor(cities=None):
+    """
+    All stored edges as a cost tensor
+
+    Args:
+        cities (list): Cities to include, in matrix order; defaults to every
+                       city in route_data, sorted
+
+    Returns:
+        tuple: (np.ndarray of shape (3, n, n) ordered as METRICS, with inf for
+                missing edges and 0 on the diagonal, list of cities)
+    """
+    cities, src, dst, values = load_edge_lists(cities)
+    n = len(cities)
+    tensor = np.full((len(METRICS), n, n), np.inf)
+    tensor[:, src, dst] = values
+    tensor[:, np.arange(n), np.arange(n)] = 0
+    return tensor, cities
+
+
+def _route_data_schema():
+    """(columns, indexes) of route_data, or None when the table does not exist"""
+    inspector = inspect(db.engine)
+    if not inspector.has_table(RouteData.__tablename__):
+        return None
+    columns = {c['name'] for c in inspector.get_columns(RouteData.__tablename__)}
+    indexes = {i['name'] for i in inspector.get_indexes(RouteData.__tablename__)}
+    return columns, indexes
+
+
+def route_data_needs_migration():
+    """Read-only check whether migrate_route_data() has work to do"""
+    schema = _route_data_schema()
+    if schema is None:
+        return False
+    columns, indexes = schema
+    return 'fetched_at' not in columns or 'ix_route_data_source_destination' not in indexes
+
+
+def pending_migrations():
+    """
+    What `migrate` would change, without touching the database
+
+    Returns:
+        list: Missing table names, plus 'route_data' when it needs upgrading
+    """
+    existing = set(inspect(db.engine).get_table_names())
+    pending = sorted(set(db.metadata.tables) - existing)
+    if route_data_needs_migration():
+        pending.append('route_data')
+    return pending
+
+
+def migrate_route_data():
+    """
+    Bring a route_data table created before the edge store up to date:
+    add fetched_at, normalize names, drop duplicate pairs (keeping the
+    newest row) and create the unique (source, destination) index.
+    Idempotent; run it once per database with `python -m Toll.edge_store migrate`.
+
+    Returns:
+        bool: Whether anything was migrated
+    """
+    if not route_data_needs_migration():
+        return False
+    columns, _ = _route_data_schema()
+    engine = db.engine
+
+    logger.warning("Migrating route_data to the edge store schema")
+    with engine.begin() as conn:
+        if 'fetched_at' not in columns:
+            conn.execute(text("ALTER TABLE route_data ADD COLUMN fetched_at TIMESTAMP"))
+            conn.execute(text("UPDATE route_data SET fetched_at = CURRENT_TIMESTAMP"))
+
+        # Legacy rows were written with free-form names; normalize them once here
+        rows = conn.execute(text("SELECT id, source, destination FROM route_data ORDER BY id")).all()
+        newest = {}
+        for row_id, src, dst in rows:
+            src, dst = normalize_city(src), normalize_city(dst)
+            # The old CSV import could leave its header row behind
+            if src and dst and (src, dst) != ('Source', 'Destination'):
+                newest[(src, dst)] = row_id
+        keep = set(newest.values())
+        stale = [{'id': row_id} for row_id, _, _ in rows if row_id not in keep]
+        if stale:
+            conn.execute(text("DELETE FROM route_data WHERE id = :id"), stale)
+        renamed = [{'id': row_id, 'source': src, 'destination': dst} for (src, dst), row_id in newest.items()]
+        if renamed:
+            conn.execute(text("UPDATE route_data SET source = :source, destination = :destination WHERE id = :id"),
+                         renamed)
+
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_route_data_source_destination "
+                          "ON route_data (source, destination)"))
+    return True
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['migrate']:
+        print("Usage: python -m Toll.edge_store migrate")
+        sys.exit(2)
+    with _app_context():
+        pending = pending_migrations()
+        db.create_all()
+        migrate_route_data()
+    if pending:
+        print(f"✅ Migrated: {', '.join(pending)}")
+    else:
+        print("✅ Database schema already up to date")
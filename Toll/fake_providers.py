@@ -0,0 +1,254 @@
+# Deterministic local stand-ins for the Google providers
+# Used for load tests and offline development: FakeGoogleMapsClient replaces
+# the googlemaps.Client behind `Toll.gmaps`, FakeRoutesTransport replaces
+# requests.post inside RoutesAPI. Responses come from recordings when
+# available, otherwise they are synthesized from the static city data.
+#
+# Enable with SMARTROUTE_FAKE_PROVIDERS=1. Tunables (all optional):
+#   FAKE_LATENCY_MS        median latency per call (default 250)
+#   FAKE_LATENCY_SIGMA     lognormal spread, 0 = fixed latency (default 0.4)
+#   FAKE_ERROR_RATE        fraction of calls failing with a 5xx (default 0)
+#   FAKE_429_BURST_RATE    chance that a call starts a 429 burst (default 0)
+#   FAKE_429_BURST_LENGTH  calls rejected per burst (default 20)
+#   FAKE_RECORDINGS_DIR    directory of recorded <origin>__<destination>.json payloads
+#   FAKE_SEED              RNG seed (default 1234)
+
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+HIGHWAYS = ['NH 48', 'NH 44', 'NH 19', 'SH 17', 'Mumbai-Pune Expressway', 'NH 8']
+
+
+class FakeProviderError(Exception):
+    """Raised by the fake Directions client, mirroring googlemaps errors"""
+
+    def __init__(self, status_code, message):
+        super().__init__(f"HTTP {status_code}: {message}")
+        self.status_code = status_code
+
+
+class LatencyModel:
+    """Latency, error and 429-burst behaviour shared by both fakes"""
+
+    def __init__(self, median_ms=250, sigma=0.4, error_rate=0.0,
+                 burst_rate=0.0, burst_length=20, seed=1234):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.burst_rate = burst_rate
+        self.burst_length = burst_length
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._burst_remaining = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            median_ms=float(os.getenv('FAKE_LATENCY_MS', 250)),
+            sigma=float(os.getenv('FAKE_LATENCY_SIGMA', 0.4)),
+            error_rate=float(os.getenv('FAKE_ERROR_RATE', 0)),
+            burst_rate=float(os.getenv('FAKE_429_BURST_RATE', 0)),
+            burst_length=int(os.getenv('FAKE_429_BURST_LENGTH', 20)),
+            seed=int(os.getenv('FAKE_SEED', 1234))
+        )
+
+    def next_call(self):
+        """
+        Decide the outcome of one call and sleep for its latency
+
+        Returns:
+            int: HTTP status the call should produce (200, 429 or 500)
+        """
+        with self._lock:
+            if self._burst_remaining:
+                self._burst_remaining -= 1
+                status = 429
+            elif self._rng.random() < self.burst_rate:
+                self._burst_remaining = self.burst_length - 1
+                status = 429
+            elif self._rng.random() < self.error_rate:
+                status = 500
+            else:
+                status = 200
+            if self.sigma > 0:
+                latency_ms = self.median_ms * self._rng.lognormvariate(0, self.sigma)
+            else:
+                latency_ms = self.median_ms
+
+        # Rejections come back quickly, like a real quota error
+        time.sleep((latency_ms if status != 429 else latency_ms / 10) / 1000)
+        return status
+
+
+def _pair_seed(origin, destination):
+    digest = hashlib.sha1(f"{origin}|{destination}".encode()).hexdigest()
+    return int(digest[:8], 16)
+
+
+def _city_name(place):
+    """'Mumbai, India' -> 'Mumbai'"""
+    return place.split(',')[0].strip().title() if isinstance(place, str) else str(place)
+
+
+def synthetic_location(place):
+    """Stable pseudo (lat, lng) for a place, inside India's bounding box; shared by geocode and polylines"""
+    seed = _pair_seed(_city_name(place), '')
+    return 8 + seed % 2700 / 100, 68 + seed // 2700 % 2900 / 100
+
+
+def synthetic_leg_values(origin, destination):
+    """(distance_m, duration_s) from the static matrices, or a stable pseudo value"""
+    from Toll.static_data import CITIES, DISTANCE_MATRIX, TIME_MATRIX
+
+    src, dst = _city_name(origin), _city_name(destination)
+    if src in CITIES and dst in CITIES:
+        i, j = CITIES.index(src), CITIES.index(dst)
+        return DISTANCE_MATRIX[i][j] * 1000, TIME_MATRIX[i][j] * 3600
+
+    distance_km = 80 + _pair_seed(src, dst) % 1900
+    return distance_km * 1000, distance_km / 65 * 3600
+
+
+def synthetic_polyline(origin, destination, distance_m, variant=0):
+    """Encoded overview polyline: a meandering line between stable pseudo-locations, ~1 point per km"""
+    from Toll.geometry import encode_polyline
+
+    rng = random.Random(_pair_seed(_city_name(origin), _city_name(destination)) + variant)
+    start, end = synthetic_location(origin), synthetic_location(destination)
+    count = max(2, min(2000, int(distance_m / 1000)))
+    coords, drift = [], 0.0
+    for k in range(count):
+        t = k / (count - 1)
+        drift = 0.98 * drift + rng.gauss(0, 0.01)
+        wobble = drift * (1 - abs(2 * t - 1))  # pinned at both ends
+        coords.append((start[0] + (end[0] - start[0]) * t + wobble,
+                       start[1] + (end[1] - start[1]) * t - wobble))
+    return encode_polyline(coords)
+
+
+def synthetic_directions(origin, destination, alternatives=3, steps=40):
+    """Directions API-shaped response with `alternatives` routes"""
+    distance_m, duration_s = synthetic_leg_values(origin, destination)
+    if not distance_m:
+        return []
+
+    seed = _pair_seed(_city_name(origin), _city_name(destination))
+    routes = []
+    for a in range(alternatives):
+        # Alternatives trade distance against time
+        dist = int(distance_m * (1 + 0.04 * a))
+        dur = int(duration_s * (1 - 0.03 * a))
+        main_roads = [HIGHWAYS[(seed + a + k) % len(HIGHWAYS)] for k in range(2)]
+        routes.append({
+            'summary': ' and '.join(main_roads),
+            'overview_polyline': {'points': synthetic_polyline(origin, destination, dist, a)},
+            'legs': [{
+                'distance': {'value': dist, 'text': f"{dist / 1000:,.0f} km"},
+                'duration': {'value': dur, 'text': f"{dur // 3600} hours {dur % 3600 // 60} mins"},
+                'duration_in_traffic': {'value': int(dur * 1.08)},
+                'steps': [{
+                    'html_instructions': f"Continue onto <b>{main_roads[s % 2]}</b> toward <b>Town {s}</b>",
+                    'distance': {'value': dist // steps},
+                    'duration': {'value': dur // steps}
+                } for s in range(steps)]
+            }]
+        })
+    return routes
+
+
+class FakeGoogleMapsClient:
+    """Drop-in for googlemaps.Client covering directions() and geocode()"""
+
+    def __init__(self, latency=None, recordings_dir=None):
+        self.latency = latency or LatencyModel()
+        self.recordings_dir = recordings_dir
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(LatencyModel.from_env(), os.getenv('FAKE_RECORDINGS_DIR'))
+
+    def _check_status(self):
+        self.calls += 1
+        status = self.latency.next_call()
+        if status == 429:
+            raise FakeProviderError(429, "OVER_QUERY_LIMIT")
+        if status != 200:
+            raise FakeProviderError(status, "UNKNOWN_ERROR")
+
+    def directions(self, origin, destination, alternatives=False, **kwargs):
+        self._check_status()
+        recorded = self._recording(origin, destination)
+        if recorded is not None:
+            routes = recorded
+        else:
+            routes = synthetic_directions(origin, destination)
+        return routes if alternatives else routes[:1]
+
+    def geocode(self, address, **kwargs):
+        self._check_status()
+        lat, lng = synthetic_location(address)
+        return [{'formatted_address': f"{_city_name(address)}, India",
+                 'geometry': {'location': {'lat': lat, 'lng': lng}}}]
+
+    def _recording(self, origin, destination):
+        if not self.recordings_dir:
+            return None
+        name = re.sub(r'[^A-Za-z0-9]+', '_', f"{_city_name(origin)}__{_city_name(destination)}")
+        path = os.path.join(self.recordings_dir, f"{name}.json")
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+
+class FakeResponse:
+    """Minimal requests.Response used by FakeRoutesTransport"""
+
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeRoutesTransport:
+    """Replaces requests.post for the Routes API computeRoutes endpoint"""
+
+    def __init__(self, latency=None):
+        self.latency = latency or LatencyModel()
+        self.calls = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(LatencyModel.from_env())
+
+    def post(self, url, json=None, headers=None, timeout=None, **kwargs):
+        self.calls += 1
+        status = self.latency.next_call()
+        if status != 200:
+            return FakeResponse(status, {'error': {'code': status, 'status': 'RESOURCE_EXHAUSTED' if status == 429 else 'INTERNAL'}})
+
+        origin = (json or {}).get('origin', {}).get('address', '')
+        destination = (json or {}).get('destination', {}).get('address', '')
+        distance_m, duration_s = synthetic_leg_values(origin, destination)
+        toll = round(distance_m / 1000 * 2.4)
+        return FakeResponse(200, {'routes': [{
+            'distanceMeters': int(distance_m),
+            'duration': f"{int(duration_s)}s",
+            'travelAdvisory': {'tollInfo': {'estimatedPrice': [{'currencyCode': 'INR', 'units': str(toll)}]}}
+        }]})
+
+
+def fake_providers_enabled():
+    return os.getenv('SMARTROUTE_FAKE_PROVIDERS', '').lower() in ('1', 'true', 'yes')
@@ -1,4 +1,4 @@
-import numpy as np
+from Toll.apsp import all_pairs
 
 def floyd_warshall(matrix):
     """
@@ -9,27 +9,11 @@ def floyd_warshall(matrix):
     
     Returns:
         np.ndarray: Optimized cost matrix
-        np.ndarray: Next node matrix for path reconstruction
+        np.ndarray: Next node matrix for path reconstruction (-1 = no path)
     """
-    n = len(matrix)
-    dist = np.copy(matrix)
-    next_node = np.full((n, n), -1)  # For path reconstruction
-    
-    # Initialize next_node for direct paths
-    for i in range(n):
-        for j in range(n):
-            if i != j and not np.isinf(matrix[i][j]):
-                next_node[i][j] = j
-    
-    # Floyd-Warshall core algorithm
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if np.isfinite(dist[i][k]) and np.isfinite(dist[k][j]) and dist[i][j] > dist[i][k] + dist[k][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]
-                    next_node[i][j] = next_node[i][k]
-    
-    return dist, next_node
+    # The backend (python/numpy/numba/scipy) is picked from graph size and density
+    return all_pairs(matrix)
+
 def reconstruct_path(start_idx, end_idx, next_node, cities):
     """
     Converts next_node matrix into human-readable path.
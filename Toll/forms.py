@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField , SubmitField, SelectField
-from wtforms.validators import Length,EqualTo,Email,DataRequired , ValidationError
+from wtforms import StringField, PasswordField , SubmitField, SelectField, FloatField, DateTimeLocalField
+from wtforms.validators import Length,EqualTo,Email,DataRequired , ValidationError, Optional, NumberRange
 
 from flask import flash
 class Inputform(FlaskForm):
@@ -30,7 +30,21 @@ class Inputform(FlaskForm):
     
     preference = SelectField(
         'Route Preference',
-        choices=[('','--Select Preference--'),('distance','Shortest Distance'),('toll','Minimum Toll'),('time','Shortest Time ( Recommended )')], validators=[DataRequired()])
+        choices=[('','--Select Preference--'),('distance','Shortest Distance'),('toll','Minimum Toll'),('time','Shortest Time ( Recommended )'),('weighted','Custom Weighted Mix')], validators=[DataRequired()])
+
+    # Only used with the 'weighted' preference, e.g. 0.6 time + 0.4 toll
+    distance_weight = FloatField('Distance Weight', validators=[Optional(), NumberRange(min=0)], default=0)
+    time_weight = FloatField('Time Weight', validators=[Optional(), NumberRange(min=0)], default=0.6)
+    toll_weight = FloatField('Toll Weight', validators=[Optional(), NumberRange(min=0)], default=0.4)
+
+    # Optional future departure for 'time' routing, answered from time-of-day matrices
+    departure = DateTimeLocalField('Departure Time', format='%Y-%m-%dT%H:%M', validators=[Optional()])
+
+    def validate_toll_weight(self, field):
+        if self.preference.data == 'weighted':
+            total = sum(f.data or 0 for f in (self.distance_weight, self.time_weight, field))
+            if total <= 0:
+                raise ValidationError('At least one weight must be greater than zero')
        
     
     submit = SubmitField('Find the Route')
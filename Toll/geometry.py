@@ -0,0 +1,175 @@
+# Route geometry: storage and zoom-level simplification
+# Directions answers include an encoded overview polyline. It is stored once
+# per (source, destination, preference) when the route is computed, together
+# with Douglas-Peucker simplifications at a few zoom tolerances, so the
+# results page can draw the route on an embedded map from our own endpoint -
+# a repeat view costs a database read (or a browser cache hit), never another
+# provider call. A country-level view needs a few dozen points where the
+# full overview has thousands.
+
+import hashlib
+import json
+import logging
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from Toll import db
+from Toll.edge_store import _app_context, normalize_city
+from Toll.models import RouteGeometry
+
+logger = logging.getLogger(__name__)
+
+# Map zoom level -> simplification tolerance in metres (roughly one screen
+# pixel at that zoom). Requests for other zooms use the nearest coarser level.
+ZOOM_TOLERANCES_M = {5: 3000, 8: 400, 11: 50, 14: 8}
+
+_EARTH_RADIUS_M = 6_371_000
+
+
+def decode_polyline(encoded, precision=5):
+    """
+    Google encoded polyline to coordinates
+
+    Returns:
+        np.ndarray: (points, 2) array of (lat, lon)
+    """
+    values = []
+    value = shift = 0
+    for char in encoded:
+        byte = ord(char) - 63
+        value |= (byte & 0x1f) << shift
+        shift += 5
+        if byte < 0x20:
+            values.append(~(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    coords = np.cumsum(np.array(values, dtype=np.int64).reshape(-1, 2), axis=0)
+    return coords / 10 ** precision
+
+
+def encode_polyline(coords, precision=5):
+    """(lat, lon) pairs to a Google encoded polyline"""
+    scaled = np.round(np.asarray(coords, dtype=float).reshape(-1, 2) * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64)).ravel()
+    chunks = []
+    for value in deltas.tolist():
+        value = ~(value << 1) if value < 0 else value << 1
+        while value >= 0x20:
+            chunks.append(chr((0x20 | (value & 0x1f)) + 63))
+            value >>= 5
+        chunks.append(chr(value + 63))
+    return ''.join(chunks)
+
+
+def simplify(coords, tolerance_m):
+    """
+    Douglas-Peucker simplification
+
+    Args:
+        coords (np.ndarray): (points, 2) of (lat, lon)
+        tolerance_m (float): Maximum distance in metres a dropped point may
+                             lie from the simplified line
+
+    Returns:
+        np.ndarray: The kept points, endpoints always included
+    """
+    coords = np.asarray(coords, dtype=float)
+    if len(coords) < 3 or tolerance_m <= 0:
+        return coords
+
+    # Local equirectangular projection to metres - accurate enough at route scale
+    lat0 = np.radians(coords[:, 0].mean())
+    xy = np.radians(coords[:, ::-1]) * _EARTH_RADIUS_M
+    xy[:, 0] *= np.cos(lat0)
+
+    keep = np.zeros(len(coords), dtype=bool)
+    keep[[0, -1]] = True
+    stack = [(0, len(coords) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        a, b = xy[start], xy[end]
+        segment = b - a
+        length = np.hypot(*segment)
+        inner = xy[start + 1:end] - a
+        if length == 0:
+            distances = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            distances = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        farthest = int(np.argmax(distances))
+        if distances[farthest] > tolerance_m:
+            split = start + 1 + farthest
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+    return coords[keep]
+
+
+def simplify_levels(encoded):
+    """Encoded polyline for every zoom level in ZOOM_TOLERANCES_M"""
+    coords = decode_polyline(encoded)
+    return {str(zoom): encode_polyline(simplify(coords, tolerance))
+            for zoom, tolerance in ZOOM_TOLERANCES_M.items()}
+
+
+def level_for_zoom(zoom):
+    """The stored level to serve for a map zoom"""
+    levels = sorted(ZOOM_TOLERANCES_M)
+    fitting = [level for level in levels if level <= zoom]
+    return fitting[-1] if fitting else levels[0]
+
+
+def store_geometry(source, destination, preference, encoded):
+    """
+    Keep a route's overview polyline and its simplified levels
+
+    Returns:
+        bool: True if stored (False for empty geometry or a database error)
+    """
+    if not encoded:
+        return False
+    source, destination = normalize_city(source), normalize_city(destination)
+    levels = json.dumps(simplify_levels(encoded))
+    try:
+        with _app_context():
+            row = RouteGeometry.query.filter_by(source=source, destination=destination,
+                                                preference=preference).first()
+            if row is None:
+                row = RouteGeometry(source=source, destination=destination, preference=preference)
+                db.session.add(row)
+            row.polyline = encoded
+            row.levels = levels
+            row.points = len(decode_polyline(encoded))
+            row.fetched_at = datetime.utcnow()
+            db.session.commit()
+    except SQLAlchemyError as e:
+        logger.warning(f"Could not store route geometry: {e}")
+        with _app_context():
+            db.session.rollback()
+        return False
+    return True
+
+
+def get_geometry(source, destination, preference, zoom):
+    """
+    Stored geometry simplified for a zoom level
+
+    Returns:
+        dict or None: {'zoom', 'points' (encoded), 'point_count', 'full_point_count', 'etag'}
+    """
+    with _app_context():
+        row = RouteGeometry.query.filter_by(source=normalize_city(source), destination=normalize_city(destination),
+                                            preference=preference).first()
+    if row is None:
+        return None
+    level = level_for_zoom(zoom)
+    encoded = json.loads(row.levels).get(str(level), row.polyline)
+    return {
+        'zoom': level,
+        'points': encoded,
+        'point_count': len(decode_polyline(encoded)),
+        'full_point_count': row.points,
+        'etag': hashlib.sha256(encoded.encode()).hexdigest()[:16]
+    }
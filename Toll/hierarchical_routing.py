@@ -0,0 +1,357 @@
+# Hierarchical regional routing
+# Instead of one flat n x n all-pairs table, cities are partitioned into
+# regions (city_network.CITY_REGIONS). Each region gets its own all-pairs
+# table, and the border cities - endpoints of edges that cross a region
+# boundary - form an overlay graph whose all-pairs table holds the
+# inter-region distances. A query is answered as
+#
+#     local(source -> exit border) + overlay(exit -> entry border) + local(entry -> destination)
+#
+# minimised over the border cities of the two regions, all table lookups.
+# Precomputation and memory scale with sum(|region|^2) + |borders|^2 rather
+# than n^2, which is what lets the network grow to thousands of towns on a
+# road-like graph where few edges leave each region.
+#
+# Configuration (environment, read at startup):
+#   HIERARCHY_REGIONS_FILE   JSON {city: region} merged over CITY_REGIONS, for
+#                            towns beyond the built-in network
+#
+# A query may take an admissible lower bound (cost_model.node_lower_bound for
+# real coordinates) to skip border cities that cannot beat a first candidate.
+# get_hierarchical_route() does not pass one: city coordinates are centres,
+# not the points the stored road costs were measured between, so a bound
+# from them can overestimate short edges.
+#
+# Usage: python -m Toll.hierarchical_routing [--towns 3000 --regions 30]
+#        builds a synthetic regional network, checks every answer against a
+#        flat all-pairs run (with and without a bound) and reports memory and
+#        query time for both.
+#
+# The all-pairs tables come from apsp.all_pairs(), so large regions use
+# scipy or numba when installed.
+
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from Toll.apsp import all_pairs, path as apsp_path
+from Toll.city_network import CITY_REGIONS
+from Toll.metrics import span
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REGION = 'Other'
+UNITS = {'distance': 'km', 'time': 'hours', 'toll': 'INR'}
+
+def _walk(next_node, a, b):
+    """Node indices of the a -> b path in one next-hop table"""
+    return apsp_path(next_node, a, b)
+
+
+def load_regions():
+    """City -> region mapping, CITY_REGIONS plus HIERARCHY_REGIONS_FILE"""
+    regions = dict(CITY_REGIONS)
+    path = os.getenv('HIERARCHY_REGIONS_FILE')
+    if path:
+        with open(path) as f:
+            regions.update(json.load(f))
+    return regions
+
+
+class HierarchicalNetwork:
+    """Per-region all-pairs tables joined by an all-pairs table over border cities"""
+
+    def __init__(self, cities):
+        self.cities = list(cities)
+        self.index = {city: i for i, city in enumerate(self.cities)}
+
+    @classmethod
+    def build(cls, cities, sources, targets, weights, regions):
+        """
+        Args:
+            cities (list): City names; edges refer to them by position
+            sources, targets (np.ndarray): Edge endpoints as city indices
+            weights (np.ndarray): Edge costs (parallel edges keep the cheapest)
+            regions (list): Region label of every city
+
+        Returns:
+            HierarchicalNetwork
+        """
+        net = cls(cities)
+        n = len(net.cities)
+        sources = np.asarray(sources, dtype=np.int64)
+        targets = np.asarray(targets, dtype=np.int64)
+        weights = np.asarray(weights, dtype=float)
+
+        labels, net.region_of = np.unique(np.asarray(regions, dtype=object).astype(str), return_inverse=True)
+        net.region_names = list(labels)
+        net.members = [np.flatnonzero(net.region_of == r) for r in range(len(labels))]
+        net.position = np.empty(n, dtype=np.int64)  # index within own region
+        for members in net.members:
+            net.position[members] = np.arange(len(members))
+
+        inside = net.region_of[sources] == net.region_of[targets]
+
+        # Local all-pairs tables, one per region
+        net.local, net.local_pred = [], []
+        for r, members in enumerate(net.members):
+            matrix = np.full((len(members), len(members)), np.inf)
+            mine = inside & (net.region_of[sources] == r)
+            np.minimum.at(matrix, (net.position[sources[mine]], net.position[targets[mine]]), weights[mine])
+            np.fill_diagonal(matrix, 0)
+            dist, pred = all_pairs(matrix)
+            net.local.append(dist)
+            net.local_pred.append(pred)
+
+        # Border cities and the overlay between them: cross-region edges plus
+        # each region's border-to-border local distances
+        net.borders = np.unique(np.concatenate([sources[~inside], targets[~inside]]))
+        net.overlay_index = np.full(n, -1, dtype=np.int64)
+        net.overlay_index[net.borders] = np.arange(len(net.borders))
+        net.region_borders = [net.borders[net.region_of[net.borders] == r] for r in range(len(labels))]
+
+        overlay = np.full((len(net.borders), len(net.borders)), np.inf)
+        for r, borders in enumerate(net.region_borders):
+            at = np.ix_(net.overlay_index[borders], net.overlay_index[borders])
+            overlay[at] = net.local[r][np.ix_(net.position[borders], net.position[borders])]
+        np.minimum.at(overlay, (net.overlay_index[sources[~inside]], net.overlay_index[targets[~inside]]),
+                      weights[~inside])
+        np.fill_diagonal(overlay, 0)
+        net.overlay, net.overlay_pred = all_pairs(overlay)
+        return net
+
+    def query(self, source, destination, lower_bound=None):
+        """
+        Best path between two cities
+
+        Args:
+            source (str): Starting city
+            destination (str): Destination city
+            lower_bound (callable): Optional admissible lower_bound(a, b) on the
+                cost between city indices, e.g. cost_model.node_lower_bound();
+                border cities that cannot beat a first candidate are skipped
+
+        Returns:
+            tuple: (cost, list of cities) or None if either city is unknown or
+                   the destination is unreachable
+        """
+        s, t = self.index.get(source), self.index.get(destination)
+        if s is None or t is None:
+            return None
+        rs, rt = self.region_of[s], self.region_of[t]
+        ps, pt = self.position[s], self.position[t]
+
+        best = self.local[rs][ps, pt] if rs == rt else np.inf
+        via = None
+        exits, entries = self.region_borders[rs], self.region_borders[rt]
+        if len(exits) and len(entries) and lower_bound is not None:
+            exits, entries = self._prune_borders(s, t, exits, entries, best, lower_bound)
+        if len(exits) and len(entries):
+            costs = (self.local[rs][ps, self.position[exits]][:, None]
+                     + self.overlay[np.ix_(self.overlay_index[exits], self.overlay_index[entries])]
+                     + self.local[rt][self.position[entries], pt][None, :])
+            i, j = np.unravel_index(np.argmin(costs), costs.shape)
+            if costs[i, j] < best:
+                best, via = costs[i, j], (exits[i], entries[j])
+
+        if not np.isfinite(best):
+            return None
+        if via is None:
+            path = self._local_path(s, t)
+        else:
+            path = self._local_path(s, via[0])
+            path += self._overlay_path(via[0], via[1])[1:]
+            path += self._local_path(via[1], t)[1:]
+        return float(best), [self.cities[i] for i in path]
+
+    def _prune_borders(self, s, t, exits, entries, best, lower_bound):
+        """Exits and entries whose bound still fits under a known s -> t cost"""
+        rs, rt = self.region_of[s], self.region_of[t]
+        to_exits = self.local[rs][self.position[s], self.position[exits]]
+        from_entries = self.local[rt][self.position[entries], self.position[t]]
+        if not np.isfinite(best):
+            # Upper bound from the cheapest exit alone: one row of candidates
+            e = int(np.argmin(to_exits))
+            best = np.min(to_exits[e] + self.overlay[self.overlay_index[exits[e]], self.overlay_index[entries]]
+                          + from_entries)
+            if not np.isfinite(best):
+                return exits, entries
+        keep_exits = to_exits + lower_bound(exits, t) <= best
+        keep_entries = lower_bound(s, entries) + from_entries <= best
+        return exits[keep_exits], entries[keep_entries]
+
+    def _local_path(self, a, b):
+        r = self.region_of[a]
+        return [int(self.members[r][i]) for i in _walk(self.local_pred[r], self.position[a], self.position[b])]
+
+    def _overlay_path(self, a, b):
+        hops = [int(self.borders[i]) for i in _walk(self.overlay_pred, self.overlay_index[a], self.overlay_index[b])]
+        path = hops[:1]
+        for u, v in zip(hops, hops[1:]):
+            # Same-region overlay edges stand for a local path; the others are road edges
+            path += self._local_path(u, v)[1:] if self.region_of[u] == self.region_of[v] else [v]
+        return path
+
+    @property
+    def nbytes(self):
+        """Memory held by the distance and predecessor tables"""
+        tables = self.local + self.local_pred + [self.overlay, self.overlay_pred]
+        return sum(t.nbytes for t in tables)
+
+    def flat_nbytes(self):
+        """What the same tables take as one flat n x n layout"""
+        n = len(self.cities)
+        return n * n * (self.overlay.itemsize + self.overlay_pred.itemsize)
+
+    def summary(self):
+        return {
+            'cities': len(self.cities),
+            'regions': len(self.members),
+            'largest_region': max((len(m) for m in self.members), default=0),
+            'border_cities': len(self.borders),
+            'table_bytes': self.nbytes,
+            'flat_table_bytes': self.flat_nbytes()
+        }
+
+
+# Built networks per preference, with the edge data version they came from
+_networks = {}
+_lock = threading.Lock()
+
+
+def _network_edges(preference):
+    """Edges for one metric: the edge store when it has data, else the static matrices"""
+    from Toll import edge_store
+    metric = edge_store.METRICS.index(preference)
+    cities, sources, targets, values = edge_store.load_edge_lists()
+    if len(sources):
+        return 'edge_store', cities, sources, targets, values[metric]
+
+    from Toll.static_data import CITIES
+    from Toll.weighted_routing import METRIC_STACK
+    sources, targets = np.nonzero(~np.eye(len(CITIES), dtype=bool))
+    return 'static matrices', CITIES, sources, targets, METRIC_STACK[metric, sources, targets]
+
+
+def get_network(preference):
+    """The hierarchical network for 'distance', 'time' or 'toll', rebuilt when the edges change"""
+    from Toll import edge_store
+    with _lock:
+        cached = _networks.get(preference)
+        if cached is not None and cached[0] == edge_store.edge_version:
+            return cached[1]
+        version = edge_store.edge_version
+        origin, cities, sources, targets, weights = _network_edges(preference)
+        regions = load_regions()
+        with span('apsp.hierarchical_build'):
+            network = HierarchicalNetwork.build(cities, sources, targets, weights,
+                                                [regions.get(c, DEFAULT_REGION) for c in cities])
+        logger.info(f"Built hierarchical {preference} network from {origin}: {network.summary()}")
+        _networks[preference] = (version, network)
+        return network
+
+
+def get_hierarchical_route(source, destination, preference):
+    """
+    Route from the hierarchical tables, in the shape of SmartRouter.get_precomputed_route
+
+    Returns:
+        dict or None: None for unsupported preferences or cities outside the network
+    """
+    if preference not in UNITS:
+        return None
+    answer = get_network(preference).query(source, destination)
+    if answer is None:
+        return None
+    cost, route = answer
+    return {
+        'route': route,
+        'cost': round(cost, 2),
+        'unit': UNITS[preference],
+        'preference': preference,
+        'is_precomputed': True,
+        'data_source': 'Hierarchical regional APSP'
+    }
+
+
+def _synthetic_network(towns, regions, seed=0):
+    """
+    Road-like test graph: towns scattered around regional centres, nearest-neighbour roads
+
+    Returns:
+        tuple: (sources, targets, weights, region of each town, town km coordinates)
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.uniform(0, 2000, size=(regions, 2))
+    region = rng.integers(0, regions, size=towns)
+    xy = centres[region] + rng.normal(0, 60, size=(towns, 2))
+    d = np.hypot(*(xy[:, None, :] - xy[None, :, :]).transpose(2, 0, 1))
+    np.fill_diagonal(d, np.inf)
+    near = np.argsort(d, axis=1)[:, :4]
+    sources = np.repeat(np.arange(towns), near.shape[1])
+    targets = near.ravel()
+    # Roads run both ways
+    sources, targets = np.concatenate([sources, targets]), np.concatenate([targets, sources])
+    return sources, targets, d[sources, targets] * 1.3, region, xy
+
+
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Check hierarchical routing against a flat all-pairs run")
+    parser.add_argument('--towns', type=int, default=2000)
+    parser.add_argument('--regions', type=int, default=20)
+    parser.add_argument('--queries', type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    sources, targets, weights, region, xy = _synthetic_network(args.towns, args.regions)
+    cities = [f"Town{i}" for i in range(args.towns)]
+
+    started = time.perf_counter()
+    network = HierarchicalNetwork.build(cities, sources, targets, weights, [f"R{r}" for r in region])
+    print(f"🏗️  Hierarchical build: {time.perf_counter() - started:.2f}s  {network.summary()}")
+
+    started = time.perf_counter()
+    flat = np.full((args.towns, args.towns), np.inf)
+    np.minimum.at(flat, (sources, targets), weights)
+    np.fill_diagonal(flat, 0)
+    flat_dist, _ = all_pairs(flat)
+    print(f"🏗️  Flat build: {time.perf_counter() - started:.2f}s")
+
+    # Straight-line km is the admissible bound on these planar roads
+    def straight_line(a, b):
+        return np.atleast_1d(np.hypot(*(xy[a] - xy[b]).T))
+
+    rng = np.random.default_rng(1)
+    pairs = rng.integers(0, args.towns, size=(args.queries, 2))
+    mismatches = 0
+    timings = {}
+    for bound in (None, straight_line):
+        started = time.perf_counter()
+        for s, t in pairs:
+            network.query(cities[s], cities[t], lower_bound=bound)
+        timings['pruned' if bound else 'plain'] = (time.perf_counter() - started) / len(pairs) * 1e6
+    for i, (s, t) in enumerate(pairs):
+        answer = network.query(cities[s], cities[t], lower_bound=straight_line if i % 2 else None)
+        expected = flat_dist[s, t]
+        if answer is None:
+            mismatches += np.isfinite(expected)
+            continue
+        cost, route = answer
+        hops = [int(city[len('Town'):]) for city in route]
+        walked = flat[hops[:-1], hops[1:]].sum()
+        if not np.isclose(cost, expected) or not np.isclose(walked, cost):
+            mismatches += 1
+    print(f"{'✅' if not mismatches else '❌'} {args.queries - mismatches}/{args.queries} queries match flat APSP "
+          f"(every other one pruned with a straight-line bound)")
+    print(f"⏱️  {timings['plain']:.0f} µs per query, {timings['pruned']:.0f} µs with the bound")
+    print(f"📦 Tables: {network.nbytes / 1e6:.1f} MB hierarchical vs {network.flat_nbytes() / 1e6:.1f} MB flat")
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,265 @@
+# Nearest-hub snapping for places outside the network
+# A small town 20 km from Pune does not need its own Directions call: the
+# place is geocoded once (cached in geocoded_place), snapped to its nearest
+# network cities (hubs) on a KD-tree over the sphere, and the answer is
+#
+#     local leg (place -> hub) + precomputed hub -> hub route + local leg (hub -> place)
+#
+# Local legs are estimated from the great-circle distance with a road
+# circuity factor and an average local speed; they carry no toll. The
+# HUB_CANDIDATES nearest hubs of each end are tried and the cheapest
+# combination wins, so a place between two hubs is routed through the one
+# on the way.
+#
+# Snapping error is the great-circle length of the local legs. When either
+# leg exceeds HUB_SNAP_MAX_KM, both together exceed HUB_SNAP_MAX_FRACTION of
+# the trip's own straight-line length, or both ends snap to the same hub,
+# the estimate would be poor and the caller makes the live call instead.
+#
+# Uses scipy's cKDTree when scipy is installed, a vectorized haversine scan
+# over the hubs otherwise.
+#
+# Configuration (environment, read at startup):
+#   HUB_SNAPPING             '1' snaps off-network places in SmartRouter (default '0',
+#                            read by smart_routing.py)
+#   HUB_SNAP_MAX_KM          farthest a place may be from its hub (default 60)
+#   HUB_SNAP_MAX_FRACTION    largest local-leg share of the trip length (default 0.25)
+#   HUB_CANDIDATES           nearest hubs tried per end (default 3)
+#   LOCAL_ROAD_CIRCUITY      road km per great-circle km on local legs (default 1.3)
+#   LOCAL_SPEED_KMH          average speed on local legs (default 45)
+#
+# Usage: python -m Toll.hub_snapping <source> <destination> [distance|time|toll]
+
+from datetime import datetime
+import logging
+import os
+import sys
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from Toll import db, gmaps
+from Toll.city_network import CITY_COORDINATES
+from Toll.edge_store import _app_context, normalize_city
+from Toll.metrics import provider_error_status, record_provider_call, span
+from Toll.models import GeocodedPlace
+
+logger = logging.getLogger(__name__)
+
+SNAP_MAX_KM = float(os.getenv('HUB_SNAP_MAX_KM', 60))
+SNAP_MAX_FRACTION = float(os.getenv('HUB_SNAP_MAX_FRACTION', 0.25))
+HUB_CANDIDATES = int(os.getenv('HUB_CANDIDATES', 3))
+LOCAL_CIRCUITY = float(os.getenv('LOCAL_ROAD_CIRCUITY', 1.3))
+LOCAL_SPEED_KMH = float(os.getenv('LOCAL_SPEED_KMH', 45))
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; broadcasts over numpy arrays"""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _unit_vectors(coords):
+    lat, lon = np.radians(np.asarray(coords, dtype=float).reshape(-1, 2)).T
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+class HubIndex:
+    """Nearest-neighbour search over hub coordinates"""
+
+    def __init__(self, hubs):
+        """
+        Args:
+            hubs (dict): Hub name -> (lat, lon)
+        """
+        self.names = list(hubs)
+        self.coords = np.array([hubs[name] for name in self.names], dtype=float).reshape(-1, 2)
+        try:
+            from scipy.spatial import cKDTree
+        except ImportError:
+            self._tree = None
+        else:
+            # Euclidean nearest on unit vectors is great-circle nearest
+            self._tree = cKDTree(_unit_vectors(self.coords))
+
+    def nearest(self, lat, lon, k=HUB_CANDIDATES):
+        """
+        The k hubs closest to a point
+
+        Returns:
+            list: (hub, great-circle km), closest first
+        """
+        k = min(k, len(self.names))
+        if k == 0:
+            return []
+        if self._tree is not None:
+            chords, indices = self._tree.query(_unit_vectors((lat, lon))[0], k=k)
+            indices = np.atleast_1d(indices)
+            distances = 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.atleast_1d(chords) / 2, 0, 1))
+        else:
+            all_distances = haversine_km(lat, lon, self.coords[:, 0], self.coords[:, 1])
+            indices = np.argsort(all_distances)[:k]
+            distances = all_distances[indices]
+        return [(self.names[i], float(d)) for i, d in zip(indices, distances)]
+
+
+_index = None
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = HubIndex(CITY_COORDINATES)
+    return _index
+
+
+def geocode(place, live=True):
+    """
+    Coordinates of a place name: network cities from the table, others from
+    the geocoded_place cache, geocoding (once) on a miss
+
+    Args:
+        place (str): Place name
+        live (bool): False answers from the table and cache only, without a
+                     geocoding call
+
+    Returns:
+        tuple or None: (lat, lon)
+    """
+    name = normalize_city(place)
+    if name in CITY_COORDINATES:
+        return CITY_COORDINATES[name]
+
+    with _app_context():
+        row = GeocodedPlace.query.filter_by(name=name).first()
+    if row is not None:
+        return row.lat, row.lon
+
+    if not live or not gmaps:
+        return None
+    try:
+        with span('provider.geocode'):
+            results = gmaps.geocode(f"{name}, India")
+        record_provider_call('geocode', 'ok')
+    except Exception as e:
+        record_provider_call('geocode', provider_error_status(e))
+        logger.warning(f"Geocoding {name} failed: {e}")
+        return None
+    if not results:
+        return None
+
+    location = results[0]['geometry']['location']
+    coords = (float(location['lat']), float(location['lng']))
+    try:
+        with _app_context():
+            db.session.add(GeocodedPlace(name=name, lat=coords[0], lon=coords[1], fetched_at=datetime.utcnow()))
+            db.session.commit()
+    except SQLAlchemyError as e:
+        # Another worker stored it first, or the DB is unavailable - the coordinates are still good
+        logger.debug(f"Could not cache coordinates of {name}: {e}")
+        with _app_context():
+            db.session.rollback()
+    return coords
+
+
+def local_leg(great_circle_km, preference):
+    """Estimated cost of a local leg in the unit of the preference"""
+    road_km = great_circle_km * LOCAL_CIRCUITY
+    if preference == 'distance':
+        return road_km
+    if preference == 'time':
+        return road_km / LOCAL_SPEED_KMH
+    return 0.0
+
+
+def _candidates(place, coords):
+    """(hub, km) choices for one end; a network city is its own hub"""
+    name = normalize_city(place)
+    if name in CITY_COORDINATES:
+        return [(name, 0.0)]
+    return get_index().nearest(*coords)
+
+
+def snap_route(source, destination, preference, hub_route):
+    """
+    Route between arbitrary places through their nearest hubs
+
+    Args:
+        source (str): Starting place
+        destination (str): Destination place
+        preference (str): 'distance', 'time' or 'toll'
+        hub_route (callable): (hub, hub, preference) -> precomputed route dict or None
+
+    Returns:
+        dict or None: Route in the shape of SmartRouter.get_precomputed_route,
+                      None when the snapping error is too large for an estimate
+    """
+    source_coords, destination_coords = geocode(source), geocode(destination)
+    if source_coords is None or destination_coords is None:
+        return None
+    max_error = SNAP_MAX_FRACTION * float(haversine_km(*source_coords, *destination_coords))
+
+    best = None
+    for source_hub, source_km in _candidates(source, source_coords):
+        for destination_hub, destination_km in _candidates(destination, destination_coords):
+            error = source_km + destination_km
+            if source_hub == destination_hub or max(source_km, destination_km) > SNAP_MAX_KM or error > max_error:
+                continue
+            route = hub_route(source_hub, destination_hub, preference)
+            if not route:
+                continue
+            cost = route['cost'] + local_leg(source_km, preference) + local_leg(destination_km, preference)
+            if best is None or cost < best[0]:
+                best = (cost, route, source_hub, destination_hub, error)
+
+    if best is None:
+        logger.info(f"No hub close enough to snap {source} → {destination}")
+        return None
+
+    cost, route, source_hub, destination_hub, error = best
+    path = list(route['route'])
+    if normalize_city(source) != source_hub:
+        path.insert(0, source)
+    if normalize_city(destination) != destination_hub:
+        path.append(destination)
+    snapped = dict(route)
+    snapped.update({
+        'route': path,
+        'cost': cost,
+        'data_source': f"Hub snapping via {source_hub} → {destination_hub} ({route.get('data_source', 'precomputed')})",
+        'snapped_hubs': {'source': source_hub, 'destination': destination_hub},
+        'snap_error_km': round(error, 1)
+    })
+    return snapped
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2:
+        print("Usage: python -m Toll.hub_snapping <source> <destination> [distance|time|toll]")
+        return 1
+    from Toll.smart_routing import smart_router
+
+    source, destination = argv[0], argv[1]
+    preference = argv[2] if len(argv) > 2 else 'distance'
+    for place in (source, destination):
+        coords = geocode(place)
+        if coords is None:
+            print(f"❌ Could not geocode {place}")
+            return 1
+        hubs = ', '.join(f"{hub} {km:.0f} km" for hub, km in get_index().nearest(*coords))
+        print(f"📍 {place} ({coords[0]:.4f}, {coords[1]:.4f}) → {hubs}")
+    route = snap_route(source, destination, preference, smart_router.get_hub_route)
+    if route is None:
+        print("⚠️  Snapping error too large - a live call would be made")
+        return 0
+    print(f"✅ {' → '.join(route['route'])}: {route['cost']:.1f} {route['unit']} "
+          f"(snap error {route['snap_error_km']} km)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# Identity caching and off-thread password hashing
+# load_user runs on every authenticated request (each autocomplete keystroke
+# included), so user rows are cached for a short TTL and invalidated when the
+# row changes or the user logs out. bcrypt runs on a small dedicated pool: a
+# login burst can use at most BCRYPT_WORKERS cores.
+#
+# The request thread that asked for a hash still waits for its result, so
+# every running or queued operation holds one of the worker's request threads
+# (GUNICORN_THREADS, 4 by default). Operations in flight are therefore capped
+# below that count - by default at half of it - and a request that cannot get
+# a slot within BCRYPT_SLOT_WAIT_S is answered 503 at once instead of
+# waiting, so a login burst always leaves threads free for routing requests.
+#
+# Configuration (environment, read at startup):
+#   USER_CACHE_TTL_S         how long a loaded user is reused (default 60)
+#   USER_CACHE_SIZE          max cached users per process (default 10000)
+#   BCRYPT_ROUNDS            bcrypt cost factor for new hashes (default 12)
+#   BCRYPT_WORKERS           concurrent hash/check operations (default 2)
+#   BCRYPT_MAX_PENDING       operations allowed to queue behind them (default: half
+#                            the request threads minus BCRYPT_WORKERS, at least 0);
+#                            running + queued never exceed request threads - 1
+#   BCRYPT_SLOT_WAIT_S       how long a request waits for a slot (default 0.05)
+#   GUNICORN_THREADS         request threads per worker (default 4, as in gunicorn.conf.py)
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+from Toll import bcrypt
+from Toll.metrics import record_cache, span
+
+USER_CACHE_TTL_S = float(os.getenv('USER_CACHE_TTL_S', 60))
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', 2))
+REQUEST_THREADS = int(os.getenv('GUNICORN_THREADS', 4))
+BCRYPT_MAX_PENDING = int(os.getenv('BCRYPT_MAX_PENDING', max(0, REQUEST_THREADS // 2 - BCRYPT_WORKERS)))
+BCRYPT_SLOT_WAIT_S = float(os.getenv('BCRYPT_SLOT_WAIT_S', 0.05))
+
+
+class UserCache:
+    """Column values of recently loaded users, keyed by id"""
+
+    def __init__(self, ttl=USER_CACHE_TTL_S, maxsize=USER_CACHE_SIZE):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()  # id -> (expires, columns)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] <= time.monotonic():
+                del self._entries[user_id]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+        record_cache('user', entry is not None)
+        return entry[1] if entry else None
+
+    def put(self, user_id, columns):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, dict(columns))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class HashingBusy(Exception):
+    """Every bcrypt slot and queue position is taken; ask the client to retry"""
+
+
+def hashing_slots(workers, max_pending, request_threads):
+    """
+    Operations allowed in flight (running + queued) per process
+
+    Each one blocks a request thread, so at least one thread always stays free
+    """
+    return max(1, min(workers + max_pending, request_threads - 1))
+
+
+class PasswordHasher:
+    def __init__(self, workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, rounds=BCRYPT_ROUNDS,
+                 request_threads=REQUEST_THREADS, slot_wait=BCRYPT_SLOT_WAIT_S):
+        self.rounds = rounds
+        self.slot_wait = slot_wait
+        slots = hashing_slots(workers, max_pending, request_threads)
+        self._executor = ThreadPoolExecutor(max_workers=min(workers, slots), thread_name_prefix='bcrypt')
+        # Running + queued operations; beyond this callers are rejected
+        self._slots = threading.BoundedSemaphore(slots)
+
+    def _run(self, name, fn, *args):
+        if not self._slots.acquire(timeout=self.slot_wait):
+            raise HashingBusy(f"{name} rejected: hashing pool saturated")
+        try:
+            with span(name):
+                return self._executor.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, plain_text_password):
+        """bcrypt hash (str) of a password at the configured cost"""
+        return self._run('bcrypt.hash', bcrypt.generate_password_hash,
+                         plain_text_password, self.rounds).decode('utf-8')
+
+    def check(self, password_hash, attempted_password):
+        return self._run('bcrypt.check', bcrypt.check_password_hash, password_hash, attempted_password)
+
+
+password_hasher = PasswordHasher()
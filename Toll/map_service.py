@@ -3,6 +3,7 @@ import logging
 import re
 
 from Toll import gmaps
+from Toll.metrics import span, record_provider_call, provider_error_status
 
 logger = logging.getLogger(__name__)
 def get_route_details(source, destination):
@@ -13,8 +14,11 @@ def get_route_details(source, destination):
 
     try:
         # 2. Geocode the inputs
-        start_coords = gmaps.geocode(source)
-        end_coords = gmaps.geocode(destination)
+        with span('provider.geocode'):
+            start_coords = gmaps.geocode(source)
+            record_provider_call('geocode', 'ok')
+            end_coords = gmaps.geocode(destination)
+            record_provider_call('geocode', 'ok')
 
         if not start_coords:
             logger.error(f"Geocoding failed for source: {source}")
@@ -24,13 +28,15 @@ def get_route_details(source, destination):
             return None
 
         # 3. Call Google Maps Directions API with correct syntax
-        directions = gmaps.directions(
-            source,  # origin
-            destination,  # destination
-            mode="driving",
-            alternatives=True,
-            departure_time="now"
-        )
+        with span('provider.directions'):
+            directions = gmaps.directions(
+                source,  # origin
+                destination,  # destination
+                mode="driving",
+                alternatives=True,
+                departure_time="now"
+            )
+        record_provider_call('directions', 'ok')
 
         if not directions:
             logger.error("No routes returned by Google Maps API.")
@@ -52,6 +58,7 @@ def get_route_details(source, destination):
         return None
 
     except Exception as e:
+        record_provider_call('google_maps', provider_error_status(e))
         logger.error(f"Route fetching failed: {e}")
         return None
 
@@ -3,30 +3,46 @@
 
 from Toll import gmaps
 from Toll.city_network import CITIES
+from Toll.metrics import record_provider_call, provider_error_status
+from Toll.edge_store import upsert_edges
+from Toll.build_jobs import BuildJob
+from Toll.apsp import all_pairs, path as apsp_path
+from sqlalchemy.exc import SQLAlchemyError
 import json
+import os
 import time
 import logging
 
 logger = logging.getLogger(__name__)
 
-def build_comprehensive_matrices():
+def build_comprehensive_matrices(resume=True):
     """
     Step 2 & 3: Build and process matrices for Floyd-Warshall
     
     This function:
-    1. Calls Google Maps for all city pairs
+    1. Calls Google Maps for every city pair not yet checkpointed
     2. Builds distance, time, and toll matrices  
     3. Runs Floyd-Warshall algorithm
     4. Saves results for fast lookup
     
-    Note: This is a one-time setup process
+    Note: This is a one-time setup process. Fetched pairs are checkpointed
+    in the 'comprehensive' build job, so an interrupted build picks up where
+    it stopped; resume=False refetches everything. Raises
+    build_jobs.BuildAborted when the provider quota runs out.
     """
     if not gmaps:
         logger.error("Google Maps client not initialized")
         return False
     
     n = len(CITIES)
+    print(f"Building matrices for {n} cities ({n*n} total combinations)...")
     
+    # Step 2: Get data from Google Maps for each city pair
+    job = BuildJob('comprehensive', CITIES)
+    manifest = job.run(fetch_directions_edge, resume=resume)
+    print(f"📋 Manifest: {manifest}")
+    edges = job.edges()  # (source, destination, km, hours, INR, fetched_at)
+
     # Initialize matrices
     distance_matrix = [[float('inf')] * n for _ in range(n)]
     time_matrix = [[float('inf')] * n for _ in range(n)]
@@ -37,51 +53,21 @@ def build_comprehensive_matrices():
         distance_matrix[i][i] = 0
         time_matrix[i][i] = 0
         toll_matrix[i][i] = 0
-    
-    print(f"Building matrices for {n} cities ({n*n} total combinations)...")
-    
-    # Step 2: Get data from Google Maps for each city pair
-    for i in range(n):
-        for j in range(n):
-            if i != j:  # Skip same city
-                source = CITIES[i]
-                destination = CITIES[j]
-                
-                try:
-                    # Get route data from Google Maps
-                    directions = gmaps.directions(
-                        origin=f"{source}, India",
-                        destination=f"{destination}, India",
-                        mode="driving",
-                        departure_time='now'
-                    )
-                    
-                    if directions:
-                        leg = directions[0]['legs'][0]
-                        
-                        # Extract distance (km)
-                        distance_km = leg['distance']['value'] / 1000
-                        distance_matrix[i][j] = distance_km
-                        
-                        # Extract time (hours)
-                        time_hours = leg['duration']['value'] / 3600
-                        if 'duration_in_traffic' in leg:
-                            time_hours = leg['duration_in_traffic']['value'] / 3600
-                        time_matrix[i][j] = time_hours
-                        
-                        # Estimate toll (INR) - would be replaced with real toll API
-                        toll_estimate = estimate_toll_cost(distance_km, directions[0].get('summary', ''))
-                        toll_matrix[i][j] = toll_estimate
-                        
-                        print(f"✓ {source} → {destination}: {distance_km:.0f}km, {time_hours:.1f}h, ₹{toll_estimate:.0f}")
-                    
-                    # Rate limiting
-                    time.sleep(0.1)
-                    
-                except Exception as e:
-                    logger.error(f"Error getting data for {source} → {destination}: {e}")
-                    continue
-    
+
+    index = {city: i for i, city in enumerate(CITIES)}
+    for source, destination, distance_km, time_hours, toll_estimate, _ in edges:
+        if source not in index or destination not in index:
+            continue  # checkpointed before the city list changed
+        i, j = index[source], index[destination]
+        distance_matrix[i][j] = distance_km
+        time_matrix[i][j] = time_hours
+        toll_matrix[i][j] = toll_estimate
+    
+    try:
+        upsert_edges(edges)
+    except SQLAlchemyError as e:
+        logger.error(f"Could not store edges in route_data: {e}")
+
     # Step 3: Run Floyd-Warshall algorithm on each matrix
     print("Running Floyd-Warshall algorithm...")
     
@@ -96,49 +82,57 @@ def build_comprehensive_matrices():
     print("✅ Comprehensive matrices built and saved!")
     return True
 
+def fetch_directions_edge(source, destination):
+    """
+    One city pair from Google Directions
+
+    Returns:
+        tuple: (km, hours, INR) or None when Google finds no route
+    """
+    try:
+        # Get route data from Google Maps
+        directions = gmaps.directions(
+            origin=f"{source}, India",
+            destination=f"{destination}, India",
+            mode="driving",
+            departure_time='now'
+        )
+    except Exception as e:
+        record_provider_call('directions', provider_error_status(e))
+        logger.error(f"Error getting data for {source} → {destination}: {e}")
+        raise
+    record_provider_call('directions', 'ok')
+
+    if not directions:
+        return None
+    leg = directions[0]['legs'][0]
+    
+    # Extract distance (km)
+    distance_km = leg['distance']['value'] / 1000
+    
+    # Extract time (hours)
+    time_hours = leg['duration']['value'] / 3600
+    if 'duration_in_traffic' in leg:
+        time_hours = leg['duration_in_traffic']['value'] / 3600
+    
+    # Estimate toll (INR) - would be replaced with real toll API
+    toll_estimate = estimate_toll_cost(distance_km, directions[0].get('summary', ''))
+    return distance_km, time_hours, toll_estimate
+
 def floyd_warshall_with_paths(matrix):
     """
     Floyd-Warshall algorithm that also tracks the optimal paths
     
     Returns:
-        tuple: (optimized_matrix, path_matrix)
+        tuple: (optimized_matrix, path_matrix) - path_matrix holds the next
+               city index on each optimal path, -1 where there is none
     """
-    n = len(matrix)
-    
-    # Copy input matrix
-    dist = [row[:] for row in matrix]
-    
-    # Initialize path matrix
-    next_matrix = [[None] * n for _ in range(n)]
-    for i in range(n):
-        for j in range(n):
-            if i != j and dist[i][j] != float('inf'):
-                next_matrix[i][j] = j
-    
-    # Floyd-Warshall main algorithm
-    for k in range(n):
-        for i in range(n):
-            for j in range(n):
-                if dist[i][k] + dist[k][j] < dist[i][j]:
-                    dist[i][j] = dist[i][k] + dist[k][j]
-                    next_matrix[i][j] = next_matrix[i][k]
-    
-    return dist, next_matrix
+    return all_pairs(matrix)
 
 def reconstruct_path_from_matrix(start_idx, end_idx, next_matrix):
     """Reconstruct the optimal path from Floyd-Warshall results"""
-    if next_matrix[start_idx][end_idx] is None:
-        return []
-    
-    path = [start_idx]
-    current = start_idx
-    
-    while current != end_idx:
-        current = next_matrix[current][end_idx]
-        path.append(current)
-    
     # Convert indices to city names
-    return [CITIES[i] for i in path]
+    return [CITIES[i] for i in apsp_path(next_matrix, start_idx, end_idx)]
 
 def estimate_toll_cost(distance_km, route_summary):
     """Estimate toll cost - would be replaced with real toll API data"""
@@ -170,11 +164,13 @@ def save_matrices_and_paths(dist_matrix, time_matrix, toll_matrix,
         'last_updated': time.strftime('%Y-%m-%d %H:%M:%S')
     }
     
-    # Save to JSON file
-    with open('precomputed_routes.json', 'w') as f:
+    # Save to JSON file - via a temp file, workers may be reading the old one
+    with open('precomputed_routes.json.tmp', 'w') as f:
         json.dump(results, f, indent=2)
+    os.replace('precomputed_routes.json.tmp', 'precomputed_routes.json')
     
     print("💾 Results saved to precomputed_routes.json")
+    return results
 
 def matrix_to_dict(matrix):
     """Convert matrix to city-name indexed dictionary"""
@@ -183,7 +179,7 @@ def matrix_to_dict(matrix):
         result[source] = {}
         for j, destination in enumerate(CITIES):
             if matrix[i][j] != float('inf'):
-                result[source][destination] = matrix[i][j]
+                result[source][destination] = float(matrix[i][j])
     return result
 
 def paths_to_dict(path_matrix):
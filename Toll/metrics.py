@@ -0,0 +1,164 @@
+# Lightweight request tracing and Prometheus-style metrics
+# Spans time the interesting parts of a request (provider calls, cache and
+# APSP lookups, DB queries, template rendering). Each span feeds a latency
+# histogram and the per-request Server-Timing header; counters track
+# outbound calls, cache hits and routing strategies. Everything lives in
+# process memory and is rendered in the Prometheus text format on /metrics.
+#
+# Metrics are per process. Under gunicorn with several workers on one port,
+# a scrape of /metrics is answered by whichever worker accepts it, so
+# consecutive scrapes mix different workers' counters and none of them is a
+# server total. Scrape per worker instead: run each worker as its own
+# single-worker gunicorn on its own port (WEB_CONCURRENCY=1, BIND=...:8001,
+# :8002, ... behind the reverse proxy), list every port as a Prometheus
+# target, and aggregate across targets in queries, e.g.
+#
+#     sum by (strategy) (rate(smartroute_route_requests_total[5m]))
+#
+# A single-process server (run.py, or one gunicorn worker) needs nothing extra.
+
+from contextlib import contextmanager
+import threading
+import time
+
+from flask import g, has_request_context
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, '')) for label in self.labelnames)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (bound,))} {count}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + ('+Inf',))} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join(f'{n}="{str(v)}"' for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+# ----------------------------------------------------------------------
+# Metrics exported by the app
+# ----------------------------------------------------------------------
+
+REQUEST_SECONDS = Histogram('smartroute_request_seconds', 'HTTP request latency', ('endpoint', 'method', 'status'))
+SPAN_SECONDS = Histogram('smartroute_span_seconds', 'Latency of traced operations', ('span',))
+PROVIDER_CALLS = Counter('smartroute_provider_calls_total', 'Outbound provider calls', ('provider', 'status'))
+CACHE_REQUESTS = Counter('smartroute_cache_requests_total', 'Cache lookups', ('cache', 'result'))
+ROUTING_STRATEGY = Counter('smartroute_routing_strategy_total',
+                           'Strategy chosen per computed (not cached) answer, form and batch', ('strategy',))
+ROUTE_REQUESTS = Counter('smartroute_route_requests_total', 'Route requests answered, by strategy used', ('strategy',))
+HEDGED_REQUESTS = Counter('smartroute_hedged_requests_total', 'Requests hedged to a second provider, by winner', ('winner',))
+RATE_LIMIT_DECISIONS = Counter('smartroute_rate_limit_decisions_total', 'Rate limiter decisions (allowed, denied, downgraded)',
+                               ('limit', 'decision'))
+
+REGISTRY = [REQUEST_SECONDS, SPAN_SECONDS, PROVIDER_CALLS, CACHE_REQUESTS, ROUTING_STRATEGY, ROUTE_REQUESTS,
+            HEDGED_REQUESTS, RATE_LIMIT_DECISIONS]
+
+
+def render_metrics():
+    """All registered metrics in the Prometheus text exposition format"""
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+
+# ----------------------------------------------------------------------
+# Spans
+# ----------------------------------------------------------------------
+
+@contextmanager
+def span(name):
+    """Time a block; recorded in the span histogram and the Server-Timing header"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - started)
+
+
+def record_span(name, seconds):
+    SPAN_SECONDS.observe(seconds, span=name)
+    if has_request_context():
+        spans = g.setdefault('trace_spans', {})
+        total, count = spans.get(name, (0.0, 0))
+        spans[name] = (total + seconds, count + 1)
+
+
+def record_provider_call(provider, status):
+    PROVIDER_CALLS.inc(provider=provider, status=status)
+
+
+def provider_error_status(error):
+    """Status label for a failed provider call (HTTP code, API status or 'error')"""
+    return getattr(error, 'status_code', None) or getattr(error, 'status', None) or 'error'
+
+
+def record_cache(cache, hit):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def server_timing_header(total_seconds):
+    """Server-Timing value: one entry per span name plus the request total"""
+    entries = []
+    spans = g.get('trace_spans', {}) if has_request_context() else {}
+    for name, (seconds, count) in spans.items():
+        entry = f"{name.replace('.', '-')};dur={seconds * 1000:.1f}"
+        if count > 1:
+            entry += f';desc="{count} calls"'
+        entries.append(entry)
+    entries.append(f"total;dur={total_seconds * 1000:.1f}")
+    return ', '.join(entries)
@@ -1,22 +1,116 @@
-from Toll import db,app,login_manager
-from Toll import bcrypt
+from Toll import db,login_manager
 from flask_login import UserMixin
+from datetime import datetime
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from Toll.identity import user_cache, password_hasher
 
 @login_manager.user_loader
 def load_user(user_id):
     try:
-        return UserInput.query.get(int(user_id))
+        user_id = int(user_id)
     except (ValueError, TypeError):
         return None
+
+    # Served from the short-TTL cache: no DB round-trip per request
+    columns = user_cache.get(user_id)
+    if columns is not None:
+        user = UserInput(**columns)
+        make_transient_to_detached(user)
+        return user
+
+    user = UserInput.query.get(user_id)
+    if user is not None:
+        user_cache.put(user_id, {c.key: getattr(user, c.key) for c in UserInput.__table__.columns})
+    return user
  
 class RouteData(db.Model):
+    # One directed city-to-city edge; written through Toll.edge_store
     __tablename__='route_data'
+    __table_args__ = (
+        db.Index('ix_route_data_source_destination', 'source', 'destination', unique=True),
+    )
     id = db.Column(db.Integer, primary_key=True)
     source = db.Column(db.String(50), nullable=False)
     destination = db.Column(db.String(50), nullable=False)
     time = db.Column(db.Float, nullable=False)
     distance = db.Column(db.Float, nullable=False)
     toll = db.Column(db.Float, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class BuildPair(db.Model):
+    # Checkpoint of one city pair in a resumable matrix build; written through Toll.build_jobs
+    __tablename__ = 'build_pair'
+    __table_args__ = (
+        db.Index('ix_build_pair_job_pair', 'job', 'source', 'destination', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    job = db.Column(db.String(50), nullable=False)
+    source = db.Column(db.String(50), nullable=False)
+    destination = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(10), nullable=False, default='pending')  # pending / fetched / failed
+    distance = db.Column(db.Float)
+    time = db.Column(db.Float)
+    toll = db.Column(db.Float)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.String(200))
+    fetched_at = db.Column(db.DateTime)
+
+class PairPopularity(db.Model):
+    # Exponentially decayed query count of one edge; written through Toll.refresh_scheduler
+    __tablename__ = 'pair_popularity'
+    __table_args__ = (
+        db.Index('ix_pair_popularity_source_destination', 'source', 'destination', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)
+    destination = db.Column(db.String(50), nullable=False)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class TravelStat(db.Model):
+    # Learned travel time of one pair in one hour of the day; written through Toll.travel_learning
+    __tablename__ = 'travel_stat'
+    __table_args__ = (
+        db.Index('ix_travel_stat_pair_hour', 'source', 'destination', 'hour', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)
+    destination = db.Column(db.String(50), nullable=False)
+    hour = db.Column(db.Integer, nullable=False)
+    hours_mean = db.Column(db.Float, nullable=False)  # EWMA of observed travel time
+    hours_var = db.Column(db.Float, nullable=False, default=0.0)
+    distance_km = db.Column(db.Float, nullable=False)  # EWMA of observed distance
+    samples = db.Column(db.Integer, nullable=False, default=0)
+    rejected = db.Column(db.Integer, nullable=False, default=0)  # outliers in a row
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class RouteGeometry(db.Model):
+    # Overview polyline of a computed route plus simplified zoom levels; written through Toll.geometry
+    __tablename__ = 'route_geometry'
+    __table_args__ = (
+        db.Index('ix_route_geometry_pair_preference', 'source', 'destination', 'preference', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(50), nullable=False)
+    destination = db.Column(db.String(50), nullable=False)
+    preference = db.Column(db.String(10), nullable=False)
+    polyline = db.Column(db.Text, nullable=False)  # Google encoded, as received
+    levels = db.Column(db.Text, nullable=False)  # JSON {zoom: encoded polyline}
+    points = db.Column(db.Integer, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+class GeocodedPlace(db.Model):
+    # Coordinates of a place name outside the network; written through Toll.hub_snapping
+    __tablename__ = 'geocoded_place'
+    __table_args__ = (
+        db.Index('ix_geocoded_place_name', 'name', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    lat = db.Column(db.Float, nullable=False)
+    lon = db.Column(db.Float, nullable=False)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
 
 class UserInput(db.Model,UserMixin):
     __tablename__ = 'UserInput'
@@ -32,9 +126,15 @@ class UserInput(db.Model,UserMixin):
     
     @password.setter
     def password(self, plain_text_password):
-        self.password_hash = bcrypt.generate_password_hash(plain_text_password).decode('utf-8')
+        self.password_hash = password_hasher.hash(plain_text_password)
 
     def check_password_correction(self,attempted_password):
-        return bcrypt.check_password_hash(self.password_hash, attempted_password)
+        return password_hasher.check(self.password_hash, attempted_password)
+
+
+@event.listens_for(UserInput, 'after_update')
+@event.listens_for(UserInput, 'after_delete')
+def _invalidate_cached_user(mapper, connection, target):
+    user_cache.invalidate(target.id)
 
 
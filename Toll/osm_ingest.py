@@ -0,0 +1,511 @@
+# Offline road-network ingest from OpenStreetMap extracts
+# Streams an OSM .pbf (via pyosmium) or a GeoJSON extract and writes a compact
+# CSR road graph that the routing engines memory-map, so towns outside the
+# 24-city network can be routed locally instead of paying for Google calls.
+#
+# Memory stays bounded by streaming the input twice:
+#   pass 1 - spill node references of drivable ways into hash-partitioned
+#            temp files and count them bucket by bucket; nodes used twice
+#            (or way endpoints) become graph junctions
+#   pass 2 - split ways at junctions, attach distance/time/toll per segment
+#            and spill the edges to disk in chunks
+# Degree-2 junctions left between consecutive ways are then collapsed.
+#
+# Usage: python -m Toll.osm_ingest india-latest.osm.pbf road_graph/
+
+import json
+import logging
+import math
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default speeds (km/h) per OSM highway class when maxspeed is missing
+HIGHWAY_SPEEDS = {
+    'motorway': 100, 'trunk': 80, 'primary': 65, 'secondary': 55,
+    'tertiary': 45, 'unclassified': 35, 'residential': 25,
+    'motorway_link': 50, 'trunk_link': 45, 'primary_link': 40,
+    'secondary_link': 35, 'tertiary_link': 30,
+    'living_street': 10, 'service': 15, 'road': 30
+}
+DRIVABLE = set(HIGHWAY_SPEEDS)
+NO_ACCESS = {'no', 'private'}
+
+# Entries buffered in memory before spilling to disk
+CHUNK_SIZE = 1_000_000
+NODE_BUCKETS = 64
+
+EARTH_RADIUS_M = 6_371_000
+
+Way = namedtuple('Way', ['keys', 'lats', 'lons', 'tags'])
+RoadGraph = namedtuple('RoadGraph', ['indptr', 'indices', 'distance_m', 'time_s', 'toll',
+                                     'lat', 'lon', 'node_key', 'meta'])
+
+GRAPH_ARRAYS = ('indptr', 'indices', 'distance_m', 'time_s', 'toll', 'lat', 'lon', 'node_key')
+
+
+# ----------------------------------------------------------------------
+# Way filtering and attributes
+# ----------------------------------------------------------------------
+
+def is_drivable(tags):
+    """True for ways cars may use"""
+    if tags.get('highway') not in DRIVABLE or tags.get('area') == 'yes':
+        return False
+    return tags.get('access') not in NO_ACCESS and tags.get('motor_vehicle') not in NO_ACCESS
+
+
+def way_speed_kmh(tags):
+    """Parse maxspeed ('60', '60 km/h', '40 mph'), else the highway class default"""
+    match = re.match(r'\s*(\d+(?:\.\d+)?)\s*(mph)?', tags.get('maxspeed') or '')
+    if match:
+        speed = float(match.group(1))
+        return speed * 1.609 if match.group(2) else speed
+    return HIGHWAY_SPEEDS.get(tags.get('highway'), 30)
+
+
+def way_direction(tags):
+    """1 = forward only, -1 = reverse only, 0 = both ways"""
+    oneway = tags.get('oneway')
+    if oneway in ('yes', 'true', '1'):
+        return 1
+    if oneway == '-1':
+        return -1
+    if tags.get('junction') == 'roundabout' or tags.get('highway') == 'motorway':
+        return 1 if oneway != 'no' else 0
+    return 0
+
+
+def coordinate_key(lat, lon):
+    """Stable int64 node key for GeoJSON input, which has no node ids"""
+    lat_fixed = np.rint((np.asarray(lat) + 90) * 1e7).astype(np.int64)
+    lon_fixed = np.rint((np.asarray(lon) + 180) * 1e7).astype(np.int64)
+    return (lat_fixed << 32) | lon_fixed
+
+
+def haversine_m(lat1, lon1, lat2, lon2):
+    """Vectorized great-circle distance in metres"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + \
+        np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(a))
+
+
+# ----------------------------------------------------------------------
+# Readers - each yields drivable Way tuples and can be iterated twice
+# ----------------------------------------------------------------------
+
+def iter_geojson_ways(path):
+    """
+    Stream LineString features from GeoJSON
+
+    GeoJSONSeq (one feature per line, e.g. `ogr2ogr -f GeoJSONSeq`) is read
+    line by line. A regular FeatureCollection is streamed with ijson when it
+    is installed, otherwise it has to be converted to GeoJSONSeq first.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(4096).lstrip(b'\x1e \t\r\n')
+
+    if head.startswith(b'{') and b'FeatureCollection' in head:
+        try:
+            import ijson
+        except ImportError:
+            raise RuntimeError(
+                f"{path} is a FeatureCollection; install ijson or convert it with "
+                "`ogr2ogr -f GeoJSONSeq out.geojsonl in.geojson`"
+            )
+        with open(path, 'rb') as f:
+            features = ijson.items(f, 'features.item', use_float=True)
+            yield from _geojson_features_to_ways(features)
+    else:
+        def features():
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip().lstrip('\x1e')
+                    if line:
+                        yield json.loads(line)
+        yield from _geojson_features_to_ways(features())
+
+
+def _geojson_features_to_ways(features):
+    for feature in features:
+        geometry = feature.get('geometry') or {}
+        tags = feature.get('properties') or {}
+        if not is_drivable(tags):
+            continue
+        if geometry.get('type') == 'LineString':
+            lines = [geometry['coordinates']]
+        elif geometry.get('type') == 'MultiLineString':
+            lines = geometry['coordinates']
+        else:
+            continue
+        for coords in lines:
+            if len(coords) < 2:
+                continue
+            coords = np.asarray(coords, dtype=np.float64)[:, :2]
+            lons, lats = coords[:, 0], coords[:, 1]
+            yield Way(coordinate_key(lats, lons), lats, lons, tags)
+
+
+def iter_pbf_ways(path, with_locations, index_path=None):
+    """
+    Stream drivable ways from an OSM .pbf with pyosmium
+
+    With locations, node coordinates come from a disk-backed index so the
+    whole node table never sits in RAM.
+    """
+    try:
+        import osmium
+    except ImportError:
+        raise RuntimeError("Reading .pbf extracts needs pyosmium >= 3.7 (pip install osmium)")
+
+    if with_locations:
+        processor = osmium.FileProcessor(path, osmium.osm.NODE | osmium.osm.WAY) \
+            .with_locations(f'sparse_file_array,{index_path}')
+    else:
+        processor = osmium.FileProcessor(path, osmium.osm.WAY)
+
+    for obj in processor:
+        if not obj.is_way():
+            continue
+        tags = dict(obj.tags)
+        if not is_drivable(tags) or len(obj.nodes) < 2:
+            continue
+
+        keys = np.array([n.ref for n in obj.nodes], dtype=np.int64)
+        lats = lons = None
+        if with_locations:
+            try:
+                lats = np.array([n.lat for n in obj.nodes], dtype=np.float64)
+                lons = np.array([n.lon for n in obj.nodes], dtype=np.float64)
+            except osmium.InvalidLocationError:
+                # Way references nodes clipped out of the extract
+                continue
+        yield Way(keys, lats, lons, tags)
+
+
+def open_extract(path, with_locations, index_path=None):
+    """Pick the reader by file extension"""
+    if path.endswith('.pbf'):
+        return iter_pbf_ways(path, with_locations, index_path)
+    return iter_geojson_ways(path)
+
+
+# ----------------------------------------------------------------------
+# Ingest
+# ----------------------------------------------------------------------
+
+def ingest(extract_path, output_dir, work_dir=None):
+    """
+    Convert an OSM extract into a CSR road graph directory
+
+    Args:
+        extract_path (str): .osm.pbf, .geojson or .geojsonl file
+        output_dir (str): Directory receiving the .npy arrays and meta.json
+        work_dir (str): Scratch space for spill files, defaults to a temp dir
+
+    Returns:
+        dict: Summary statistics written to meta.json
+    """
+    started = time.time()
+    work_dir = tempfile.mkdtemp(prefix='osm_ingest_', dir=work_dir)
+    try:
+        junctions = _find_junctions(extract_path, work_dir)
+        print(f"Pass 1: {len(junctions):,} junction nodes ({time.time() - started:.0f}s)")
+
+        edges, lat, lon = _split_ways(extract_path, junctions, work_dir)
+        print(f"Pass 2: {len(edges['u']):,} directed segments ({time.time() - started:.0f}s)")
+
+        edges, keep = _collapse_degree_two(len(junctions), edges)
+        print(f"Collapsed {int((~keep).sum()):,} degree-2 nodes ({time.time() - started:.0f}s)")
+
+        meta = _write_graph(output_dir, edges, keep, lat, lon, junctions, extract_path)
+        print(f"💾 Road graph with {meta['nodes']:,} nodes and {meta['edges']:,} edges "
+              f"saved to {output_dir} ({time.time() - started:.0f}s)")
+        return meta
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _find_junctions(extract_path, work_dir):
+    """Pass 1: sorted int64 keys of nodes that start/end a graph edge"""
+    bucket_files = [open(os.path.join(work_dir, f'refs_{b}.bin'), 'wb') for b in range(NODE_BUCKETS)]
+    pending = []
+    pending_size = 0
+
+    def spill():
+        keys = np.concatenate(pending)
+        buckets = keys % NODE_BUCKETS
+        order = np.argsort(buckets, kind='stable')
+        bounds = np.searchsorted(buckets[order], np.arange(NODE_BUCKETS + 1))
+        for b in range(NODE_BUCKETS):
+            keys[order[bounds[b]:bounds[b + 1]]].tofile(bucket_files[b])
+        pending.clear()
+
+    try:
+        for way in open_extract(extract_path, with_locations=False):
+            # Endpoints are written twice so they always count as junctions
+            pending.append(way.keys)
+            pending.append(way.keys[[0, -1]])
+            pending_size += len(way.keys) + 2
+            if pending_size >= CHUNK_SIZE:
+                spill()
+                pending_size = 0
+        if pending:
+            spill()
+    finally:
+        for f in bucket_files:
+            f.close()
+
+    junctions = []
+    for b in range(NODE_BUCKETS):
+        path = os.path.join(work_dir, f'refs_{b}.bin')
+        keys, counts = np.unique(np.fromfile(path, dtype=np.int64), return_counts=True)
+        junctions.append(keys[counts >= 2])
+        os.remove(path)
+    return np.sort(np.concatenate(junctions))
+
+
+def _split_ways(extract_path, junctions, work_dir):
+    """Pass 2: spill one directed edge per way segment between junctions"""
+    n = len(junctions)
+    lat = np.zeros(n, dtype=np.float32)
+    lon = np.zeros(n, dtype=np.float32)
+    columns = {'u': np.int32, 'v': np.int32, 'distance_m': np.float32, 'time_s': np.float32, 'toll': np.uint8}
+    spill_files = {name: open(os.path.join(work_dir, f'edges_{name}.bin'), 'wb') for name in columns}
+    buffer = {name: [] for name in columns}
+    buffered = 0
+    index_path = os.path.join(work_dir, 'node_locations.idx')
+
+    def spill():
+        for name, dtype in columns.items():
+            np.concatenate(buffer[name]).astype(dtype).tofile(spill_files[name])
+            buffer[name].clear()
+
+    # No junctions (an empty or way-less extract): no segments, and nothing to index into
+    ways = open_extract(extract_path, with_locations=True, index_path=index_path) if n else ()
+    try:
+        for way in ways:
+            pos = np.searchsorted(junctions, way.keys)
+            is_junction = junctions[np.minimum(pos, n - 1)] == way.keys
+            split = np.flatnonzero(is_junction)
+            if len(split) < 2:
+                continue
+
+            lat[pos[split]] = way.lats[split]
+            lon[pos[split]] = way.lons[split]
+
+            cumulative = np.concatenate(([0.0], np.cumsum(
+                haversine_m(way.lats[:-1], way.lons[:-1], way.lats[1:], way.lons[1:]))))
+            starts, ends = pos[split[:-1]], pos[split[1:]]
+            distance = cumulative[split[1:]] - cumulative[split[:-1]]
+            seconds = distance / (way_speed_kmh(way.tags) / 3.6)
+            toll = np.full(len(distance), way.tags.get('toll') == 'yes')
+
+            direction = way_direction(way.tags)
+            if direction >= 0:
+                for name, values in zip(columns, (starts, ends, distance, seconds, toll)):
+                    buffer[name].append(values)
+            if direction <= 0:
+                for name, values in zip(columns, (ends, starts, distance, seconds, toll)):
+                    buffer[name].append(values)
+            buffered += len(distance)
+            if buffered >= CHUNK_SIZE:
+                spill()
+                buffered = 0
+        if buffer['u']:
+            spill()
+    finally:
+        for f in spill_files.values():
+            f.close()
+
+    edges = {name: np.fromfile(os.path.join(work_dir, f'edges_{name}.bin'), dtype=dtype)
+             for name, dtype in columns.items()}
+    return edges, lat, lon
+
+
+def _collapse_degree_two(n, edges):
+    """
+    Merge chains through nodes with exactly two neighbours
+
+    A node is collapsed only when its edges run consistently through it
+    (p -> x -> q, the reverse, or both), so one-way restrictions survive.
+
+    Returns:
+        tuple: (merged edges, boolean mask of nodes that remain)
+    """
+    u, v = edges['u'].astype(np.int64), edges['v'].astype(np.int64)
+    loops = u == v
+    if loops.any():
+        edges = {name: values[~loops] for name, values in edges.items()}
+        u, v = u[~loops], v[~loops]
+
+    # Distinct undirected neighbours per node
+    pair_key = np.unique(np.minimum(u, v) * n + np.maximum(u, v))
+    degree = np.bincount(pair_key // n, minlength=n) + np.bincount(pair_key % n, minlength=n)
+
+    order = np.argsort(u, kind='stable')
+    edges = {name: values[order] for name, values in edges.items()}
+    u, v = u[order], v[order]
+    out_ptr = np.searchsorted(u, np.arange(n + 1))
+    in_count = np.bincount(v, minlength=n)
+    out_count = np.diff(out_ptr)
+
+    # Collapsible: two neighbours and either one edge in/one out, or two each
+    collapsible = (degree == 2) & (((in_count == 1) & (out_count == 1)) | ((in_count == 2) & (out_count == 2)))
+    collapsible &= _consistent_through(n, u, v, out_ptr, collapsible)
+
+    dist = edges['distance_m'].astype(np.float64)
+    secs = edges['time_s'].astype(np.float64)
+    toll = edges['toll'].astype(bool)
+    end = v.copy()
+
+    # Edge continuing each edge through a collapsible head (-1 at a kept node):
+    # the head's only out edge, or of its two the one not turning back
+    through = np.flatnonzero(collapsible[v])
+    first = out_ptr[v[through]]
+    nxt = np.full(len(v), -1, dtype=np.int64)
+    nxt[through] = first + ((out_count[v[through]] == 2) & (v[first] == u[through]))
+
+    # Pointer jumping: every round each edge adds the totals of the edge it
+    # points to and skips past it, so a chain of length L is summed in
+    # log2(L) vectorized rounds. Chains start on edges leaving kept nodes and
+    # always end at one; edges of isolated all-collapsible cycles never
+    # finish and are ignored.
+    starts = np.flatnonzero(~collapsible[u])
+    while (nxt[starts] >= 0).any():
+        jumping = np.flatnonzero(nxt >= 0)
+        ahead = nxt[jumping]
+        dist[jumping] += dist[ahead]
+        secs[jumping] += secs[ahead]
+        toll[jumping] |= toll[ahead]
+        end[jumping] = end[ahead]
+        nxt[jumping] = nxt[ahead]
+
+    merged = {'u': u[starts], 'v': end[starts], 'distance_m': dist[starts], 'time_s': secs[starts],
+              'toll': toll[starts]}
+    return {name: values.astype(edges[name].dtype) for name, values in merged.items()}, ~collapsible
+
+
+def _consistent_through(n, u, v, out_ptr, candidates):
+    """2-in/2-out candidates must send their two edges to different neighbours"""
+    ok = np.ones(n, dtype=bool)
+    two_way = np.flatnonzero(candidates & (np.diff(out_ptr) == 2))
+    if not len(two_way):
+        return ok
+
+    first_out = v[out_ptr[two_way]]
+    second_out = v[out_ptr[two_way] + 1]
+
+    in_order = np.argsort(v, kind='stable')
+    in_ptr = np.searchsorted(v[in_order], np.arange(n + 1))
+    first_in = u[in_order][in_ptr[two_way]]
+    second_in = u[in_order][in_ptr[two_way] + 1]
+
+    ok[two_way] = (first_out != second_out) & (first_in != second_in)
+    return ok
+
+
+def _write_graph(output_dir, edges, keep, lat, lon, junctions, extract_path):
+    """Renumber kept nodes, keep the fastest parallel edge and write CSR arrays"""
+    new_id = np.cumsum(keep) - 1
+    n = int(keep.sum())
+    u = new_id[edges['u']]
+    v = new_id[edges['v']]
+
+    order = np.lexsort((edges['time_s'], v, u))
+    u, v = u[order], v[order]
+    first = np.ones(len(u), dtype=bool)
+    first[1:] = (u[1:] != u[:-1]) | (v[1:] != v[:-1])
+
+    arrays = {
+        'indptr': np.searchsorted(u[first], np.arange(n + 1)).astype(np.int64),
+        'indices': v[first].astype(np.int32),
+        'distance_m': edges['distance_m'][order][first],
+        'time_s': edges['time_s'][order][first],
+        'toll': edges['toll'][order][first],
+        'lat': lat[keep],
+        'lon': lon[keep],
+        'node_key': junctions[keep]
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in GRAPH_ARRAYS:
+        np.save(os.path.join(output_dir, f'{name}.npy'), arrays[name])
+
+    meta = {
+        'source': os.path.basename(extract_path),
+        'nodes': n,
+        'edges': int(first.sum()),
+        'built_at': time.strftime('%Y-%m-%d %H:%M:%S')
+    }
+    with open(os.path.join(output_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    return meta
+
+
+# ----------------------------------------------------------------------
+# Loading
+# ----------------------------------------------------------------------
+
+def load_road_graph(graph_dir):
+    """Memory-map a road graph written by ingest()"""
+    with open(os.path.join(graph_dir, 'meta.json')) as f:
+        meta = json.load(f)
+    arrays = {name: np.load(os.path.join(graph_dir, f'{name}.npy'), mmap_mode='r') for name in GRAPH_ARRAYS}
+    return RoadGraph(meta=meta, **arrays)
+
+
+def build_road_hierarchy(graph_dir, weight='time_s'):
+    """Contract a road graph for fast queries and save it next to the arrays"""
+    from Toll.contraction_hierarchy import ContractionHierarchy
+
+    graph = load_road_graph(graph_dir)
+    hierarchy = ContractionHierarchy.build(graph.indptr, graph.indices, getattr(graph, weight))
+    hierarchy.save(os.path.join(graph_dir, f'ch_{weight}.npz'))
+    return hierarchy
+
+
+def road_lower_bound(graph, weight='time_s'):
+    """
+    Admissible bound over a road graph's nodes, for ContractionHierarchy.query(lower_bound=...)
+
+    Time uses the graph's own top edge speed rather than the cost model's
+    MAX_SPEED_KMH, since maxspeed tags can exceed it.
+    """
+    from Toll.cost_model import node_lower_bound
+
+    if weight == 'distance_m':
+        return node_lower_bound(graph.lat, graph.lon, 'distance', scale=1000)
+    if weight == 'time_s':
+        moving = graph.time_s > 0
+        top_kmh = 3.6 * float(np.max(graph.distance_m[moving] / graph.time_s[moving])) if moving.any() else np.inf
+        return node_lower_bound(graph.lat, graph.lon, 'distance', scale=3600 / top_kmh)
+    return node_lower_bound(graph.lat, graph.lon, 'toll')
+
+
+def nearest_node(graph, lat, lon, chunk=CHUNK_SIZE):
+    """Closest graph node to a point, scanning the memory-mapped coordinates in chunks"""
+    best_idx, best_dist = -1, math.inf
+    for start in range(0, len(graph.lat), chunk):
+        d = haversine_m(lat, lon, graph.lat[start:start + chunk], graph.lon[start:start + chunk])
+        i = int(np.argmin(d))
+        if d[i] < best_dist:
+            best_idx, best_dist = start + i, float(d[i])
+    return best_idx, best_dist
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("Usage: python -m Toll.osm_ingest <extract.osm.pbf|.geojson|.geojsonl> <output_dir>")
+        sys.exit(1)
+    logging.basicConfig(level=logging.INFO)
+    ingest(sys.argv[1], sys.argv[2])
@@ -0,0 +1,162 @@
+# On-demand profiling of live requests
+# A selected request gets a background stack sampler (collapsed stacks, ready
+# for flamegraph.pl or speedscope) and, optionally, a tracemalloc diff of the
+# allocations it made. Requests are selected by an admin header or sampled by
+# rate; both can be changed at runtime through /admin/profiling.
+#
+# Configuration (environment, read at startup):
+#   PROFILE_TOKEN        secret for the X-Profile header and /admin/profiling
+#   PROFILE_SAMPLE_RATE  fraction of requests profiled automatically (default 0)
+#   PROFILE_DIR          output directory (default 'profiles')
+#   PROFILE_INTERVAL_MS  stack sampling interval (default 5)
+#   PROFILE_ALLOCATIONS  '1' to also record tracemalloc allocation reports
+
+from collections import Counter
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+
+logger = logging.getLogger(__name__)
+
+TOP_ALLOCATIONS = 25
+
+
+class ProfilingSettings:
+    def __init__(self):
+        self.token = os.getenv('PROFILE_TOKEN')
+        self.sample_rate = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+        self.output_dir = os.getenv('PROFILE_DIR', 'profiles')
+        self.interval = float(os.getenv('PROFILE_INTERVAL_MS', 5)) / 1000
+        self.allocations = os.getenv('PROFILE_ALLOCATIONS', '') == '1'
+
+    def as_dict(self):
+        return {
+            'sample_rate': self.sample_rate,
+            'output_dir': self.output_dir,
+            'interval_ms': self.interval * 1000,
+            'allocations': self.allocations
+        }
+
+
+settings = ProfilingSettings()
+
+
+class StackSampler:
+    """Samples one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format, one 'a;b;c count' per line"""
+        return '\n'.join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + '\n'
+
+
+class _TracemallocUsers:
+    """Reference count so overlapping profiled requests share one tracemalloc session"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._users = 0
+        self._started_here = False
+
+    def acquire(self):
+        with self._lock:
+            if self._users == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(25)
+                self._started_here = True
+            self._users += 1
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            if self._users == 0 and self._started_here:
+                tracemalloc.stop()
+                self._started_here = False
+
+
+_tracemalloc_users = _TracemallocUsers()
+
+
+class RequestProfile:
+    """Profiling state attached to one request"""
+
+    def __init__(self, label, allocations):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.label = label
+        self.started = time.perf_counter()
+        self.sampler = StackSampler(threading.get_ident(), settings.interval).start()
+        self.snapshot = None
+        if allocations:
+            _tracemalloc_users.acquire()
+            self.snapshot = tracemalloc.take_snapshot()
+
+    def finish(self):
+        """Stop sampling and write the report files; returns the collapsed-stack path"""
+        self.sampler.stop()
+        elapsed = time.perf_counter() - self.started
+        after = None
+        if self.snapshot is not None:
+            # Before any file I/O: a failed write must not leave tracemalloc on for good
+            try:
+                after = tracemalloc.take_snapshot()
+            finally:
+                _tracemalloc_users.release()
+
+        os.makedirs(settings.output_dir, exist_ok=True)
+        base = os.path.join(settings.output_dir, f"{self.id}_{self.label}")
+
+        with open(base + '.collapsed', 'w') as f:
+            f.write(self.sampler.collapsed())
+
+        if after is not None:
+            filters = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            diff = after.filter_traces(filters).compare_to(self.snapshot.filter_traces(filters), 'lineno')
+            with open(base + '.alloc.txt', 'w') as f:
+                f.write(f"Top {TOP_ALLOCATIONS} allocation changes during {self.label} ({elapsed * 1000:.1f} ms)\n\n")
+                for stat in diff[:TOP_ALLOCATIONS]:
+                    f.write(f"{stat}\n")
+
+        logger.info(f"Profile {self.id} ({elapsed * 1000:.1f} ms, {sum(self.sampler.stacks.values())} samples) "
+                    f"written to {base}.*")
+        return base + '.collapsed'
+
+
+def should_profile(header_token):
+    """Profile this request? An admin header always wins, otherwise sample by rate"""
+    if header_token and settings.token and header_token == settings.token:
+        return True
+    return settings.sample_rate > 0 and random.random() < settings.sample_rate
+
+
+def start_profile(label):
+    return RequestProfile(label, settings.allocations)
@@ -0,0 +1,212 @@
+# Live routing providers with tail-latency hedging
+# Directions (direct_routing) is the primary provider and the Routes API the
+# secondary. A request goes to the primary first; if it has not answered by
+# the primary's recently observed p90 latency, the same request is sent to the
+# secondary and the first valid answer wins. A hedge budget caps hedges to a
+# fraction of requests, so the slowest ~10% are rescued without doubling
+# quota spend. Without a usable Routes API key there is no secondary: no
+# hedging, no failover.
+#
+# Every request has a total deadline; a provider that hangs past it is left
+# running on its pool thread and the request gets None, never a stuck thread.
+#
+# Configuration (environment, read at startup):
+#   HEDGE_MAX_RATIO        hedges allowed per primary request (default 0.1)
+#   HEDGE_PERCENTILE       primary latency percentile that triggers a hedge (default 90)
+#   HEDGE_MIN_DELAY_MS     lower clamp on the hedge delay (default 100)
+#   HEDGE_MAX_DELAY_MS     upper clamp, also used until enough samples exist (default 3000)
+#   PROVIDER_DEADLINE_MS   longest a request waits for any provider (default 15000)
+
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from Toll.direct_routing import get_direct_route
+from Toll.metrics import HEDGED_REQUESTS
+from Toll.routes_api import RoutesAPI, routes_api_configured
+
+logger = logging.getLogger(__name__)
+
+HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', 0.1))
+HEDGE_PERCENTILE = float(os.getenv('HEDGE_PERCENTILE', 90))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY_MS', 100)) / 1000
+HEDGE_MAX_DELAY = float(os.getenv('HEDGE_MAX_DELAY_MS', 3000)) / 1000
+DEADLINE = float(os.getenv('PROVIDER_DEADLINE_MS', 15000)) / 1000
+MIN_SAMPLES = 20
+
+
+class LatencyTracker:
+    """Sliding window of a provider's successful call latencies"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """Latency at `pct` over the window, or None with too few samples"""
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class HedgeBudget:
+    """
+    Token bucket limiting hedges to a fraction of requests
+
+    Each primary request earns `ratio` tokens (up to `burst`); a hedge spends one.
+    """
+
+    def __init__(self, ratio=HEDGE_MAX_RATIO, burst=5):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = burst
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class Provider:
+    """
+    A live routing provider
+
+    fetch(source, destination, preference) returns a route dict shaped like
+    get_direct_route's, or None when the provider has no valid answer.
+    """
+
+    def __init__(self, name, fetch):
+        self.name = name
+        self.fetch = fetch
+        self.latency = LatencyTracker()
+
+    def call(self, source, destination, preference):
+        started = time.perf_counter()
+        result = self.fetch(source, destination, preference)
+        if result:
+            self.latency.observe(time.perf_counter() - started)
+        return result
+
+
+# One client for every secondary call: a shared connection pool and, with the
+# local stand-ins, one latency/error/429 stream rather than a fresh seed per call
+_routes_api = RoutesAPI()
+
+
+def _routes_api_route(source, destination, preference):
+    """Routes API answer in get_direct_route's shape; None instead of static fallback"""
+    data = _routes_api.get_route_with_tolls(source, destination, preference, fallback=False)
+    if not data or not data.get('route_found'):
+        return None
+    return {
+        'route': [source, destination],
+        'distance_km': data['distance_km'],
+        'duration_hours': data['duration_hours'],
+        'toll_cost': data['toll_cost_inr'] or data['distance_km'] * 2.5,
+        'highways': [],
+        'is_direct': True,
+        'api_calls_used': 1,
+        'data_source': 'Google Routes API'
+    }
+
+
+class HedgedRouter:
+    def __init__(self, primary, secondary=None, budget=None, max_workers=16, deadline=DEADLINE):
+        self.primary = primary
+        self.secondary = secondary
+        self.budget = budget or HedgeBudget()
+        self.deadline = deadline
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='hedge')
+
+    def hedge_delay(self):
+        """How long to give the primary before hedging"""
+        observed = self.primary.latency.percentile(HEDGE_PERCENTILE)
+        if observed is None:
+            return HEDGE_MAX_DELAY
+        return min(HEDGE_MAX_DELAY, max(HEDGE_MIN_DELAY, observed))
+
+    def _submit(self, provider, source, destination, preference):
+        # Run in a copy of the caller's context, so provider spans reach the
+        # request's Server-Timing header
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, self._safe_call, provider, source, destination, preference)
+
+    def get_route(self, source, destination, preference):
+        """
+        First valid route from the primary or, when it is slow, the secondary
+
+        Returns:
+            dict: Route data tagged with 'provider' and 'hedged', or None
+                  (also when no provider answered within the deadline)
+        """
+        deadline = time.monotonic() + self.deadline
+        self.budget.earn()
+        calls = {self._submit(self.primary, source, destination, preference): self.primary}
+
+        done, _ = wait(calls, timeout=min(self.hedge_delay(), self.deadline))
+        hedged = False
+        if not done and self.secondary is not None and self.budget.try_spend():
+            hedged = True
+            calls[self._submit(self.secondary, source, destination, preference)] = self.secondary
+            logger.info(f"Hedging {source} → {destination}: {self.primary.name} slower than "
+                        f"{self.hedge_delay() * 1000:.0f} ms")
+
+        pending = set(calls)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"No provider answered {source} → {destination} within {self.deadline:.1f}s")
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if result:
+                    provider = calls[future]
+                    if hedged:
+                        HEDGED_REQUESTS.inc(winner=provider.name)
+                    # Every call launched for this request costs quota: hedge and failover included
+                    return dict(result, provider=provider.name, hedged=hedged, api_calls_used=len(calls))
+            if not pending and self.secondary is not None and self.secondary not in calls.values():
+                # Primary failed outright: fail over once (not a hedge, no budget)
+                calls[self._submit(self.secondary, source, destination, preference)] = self.secondary
+                pending = {f for f, p in calls.items() if p is self.secondary}
+
+        if hedged:
+            HEDGED_REQUESTS.inc(winner='none')
+        return None
+
+    @staticmethod
+    def _safe_call(provider, source, destination, preference):
+        try:
+            return provider.call(source, destination, preference)
+        except Exception as e:
+            logger.error(f"{provider.name} failed for {source} → {destination}: {e}")
+            return None
+
+
+directions_provider = Provider('directions', get_direct_route)
+# No key, no secondary: unauthenticated calls would only fail after a round trip
+routes_api_provider = Provider('routes_api', _routes_api_route) if routes_api_configured() else None
+hedged_router = HedgedRouter(directions_provider, routes_api_provider)
+
+
+def get_hedged_route(source, destination, preference='distance'):
+    """Live route from the fastest valid provider; drop-in for get_direct_route"""
+    return hedged_router.get_route(source, destination, preference)
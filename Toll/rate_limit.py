@@ -0,0 +1,231 @@
+# Per-user and per-IP request rate limiting
+# Every limited request takes one token from two buckets, one for the
+# logged-in user and one for the client address; each bucket holds up to
+# `burst` tokens and refills at `per_minute`. A request goes through only
+# when both buckets have a token, so a single account cannot spread its
+# load over many addresses, and one address cannot spread it over many
+# accounts.
+#
+# What happens over the limit depends on the endpoint:
+#   /api/city-search,  429 with a Retry-After header
+#   /api/route,
+#   /api/routes/batch  (one token per batch, taken after authentication)
+#   /get_the_route     answered from the precomputed/static matrices, or the
+#                      cost model off them, without any provider call (and not
+#                      cached, so the next allowed request gets the live answer)
+# Cached route answers cost no tokens - only computing one does.
+#
+# Buckets live in process memory by default, so each gunicorn worker allows
+# its own share. Set RATE_LIMIT_STORE to a file path to share them between
+# the workers of one host through a small SQLite database.
+# Decisions are counted in smartroute_rate_limit_decisions_total on /metrics.
+#
+# Behind a reverse proxy every request arrives from the proxy's address, so
+# all clients would share one IP bucket. Set TRUSTED_PROXY_COUNT to the number
+# of proxies in front of the app: create_app() then wraps it in werkzeug's
+# ProxyFix, which takes the client address from X-Forwarded-For (trusting only
+# that many hops, so clients cannot spoof it). Leave it at 0 when clients
+# connect directly, or X-Forwarded-For would let them pick their own bucket.
+#
+# Configuration (environment, read at startup):
+#   RATE_LIMIT_ENABLED       '0' turns all limits off (default '1')
+#   RATE_LIMIT_STORE         'memory' (default) or a SQLite file path
+#   TRUSTED_PROXY_COUNT      reverse proxies in front of the app (default 0, read by __init__.py)
+#   ROUTE_RATE_PER_MIN       route computations per minute (default 10)
+#   ROUTE_RATE_BURST         route computations allowed back to back (default 20)
+#   SEARCH_RATE_PER_MIN      city searches per minute (default 120)
+#   SEARCH_RATE_BURST        city searches allowed back to back (default 60)
+
+from collections import OrderedDict
+from functools import wraps
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from flask import jsonify, request
+from flask_login import current_user
+
+from Toll.metrics import RATE_LIMIT_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.getenv('RATE_LIMIT_ENABLED', '1') != '0'
+STORE = os.getenv('RATE_LIMIT_STORE', 'memory')
+ROUTE_RATE_PER_MIN = float(os.getenv('ROUTE_RATE_PER_MIN', 10))
+ROUTE_RATE_BURST = float(os.getenv('ROUTE_RATE_BURST', 20))
+SEARCH_RATE_PER_MIN = float(os.getenv('SEARCH_RATE_PER_MIN', 120))
+SEARCH_RATE_BURST = float(os.getenv('SEARCH_RATE_BURST', 60))
+
+# Buckets kept per process by the memory store; an evicted bucket starts full again
+MEMORY_STORE_SIZE = 10000
+
+
+def _refill(tokens, updated, now, burst, per_second):
+    return min(burst, tokens + (now - updated) * per_second)
+
+
+class MemoryBucketStore:
+    """Token buckets in this process, least recently used evicted first"""
+
+    def __init__(self, maxsize=MEMORY_STORE_SIZE):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()  # key -> (tokens, updated)
+        self._lock = threading.Lock()
+
+    def take(self, keys, burst, per_second, now=None):
+        """
+        Take a token from every bucket, or from none
+
+        Returns:
+            float: 0 if taken, else seconds until all buckets have a token
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            levels = [_refill(*self._buckets.get(key, (burst, now)), now, burst, per_second) for key in keys]
+            wait = max((1 - level) / per_second for level in levels)
+            for key, level in zip(keys, levels):
+                self._buckets[key] = (level - 1 if wait <= 0 else level, now)
+                self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return max(0.0, wait)
+
+
+class SqliteBucketStore:
+    """Token buckets shared by every process on the host through a SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS bucket (key TEXT PRIMARY KEY, tokens REAL, updated REAL)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def take(self, keys, burst, per_second, now=None):
+        """Same contract as MemoryBucketStore.take"""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            placeholders = ','.join('?' * len(keys))
+            stored = {key: (tokens, updated) for key, tokens, updated in conn.execute(
+                f'SELECT key, tokens, updated FROM bucket WHERE key IN ({placeholders})', keys)}
+            levels = [_refill(*stored.get(key, (burst, now)), now, burst, per_second) for key in keys]
+            wait = max((1 - level) / per_second for level in levels)
+            conn.executemany('INSERT OR REPLACE INTO bucket (key, tokens, updated) VALUES (?, ?, ?)',
+                             [(key, level - 1 if wait <= 0 else level, now) for key, level in zip(keys, levels)])
+            conn.execute('COMMIT')
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        return max(0.0, wait)
+
+
+def _default_store():
+    if STORE == 'memory':
+        return MemoryBucketStore()
+    return SqliteBucketStore(STORE)
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = _default_store()
+        return _store
+
+
+class RateLimiter:
+    """Per-user and per-IP token buckets for one class of request"""
+
+    def __init__(self, name, per_minute, burst, store=None):
+        self.name = name
+        self.per_second = per_minute / 60
+        self.burst = burst
+        self._store = store
+
+    @property
+    def store(self):
+        return self._store or get_store()
+
+    def keys(self, user_id=None, ip=None):
+        keys = []
+        if user_id is not None:
+            keys.append(f'{self.name}:user:{user_id}')
+        if ip:
+            keys.append(f'{self.name}:ip:{ip}')
+        return keys
+
+    def check(self, user_id=None, ip=None):
+        """
+        Take a token for a request
+
+        Returns:
+            float: 0 if allowed, else seconds to wait before retrying
+        """
+        keys = self.keys(user_id, ip)
+        if not ENABLED or not keys:
+            return 0.0
+        try:
+            return self.store.take(keys, self.burst, self.per_second)
+        except sqlite3.Error as e:
+            # A broken shared store must not take the site down with it
+            logger.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return 0.0
+
+    def check_request(self, over_limit='denied'):
+        """
+        Take a token for the current request and count the decision
+
+        Args:
+            over_limit (str): Decision label recorded when the request is over
+                              the limit ('denied' or 'downgraded')
+
+        Returns:
+            float: 0 if allowed, else seconds to wait before retrying
+        """
+        user_id = current_user.get_id() if current_user.is_authenticated else None
+        wait = self.check(user_id, request.remote_addr)
+        RATE_LIMIT_DECISIONS.inc(limit=self.name, decision=over_limit if wait else 'allowed')
+        if wait:
+            logger.info(f"Rate limit '{self.name}' {over_limit} user={user_id} ip={request.remote_addr}")
+        return wait
+
+
+route_limiter = RateLimiter('route', ROUTE_RATE_PER_MIN, ROUTE_RATE_BURST)
+search_limiter = RateLimiter('search', SEARCH_RATE_PER_MIN, SEARCH_RATE_BURST)
+
+
+def too_many_requests(wait):
+    """429 Too Many Requests response telling the client when to retry"""
+    response = jsonify({'error': 'Too many requests', 'retry_after': math.ceil(wait)})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(math.ceil(wait))
+    return response
+
+
+def limit(limiter):
+    """View decorator answering over-limit requests with 429 Too Many Requests"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            wait = limiter.check_request()
+            if wait:
+                return too_many_requests(wait)
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
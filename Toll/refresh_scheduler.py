@@ -0,0 +1,284 @@
+# Popularity-driven refresh of stale network edges
+# Instead of rebuilding every matrix at once, the edges users actually route
+# over are refreshed a few at a time. Each answered route credits its legs in
+# an exponentially decayed popularity score (pair_popularity); route_data's
+# fetched_at gives each edge's age. On every tick the scheduler spends its
+# share of a daily API budget on the network edges with the highest
+#
+#     popularity x staleness (hours since fetched, 0 while younger than REFRESH_MIN_AGE_H)
+#
+# upserts the answers into the edge store and re-runs the all-pairs step on
+# the stored edges, replacing precomputed_routes.json. Workers pick up the
+# new file on their next check (SmartRouter reloads it when it changes).
+# Each tick also applies travel times learned from live answers
+# (travel_learning.py), which costs no API calls.
+#
+# Workers only buffer popularity in memory and flush it every
+# POPULARITY_FLUSH_S; concurrent flushes of one pair may drop a few hits,
+# which is fine for a ranking signal.
+#
+# Configuration (environment, read at startup):
+#   REFRESH_DAILY_BUDGET     provider calls per 24 h for refreshes (default 200)
+#   REFRESH_INTERVAL_S       seconds between scheduler ticks (default 900)
+#   REFRESH_MIN_AGE_H        edges younger than this are never refreshed (default 24)
+#   POPULARITY_HALF_LIFE_DAYS  decay of query counts (default 7)
+#   POPULARITY_FLUSH_S       how often a worker writes its counts (default 60)
+#   REFRESH_SCHEDULER        '1' runs the scheduler thread inside the dev server
+#                            (Toll/run.py, single process). Under gunicorn it is
+#                            ignored: run `python -m Toll.refresh_scheduler` as
+#                            its own process, the only supported way there
+#
+# Usage: python -m Toll.refresh_scheduler [--once] [--dry-run]
+
+from collections import Counter, deque
+from datetime import datetime
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from Toll import db
+from Toll.city_network import CITIES
+from Toll.edge_store import _app_context, load_edge_tensor, normalize_city, upsert_edges
+from Toll.models import PairPopularity, RouteData
+
+logger = logging.getLogger(__name__)
+
+DAILY_BUDGET = int(os.getenv('REFRESH_DAILY_BUDGET', 200))
+INTERVAL_S = float(os.getenv('REFRESH_INTERVAL_S', 900))
+MIN_AGE_H = float(os.getenv('REFRESH_MIN_AGE_H', 24))
+HALF_LIFE_DAYS = float(os.getenv('POPULARITY_HALF_LIFE_DAYS', 7))
+FLUSH_S = float(os.getenv('POPULARITY_FLUSH_S', 60))
+
+# Age used for network edges that were never fetched
+NEVER_FETCHED_H = 24 * 365
+
+
+def _decay(score, since, now):
+    days = (now - since).total_seconds() / 86400
+    return score * 0.5 ** (days / HALF_LIFE_DAYS)
+
+
+class PopularityLog:
+    """Per-process buffer of edge hits, flushed to pair_popularity"""
+
+    def __init__(self, flush_interval=FLUSH_S):
+        self.flush_interval = flush_interval
+        self._hits = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record_route(self, route):
+        """Credit every leg of an answered route"""
+        legs = [(normalize_city(a), normalize_city(b)) for a, b in zip(route, route[1:])]
+        with self._lock:
+            self._hits.update(legs)
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Fold buffered hits into the decayed scores; hits are kept on failure"""
+        with self._lock:
+            hits, self._hits = self._hits, Counter()
+            self._last_flush = time.monotonic()
+        if not hits:
+            return 0
+        now = datetime.utcnow()
+        try:
+            with _app_context():
+                rows = {(r.source, r.destination): r for r in PairPopularity.query.filter(
+                    PairPopularity.source.in_(sorted({s for s, _ in hits})),
+                    PairPopularity.destination.in_(sorted({d for _, d in hits}))).all()}
+                for (source, destination), count in hits.items():
+                    row = rows.get((source, destination))
+                    if row is None:
+                        db.session.add(PairPopularity(source=source, destination=destination,
+                                                      score=float(count), updated_at=now))
+                    else:
+                        row.score = _decay(row.score, row.updated_at, now) + count
+                        row.updated_at = now
+                db.session.commit()
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not flush route popularity: {e}")
+            with _app_context():
+                db.session.rollback()
+            with self._lock:
+                self._hits.update(hits)
+            return 0
+        return len(hits)
+
+
+popularity_log = PopularityLog()
+
+
+def rank_stale_edges(limit=None, now=None):
+    """
+    Network edges worth refreshing, most valuable first
+
+    Returns:
+        list: (score, source, destination, age_hours) with score > 0
+    """
+    now = now or datetime.utcnow()
+    network = set(CITIES)
+    with _app_context():
+        popularity = PairPopularity.query.filter(PairPopularity.score > 0).all()
+        fetched = dict(((s, d), t) for s, d, t in db.session.query(
+            RouteData.source, RouteData.destination, RouteData.fetched_at).all())
+
+    ranked = []
+    for row in popularity:
+        if row.source not in network or row.destination not in network or row.source == row.destination:
+            continue
+        fetched_at = fetched.get((row.source, row.destination))
+        age = (now - fetched_at).total_seconds() / 3600 if fetched_at else NEVER_FETCHED_H
+        if age < MIN_AGE_H:
+            continue
+        score = _decay(row.score, row.updated_at, now) * age
+        ranked.append((score, row.source, row.destination, age))
+    ranked.sort(reverse=True)
+    return ranked if limit is None else ranked[:limit]
+
+
+class RefreshScheduler:
+    """Spends the daily budget on the top-ranked stale edges, tick by tick"""
+
+    def __init__(self, daily_budget=DAILY_BUDGET, interval=INTERVAL_S, fetch=None):
+        self.daily_budget = daily_budget
+        self.interval = interval
+        self._fetch = fetch
+        self._calls = deque()  # monotonic times of provider calls in the last 24 h
+        self._stop = threading.Event()
+        self._thread = None
+
+    def remaining_budget(self):
+        day_ago = time.monotonic() - 86400
+        while self._calls and self._calls[0] < day_ago:
+            self._calls.popleft()
+        return max(0, self.daily_budget - len(self._calls))
+
+    def tick_allowance(self):
+        """Calls allowed this tick: the budget spread evenly over the day"""
+        per_tick = math.ceil(self.daily_budget * self.interval / 86400)
+        return min(per_tick, self.remaining_budget())
+
+    def fetch(self, source, destination):
+        if self._fetch is None:
+            from Toll.matrix_builder import fetch_directions_edge
+            self._fetch = fetch_directions_edge
+        return self._fetch(source, destination)
+
+    def tick(self):
+        """
+        One refresh round
+
+        Returns:
+            list: (source, destination) edges refreshed
+        """
+        popularity_log.flush()
+        refreshed, edges = [], []
+        for score, source, destination, age in rank_stale_edges(self.tick_allowance()):
+            self._calls.append(time.monotonic())
+            try:
+                values = self.fetch(source, destination)
+            except Exception as e:
+                logger.warning(f"Refresh of {source} → {destination} failed: {e}")
+                continue
+            if values:
+                edges.append((source, destination, *values))
+                refreshed.append((source, destination))
+                logger.info(f"Refreshed {source} → {destination} (age {age:.0f}h, score {score:.1f})")
+
+        if edges:
+            upsert_edges(edges)
+
+        # Free updates: travel times learned from live answers since the last tick
+        from Toll.travel_learning import apply_learned, travel_log
+        travel_log.flush()
+        learned = apply_learned()
+
+        if edges or learned['edges']:
+            apply_to_live_matrices()
+        return refreshed
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Refresh tick failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name='refresh-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+
+def apply_to_live_matrices():
+    """
+    Re-run the all-pairs step on the stored network edges and publish it
+
+    Returns:
+        dict or None: The new precomputed data, None while the edge store does
+                      not cover the whole network yet (run a matrix build first)
+    """
+    from Toll.matrix_builder import floyd_warshall_with_paths, save_matrices_and_paths
+    from Toll.smart_routing import smart_router
+
+    tensor, _ = load_edge_tensor(CITIES)
+    n = len(CITIES)
+    if not all(math.isfinite(tensor[0][i][j]) for i in range(n) for j in range(n)):
+        logger.warning("Edge store does not cover every network pair yet; live matrices left as they are")
+        return None
+
+    results = [floyd_warshall_with_paths(matrix.tolist()) for matrix in tensor]
+    (distance, distance_paths), (hours, time_paths), (toll, toll_paths) = results
+    data = save_matrices_and_paths(distance, hours, toll, distance_paths, time_paths, toll_paths)
+    smart_router.precomputed_data = data
+    return data
+
+
+def freshness():
+    """Age of the stored network edges, for the coverage report"""
+    with _app_context():
+        oldest, newest, stored = db.session.query(
+            func.min(RouteData.fetched_at), func.max(RouteData.fetched_at), func.count()
+        ).filter(RouteData.source.in_(CITIES), RouteData.destination.in_(CITIES)).one()
+    return {'stored_edges': stored, 'oldest_edge': oldest, 'newest_edge': newest}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Refresh popular, stale network edges within a daily budget")
+    parser.add_argument('--once', action='store_true', help="Run a single tick and exit")
+    parser.add_argument('--dry-run', action='store_true', help="Only print the current ranking")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    if args.dry_run:
+        popularity_log.flush()
+        for score, source, destination, age in rank_stale_edges(20):
+            print(f"{score:12.1f}  {source} → {destination}  ({age:.0f}h old)")
+        return 0
+
+    scheduler = RefreshScheduler()
+    if args.once:
+        print(f"🔄 Refreshed {len(scheduler.tick())} edges")
+        return 0
+    print(f"🔄 Refresh scheduler: {scheduler.daily_budget} calls/day, tick every {scheduler.interval:.0f}s")
+    scheduler.run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,165 @@
+# Route result cache
+# Computed route payloads keyed by the normalized query and the version of the
+# data behind them. The form POST redirects to a GET result URL that carries
+# the normalized query, so repeat views are served from this cache - or, with
+# the ETag/Cache-Control headers set by the view, from the browser or a
+# fronting proxy without reaching Python. Any worker can rebuild a missing
+# entry from the URL alone.
+#
+# Configuration (environment, read at startup):
+#   RESULT_CACHE_SIZE        max cached results per process (default 1024)
+#   RESULT_CACHE_TTL_S       lifetime of results from precomputed/static data (default 86400)
+#   RESULT_CACHE_LIVE_TTL_S  lifetime of results from live providers (default 300)
+#   RESULT_CACHE_VERSION     bump to invalidate every cached result on deploy
+
+from collections import OrderedDict
+from datetime import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+
+from Toll.metrics import record_cache
+from Toll.time_dependent import TIME_BUCKETS_PATH
+from Toll.weighted_routing import METRICS, WEIGHT_STEPS, quantize_weights
+
+CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', 1024))
+TTL_S = int(os.getenv('RESULT_CACHE_TTL_S', 86400))
+LIVE_TTL_S = int(os.getenv('RESULT_CACHE_LIVE_TTL_S', 300))
+FALLBACK_TTL_S = 60
+
+# Strategies whose answer changes with traffic or provider health
+_SHORT_LIVED = {'direct_google_maps': LIVE_TTL_S, 'offline_fallback': FALLBACK_TTL_S,
+                'model_estimate': FALLBACK_TTL_S}
+
+DEPARTURE_FORMAT = '%Y-%m-%dT%H:%M'
+
+
+def normalize_query(source, destination, preference, weights=None, departure=None, steps=None):
+    """
+    Canonical form of a route query, used both as cache key material and as
+    the query string of the result URL
+
+    Args:
+        source (str): Starting city, any case/whitespace
+        destination (str): Destination city
+        preference (str): 'distance', 'time', 'toll' or 'weighted'
+        weights (dict): Metric weights, only for 'weighted'
+        steps (str): Grid steps as written by a previous normalization (the
+                     result URL's 'weights'); taken as they are, so
+                     normalizing a normalized query changes nothing
+        departure (datetime or str): Planned departure, only used for future 'time' queries
+
+    Returns:
+        dict: Query with only the fields that affect the answer; raises ValueError on bad weights
+    """
+    query = {
+        'source': source.strip().title(),
+        'destination': destination.strip().title(),
+        'preference': preference
+    }
+    if preference == 'weighted':
+        grid = parse_steps(steps) if steps else quantize_weights(weights or {})
+        query['weights'] = ','.join(str(s) for s in grid)
+    elif preference == 'time' and departure:
+        if isinstance(departure, str):
+            departure = datetime.strptime(departure, DEPARTURE_FORMAT)
+        if departure > datetime.now():
+            query['departure'] = departure.strftime(DEPARTURE_FORMAT)
+    return query
+
+
+def parse_steps(value):
+    """
+    Grid steps from a 'weights' query parameter
+
+    Returns:
+        tuple: Steps ordered as METRICS; a full weighting is returned as is,
+               anything else (hand-written URLs) is quantized as relative weights
+    """
+    try:
+        steps = tuple(int(s) for s in value.split(','))
+    except ValueError:
+        raise ValueError("weights must be comma-separated integers") from None
+    if len(steps) != len(METRICS):
+        raise ValueError(f"weights needs one step per metric ({', '.join(METRICS)})")
+    if sum(steps) == WEIGHT_STEPS and min(steps) >= 0:
+        return steps
+    return quantize_weights(dict(zip(METRICS, steps)))
+
+
+def query_weights(query):
+    """Weights dict back from a normalized weighted query"""
+    steps = parse_steps(query['weights'])
+    return {metric: step / WEIGHT_STEPS for metric, step in zip(METRICS, steps)}
+
+
+def query_departure(query):
+    return datetime.strptime(query['departure'], DEPARTURE_FORMAT) if 'departure' in query else None
+
+
+def data_version():
+    """Changes whenever the data answering a query can have changed"""
+    from Toll.smart_routing import smart_router
+    precomputed = (smart_router.precomputed_data or {}).get('last_updated', 'none')
+    try:
+        buckets = int(os.path.getmtime(TIME_BUCKETS_PATH))
+    except OSError:
+        buckets = 0
+    return f"{os.getenv('RESULT_CACHE_VERSION', '1')}:{precomputed}:{buckets}"
+
+
+def cache_key(query, version=None):
+    material = json.dumps([query, version or data_version()], sort_keys=True)
+    return hashlib.sha256(material.encode()).hexdigest()[:24]
+
+
+class CachedResult:
+    def __init__(self, payload, strategy, messages):
+        self.payload = payload
+        self.strategy = strategy
+        self.messages = messages  # flashed (message, category) pairs
+        self.created = time.time()
+        self.expires = self.created + _SHORT_LIVED.get(strategy, TTL_S)
+        body = json.dumps(payload, sort_keys=True, default=str)
+        self.etag = hashlib.sha256(body.encode()).hexdigest()[:16]
+
+    def max_age(self):
+        return max(0, int(self.expires - time.time()))
+
+
+class ResultCache:
+    """Thread-safe LRU of CachedResult with per-entry expiry"""
+
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        record_cache('route_result', entry is not None)
+        return entry
+
+    def put(self, key, payload, strategy, messages=()):
+        entry = CachedResult(payload, strategy, list(messages))
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+route_cache = ResultCache()
@@ -1,11 +1,12 @@
-from Toll import app,render_template,db
+from Toll import app,db
+from flask import render_template
 from Toll.forms import Inputform,RegisterForm,LoginForm
 from Toll.models import UserInput
-from flask import flash,request,redirect,url_for
+from flask import flash,request,redirect,url_for,session,make_response
 from Toll.floyd_warshall import floyd_warshall,reconstruct_path
 import numpy as np
 from flask_login import login_user, logout_user, login_required,current_user
-from Toll import bcrypt
+from Toll.identity import user_cache, password_hasher, HashingBusy
 from sqlalchemy.exc import IntegrityError,OperationalError
 from sqlalchemy import func 
 import re 
@@ -14,7 +15,22 @@ from Toll import gmaps
 from .map_service import get_route_details
 from Toll.build_matrix import build_matrix
 from Toll.direct_routing import get_direct_route, should_use_direct_routing
-from flask import jsonify
+from Toll.weighted_routing import get_weighted_route
+from Toll.time_dependent import get_time_dependent_route
+from Toll.async_routing import get_route_sync
+from Toll.providers import get_hedged_route
+from Toll.result_cache import CachedResult, route_cache, cache_key, normalize_query, query_weights, query_departure
+from Toll.refresh_scheduler import popularity_log
+from Toll.geometry import ZOOM_TOLERANCES_M, get_geometry, store_geometry
+from Toll.rate_limit import limit, route_limiter, search_limiter, too_many_requests
+from Toll.batch_routing import BatchRequestError, parse_batch, run_batch, stream_ndjson
+from flask import jsonify, g, before_render_template, template_rendered, Response, stream_with_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from Toll.metrics import ROUTE_REQUESTS, ROUTING_STRATEGY, REQUEST_SECONDS, record_span, render_metrics, server_timing_header
+from Toll import assets, profiling
+import os
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -41,85 +57,298 @@ def technology_page():
 @login_required
 def SmartRoute():
     form = Inputform()
-    show_result = False
-    route = []
-    cost = None
-    source = destination = None
-    total_toll = 0
-    preference = ''
 
     if form.validate_on_submit():
-        source = form.source.data.strip().title()
-        destination = form.destination.data.strip().title()
-        preference = form.preference.data
+        weights = {
+            'distance': form.distance_weight.data,
+            'time': form.time_weight.data,
+            'toll': form.toll_weight.data
+        }
+        try:
+            query = normalize_query(form.source.data, form.destination.data, form.preference.data,
+                                    weights=weights, departure=form.departure.data)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for('SmartRoute'))
+
+        # Post/Redirect/Get: the result page has a stable, cacheable URL. The
+        # route is computed there, once - under several workers the GET rarely
+        # lands on the process that handled the POST, so computing here as well
+        # would cost a second provider call and rate-limit token
+        session['route_submitted'] = cache_key(query)
+        return redirect(url_for('route_result', **query))
+
+    return render_template('input.html', form=form)
+
+
+@app.route('/route')
+@login_required
+def route_result():
+    """Result page for a normalized query; conditional GETs skip rendering"""
+    try:
+        query = normalize_query(request.args.get('source', ''), request.args.get('destination', ''),
+                                request.args.get('preference', ''),
+                                steps=request.args.get('weights'),
+                                departure=request.args.get('departure'))
+    except ValueError:
+        return redirect(url_for('SmartRoute'))
+    if not query['source'] or not query['destination'] or query['preference'] not in ('distance', 'time', 'toll', 'weighted'):
+        return redirect(url_for('SmartRoute'))
+
+    submitted = session.pop('route_submitted', None) == cache_key(query)
+    entry = _cached_route(query)
+    if entry is None:
+        return redirect(url_for('SmartRoute'))
+    if submitted:
+        for message, category in entry.messages:
+            flash(message, category)
+
+    # A pending flash is part of the page, so it cannot be answered with 304
+    if '_flashes' not in session and request.if_none_match.contains(entry.etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('results.html', **entry.payload))
+    response.set_etag(entry.etag)
+    # The page greets the logged-in user, so only the browser may reuse it
+    response.headers['Cache-Control'] = f'private, max-age={entry.max_age()}'
+    response.vary.add('Cookie')
+    return response
+
+
+@app.route('/route.json')
+def route_result_json():
+    """The same result as JSON; holds no user data, so shared caches may keep it"""
+    try:
+        query = normalize_query(request.args.get('source', ''), request.args.get('destination', ''),
+                                request.args.get('preference', ''),
+                                steps=request.args.get('weights'),
+                                departure=request.args.get('departure'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    entry = route_cache.get(cache_key(query))
+    if entry is None:
+        return jsonify({'error': 'Result not cached; request it through the route form or /route'}), 404
+    if request.if_none_match.contains(entry.etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(entry.payload)
+    response.set_etag(entry.etag)
+    response.headers['Cache-Control'] = f'public, max-age={entry.max_age()}'
+    return response
+
+
+@app.route('/route/geometry')
+def route_geometry():
+    """Stored route line simplified for a map zoom; public and long-lived, it holds no user data"""
+    try:
+        zoom = int(request.args.get('zoom', min(ZOOM_TOLERANCES_M)))
+    except ValueError:
+        return jsonify({'error': 'zoom must be an integer'}), 400
+    geometry = get_geometry(request.args.get('source', ''), request.args.get('destination', ''),
+                            request.args.get('preference', ''), zoom)
+    if geometry is None:
+        return jsonify({'error': 'No geometry stored for this route'}), 404
+
+    etag = geometry.pop('etag')
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(geometry)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
+
+
+def _cached_route(query):
+    """Cached result for a query, computing and storing it on a miss; None if no route"""
+    key = cache_key(query)
+    started = time.perf_counter()
+    entry = route_cache.get(key)
+    # Hit or miss shows in Server-Timing, so clients (the load test) can tell replayed answers apart
+    record_span('result_cache.hit' if entry is not None else 'result_cache.miss', time.perf_counter() - started)
+    if entry is not None:
+        ROUTE_REQUESTS.inc(strategy='cached')
+    else:
+        # Only computing costs a token; over the limit, no provider is called
+        live = not route_limiter.check_request(over_limit='downgraded')
+        payload, strategy, messages = _compute_route(query, live=live)
+        if payload is None:
+            for message, category in messages:
+                flash(message, category)
+            return None
+        ROUTE_REQUESTS.inc(strategy=strategy)
+        if live:
+            entry = route_cache.put(key, payload, strategy, messages)
+        else:
+            # Not cached, so the next allowed request gets the full answer
+            entry = CachedResult(payload, strategy, messages)
+    # Cached answers count too: popular pairs are what the refresh scheduler
+    # keeps fresh. Only the result page calls this, so a submission counts once
+    popularity_log.record_route(entry.payload['route'])
+    return entry
+
+
+def _model_estimate(source, destination, preference):
+    """
+    Cost model answer for a pair off the static tables, located from stored
+    coordinates only (no geocoding call)
+
+    Returns:
+        tuple or None: (route, cost, toll, distance, hours, message text)
+    """
+    from Toll.cost_model import estimate_route
+    estimate = estimate_route(source, destination, live=False)
+    if estimate is None:
+        return None
+    dist_val = estimate['distance_km']
+    time_val = estimate['duration_hours']
+    total_toll = estimate['toll_cost']
+    cost = {'distance': dist_val, 'time': time_val}.get(preference, total_toll)
+    error = estimate['relative_error'].get(preference, 0.0)
+    return (estimate['route'], cost, total_toll, dist_val, time_val,
+            f"estimated from the cost model (typically ±{error:.0%})")
+
+
+def _compute_route(query, live=True):
+    """
+    Answer a normalized route query
+
+    Args:
+        query (dict): Normalized query
+        live (bool): False answers from precomputed/static data only (rate limited)
+
+    Returns:
+        tuple: (template payload or None, strategy, [(message, category), ...])
+    """
+    source = query['source']
+    destination = query['destination']
+    preference = query['preference']
+    highway_path = []
+    has_geometry = False
+
+    if preference == 'weighted':
+        # Custom blend of metrics, answered from the cached weighted all-pairs run
+        weighted_data = get_weighted_route(source, destination, query_weights(query))
+        if not weighted_data:
+            return None, None, [("Custom weighting is available between network cities only", "danger")]
+
+        route = weighted_data['route']
+        cost = weighted_data['weighted_cost']
+        total_toll = weighted_data['toll_cost']
+        dist_val = weighted_data['distance_km']
+        time_val = weighted_data['duration_hours']
+        strategy = 'weighted'
+        mix = ", ".join(f"{w:.0%} {m}" for m, w in weighted_data['weights'].items() if w)
+        messages = [(f"✅ Weighted route ({mix})", "success")]
+
+    elif 'departure' in query:
+        # Planned future departure - use the time-of-day matrices, no API call
+        planned = get_time_dependent_route(source, destination, query_departure(query))
+        if not planned:
+            return None, None, [("Departure planning is available between network cities only", "danger")]
+
+        from Toll.static_data import get_matrix
+        route = planned['route']
+        cost = time_val = planned['duration_hours']
+        toll_matrix, cities = get_matrix('toll')
+        dist_matrix, _ = get_matrix('distance')
+        legs = [(cities.index(a), cities.index(b)) for a, b in zip(route, route[1:])]
+        total_toll = sum(toll_matrix[i][j] for i, j in legs)
+        dist_val = sum(dist_matrix[i][j] for i, j in legs)
+        strategy = 'planned_departure'
+        messages = [(f"✅ Planned departure {planned['departure']:%d %b %H:%M}, "
+                     f"arriving around {planned['arrival']:%d %b %H:%M}", "success")]
+
+    # Use direct routing (1 API call vs 28+ with Floyd-Warshall)
+    elif live and should_use_direct_routing(source, destination):
+        direct_route_data = get_hedged_route(source, destination, preference)
         
-        # Use direct routing (1 API call vs 28+ with Floyd-Warshall)
-        if should_use_direct_routing(source, destination):
-            direct_route_data = get_direct_route(source, destination, preference)
-            
-            if direct_route_data:
-                route = direct_route_data['route']
-                cost = direct_route_data.get('distance_km', 0) if preference == 'distance' else direct_route_data.get('duration_hours', 0) if preference == 'time' else direct_route_data.get('toll_cost', 0)
-                total_toll = direct_route_data.get('toll_cost', 0)
-                dist_val = direct_route_data.get('distance_km', 0)
-                time_val = direct_route_data.get('duration_hours', 0)
-                highway_path = direct_route_data.get('highways', [])
-                flash(f"✅ Direct route via {direct_route_data.get('route_summary', 'optimal path')}", "success")
-            else:
-                flash("⚠️ Using offline estimates", "warning")
-                from Toll.static_data import get_matrix
-                matrix_data, cities = get_matrix(preference)
-                if source in cities and destination in cities:
-                    src_idx = cities.index(source)
-                    dest_idx = cities.index(destination)
-                    cost = matrix_data[src_idx][dest_idx]
-                    route = [source, destination]
-                    toll_matrix, _ = get_matrix('toll')
-                    dist_matrix, _ = get_matrix('distance')
-                    time_matrix, _ = get_matrix('time')
-                    total_toll = toll_matrix[src_idx][dest_idx] if preference != 'toll' else cost
-                    dist_val = dist_matrix[src_idx][dest_idx]
-                    time_val = time_matrix[src_idx][dest_idx]
-                    highway_path = ["NH48"]
-                else:
-                    flash("Route not found", "danger")
-                    return redirect(url_for('SmartRoute'))
+        if direct_route_data:
+            route = direct_route_data['route']
+            cost = direct_route_data.get('distance_km', 0) if preference == 'distance' else direct_route_data.get('duration_hours', 0) if preference == 'time' else direct_route_data.get('toll_cost', 0)
+            total_toll = direct_route_data.get('toll_cost', 0)
+            dist_val = direct_route_data.get('distance_km', 0)
+            time_val = direct_route_data.get('duration_hours', 0)
+            highway_path = direct_route_data.get('highways', [])
+            # Kept so the results map never needs another provider call
+            has_geometry = store_geometry(source, destination, preference,
+                                          direct_route_data.get('overview_polyline'))
+            strategy = 'direct_google_maps'
+            messages = [(f"✅ Direct route via {direct_route_data.get('route_summary', 'optimal path')}", "success")]
         else:
-            flash("⚠️ Using offline estimates", "warning")
+            messages = [("⚠️ Using offline estimates", "warning")]
+            strategy = 'offline_fallback'
             from Toll.static_data import get_matrix
             matrix_data, cities = get_matrix(preference)
-            
-            if source not in cities or destination not in cities:
-                flash("Invalid Source or Destination", "danger")
-                return redirect(url_for('SmartRoute'))
-            
+            if source in cities and destination in cities:
+                src_idx = cities.index(source)
+                dest_idx = cities.index(destination)
+                cost = matrix_data[src_idx][dest_idx]
+                route = [source, destination]
+                toll_matrix, _ = get_matrix('toll')
+                dist_matrix, _ = get_matrix('distance')
+                time_matrix, _ = get_matrix('time')
+                total_toll = toll_matrix[src_idx][dest_idx] if preference != 'toll' else cost
+                dist_val = dist_matrix[src_idx][dest_idx]
+                time_val = time_matrix[src_idx][dest_idx]
+                highway_path = ["NH48"]
+            else:
+                # Off the static tables: an instant, clearly labelled model estimate
+                estimate = _model_estimate(source, destination, preference)
+                if estimate is None:
+                    return None, None, messages + [("Route not found", "danger")]
+                route, cost, total_toll, dist_val, time_val, note = estimate
+                strategy = 'model_estimate'
+                messages = [(f"⚠️ Live routing unavailable - {note}", "warning")]
+    else:
+        messages = [("⚠️ Using offline estimates", "warning")]
+        strategy = 'offline_static'
+        if not live:
+            messages = [("⏳ Too many route requests - showing offline estimates", "warning")]
+            strategy = 'rate_limited'
+        from Toll.static_data import get_matrix
+        matrix_data, cities = get_matrix(preference)
+        
+        if source in cities and destination in cities:
             src_idx = cities.index(source)
             dest_idx = cities.index(destination)
             cost = matrix_data[src_idx][dest_idx]
             route = [source, destination]
-            highway_path = []
             toll_matrix, _ = get_matrix('toll')
             dist_matrix, _ = get_matrix('distance')
             time_matrix, _ = get_matrix('time')
             total_toll = toll_matrix[src_idx][dest_idx] if preference != 'toll' else cost
             dist_val = dist_matrix[src_idx][dest_idx]
             time_val = time_matrix[src_idx][dest_idx]
-            
-        # Redirect to results page
-        return render_template(
-            'results.html',
-            route=route,
-            highway_path=highway_path if 'highway_path' in locals() else [],
-            cost=cost,
-            source=source,
-            destination=destination,
-            total_toll=total_toll,
-            dist_val=dist_val,
-            time_val=time_val,
-            preference=preference
-        )
+        else:
+            # Off the static tables the cost model still answers, without a provider call
+            estimate = _model_estimate(source, destination, preference)
+            if estimate is None:
+                if not live:
+                    return None, None, [("Too many route requests - please try again in a minute", "danger")]
+                return None, None, messages + [("Invalid Source or Destination", "danger")]
+            route, cost, total_toll, dist_val, time_val, note = estimate
+            if live:
+                strategy = 'model_estimate'
+                messages = [(f"⚠️ Using offline estimates - {note}", "warning")]
+            else:
+                messages = [(f"⏳ Too many route requests - {note}", "warning")]
 
-    return render_template('input.html', form=form)
+    payload = {
+        'route': route,
+        'highway_path': highway_path,
+        'cost': cost,
+        'source': source,
+        'destination': destination,
+        'total_toll': total_toll,
+        'dist_val': dist_val,
+        'time_val': time_val,
+        'preference': preference,
+        'has_geometry': has_geometry
+    }
+    ROUTING_STRATEGY.inc(strategy=strategy)
+    return payload, strategy, messages
 
 
 
@@ -191,7 +420,7 @@ def Register_page():
     if form.validate_on_submit():
         try:
             # Create and add new user (rely on database constraints)
-            hashed_pw = bcrypt.generate_password_hash(form.password1.data).decode('utf-8')
+            hashed_pw = password_hasher.hash(form.password1.data)
             new_user = UserInput(
                 username=form.username.data, 
                 email_address=form.email_address.data,
@@ -199,6 +428,8 @@ def Register_page():
             )
             db.session.add(new_user)
             db.session.commit()
+            # SQLite can reuse the id of a deleted user
+            user_cache.invalidate(new_user.id)
             flash('Account created successfully! You can now log in.', 'success')
             return redirect(url_for('login_page'))
             
@@ -211,6 +442,9 @@ def Register_page():
             else:
                 flash('Registration error occurred', 'danger')
             return redirect(url_for('Register_page'))
+        except HashingBusy:
+            flash('Too many sign-ups right now, please try again in a moment', 'warning')
+            return render_template('register.html', form=form), 503
             
     return render_template('register.html', form=form)
 
@@ -230,6 +464,9 @@ def login_page():
                 return redirect(url_for('SmartRoute'))
             else:
                 flash('Username and password are not matched!!', category='danger')
+        except HashingBusy:
+            flash('Too many logins right now, please try again in a moment', category='warning')
+            return render_template('login.html', form=form), 503
         except Exception as e:
             logger.error(f"Login error: {e}")
             flash('Login error occurred', 'danger')
@@ -237,6 +474,8 @@ def login_page():
         
 @app.route('/logout')
 def logout_page():
+    if current_user.is_authenticated:
+        user_cache.invalidate(current_user.id)
     logout_user()
     flash("You have been logged out!", category='info')
     return redirect(url_for('login_page'))
@@ -249,9 +488,155 @@ def shutdown_session(exception=None):
 
 @app.route('/api/city-search')
 @login_required
+@limit(search_limiter)
 def city_search():
     q = request.args.get('q', '').strip().title()
     # Use hardcoded city list to avoid API calls
     cities = ["Mumbai", "Delhi", "Bangalore", "Pune", "Chennai", "Kolkata", "Hyderabad", "Ahmedabad"]
     matches = [c for c in cities if q.lower() in c.lower()]
     return jsonify(matches)
+
+
+@app.route('/api/route')
+@login_required
+@limit(route_limiter)
+def api_route():
+    """Route data as JSON; Directions and Routes API are queried concurrently"""
+    source = request.args.get('source', '').strip().title()
+    destination = request.args.get('destination', '').strip().title()
+    preference = request.args.get('preference', 'distance')
+    if not source or not destination:
+        return jsonify({'error': 'source and destination are required'}), 400
+    if preference not in ('distance', 'time', 'toll'):
+        return jsonify({'error': 'preference must be distance, time or toll'}), 400
+
+    route_data = get_route_sync(source, destination, preference)
+    if not route_data:
+        return jsonify({'error': 'Route not found'}), 404
+    ROUTE_REQUESTS.inc(strategy='async_fan_out')
+    return jsonify(route_data)
+
+
+@app.route('/api/routes/batch', methods=['POST'])
+def batch_routes():
+    """Many route queries in one request, streamed back as NDJSON"""
+    # Dispatch tools authenticate with a shared token instead of a browser login
+    token = os.getenv('BATCH_API_TOKEN')
+    token_ok = token and request.headers.get('Authorization') == f'Bearer {token}'
+    if not token_ok and not current_user.is_authenticated:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        queries, count, live = parse_batch(request.get_json(silent=True))
+    except BatchRequestError as e:
+        return jsonify({'error': str(e)}), 400
+    # After authentication, so anonymous requests cannot drain a client's bucket
+    wait = route_limiter.check_request()
+    if wait:
+        return too_many_requests(wait)
+
+    ROUTE_REQUESTS.inc(count, strategy='batch')
+    def allow_live():
+        # Every live miss takes a further token; once they run out the rest skip the providers
+        return not route_limiter.check_request(over_limit='downgraded')
+
+    return Response(stream_with_context(stream_ndjson(run_batch(queries, live, allow_live), count)),
+                    mimetype='application/x-ndjson')
+
+
+@app.route('/assets/<path:filename>')
+def hashed_asset(filename):
+    return assets.serve_asset(filename)
+
+
+assets.init_app(app)
+
+
+# ---------------------------------------------------------------------------
+# Tracing: request timing, Server-Timing header and /metrics
+# ---------------------------------------------------------------------------
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if profiling.should_profile(request.headers.get('X-Profile')):
+        g.profile = profiling.start_profile(request.endpoint or 'unmatched')
+
+
+@app.after_request
+def record_request_timing(response):
+    started = g.get('request_started')
+    if started is not None:
+        elapsed = time.perf_counter() - started
+        endpoint = request.url_rule.endpoint if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(elapsed, endpoint=endpoint, method=request.method, status=response.status_code)
+        response.headers['Server-Timing'] = server_timing_header(elapsed)
+    if 'profile' in g:
+        response.headers['X-Profile-Id'] = g.profile.id
+    return response
+
+
+@app.teardown_request
+def finish_profile(exception=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        try:
+            profile.finish()
+        except OSError as e:
+            logger.error(f"Could not write profile {profile.id}: {e}")
+
+
+def _template_started(sender, template, context, **extra):
+    g.template_started = time.perf_counter()
+
+
+def _template_finished(sender, template, context, **extra):
+    started = g.pop('template_started', None)
+    if started is not None:
+        record_span('template', time.perf_counter() - started)
+
+
+before_render_template.connect(_template_started, app)
+template_rendered.connect(_template_finished, app)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _db_query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _db_query_finished(conn, cursor, statement, parameters, context, executemany):
+    record_span('db', time.perf_counter() - conn.info['query_started'].pop())
+
+
+@app.route('/metrics')
+def metrics():
+    # Optional shared secret so the endpoint can be exposed publicly
+    token = os.getenv('METRICS_TOKEN')
+    if token and request.headers.get('Authorization') != f'Bearer {token}':
+        return 'Unauthorized', 401
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@app.route('/admin/profiling', methods=['GET', 'POST'])
+def profiling_settings():
+    """Inspect or change profiling at runtime; requires the PROFILE_TOKEN header"""
+    if not profiling.settings.token:
+        return jsonify({'error': 'Profiling is not configured'}), 404
+    if request.headers.get('X-Profile') != profiling.settings.token:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            if 'sample_rate' in data:
+                rate = float(data['sample_rate'])
+                if not 0 <= rate <= 1:
+                    raise ValueError
+                profiling.settings.sample_rate = rate
+            if 'allocations' in data:
+                profiling.settings.allocations = bool(data['allocations'])
+        except (TypeError, ValueError):
+            return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+    return jsonify(profiling.settings.as_dict())
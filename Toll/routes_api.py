@@ -2,16 +2,40 @@ import requests
 import os
 from dotenv import load_dotenv
 import logging
+from Toll.fake_providers import FakeRoutesTransport, fake_providers_enabled
+from Toll.metrics import span, record_provider_call, provider_error_status
 
 load_dotenv()
 logger = logging.getLogger(__name__)
 
+# Seconds before a Routes API request is abandoned (connect and read)
+TIMEOUT_S = float(os.getenv('ROUTES_API_TIMEOUT_S', 10))
+
+def routes_api_configured():
+    """True when calls can succeed: a real key is set, or the local stand-in is on"""
+    api_key = os.getenv("GOOGLE_MAPS_API_KEY")
+    return fake_providers_enabled() or bool(api_key and api_key != "your_actual_api_key_here")
+
+class RoutesAPIError(Exception):
+    """A Routes API call failed; status_code is the HTTP status (429 when over quota)"""
+
+    def __init__(self, status_code, message=''):
+        super().__init__(f"Routes API error {status_code}: {message}")
+        self.status_code = status_code
+
+
 class RoutesAPI:
-    def __init__(self):
+    def __init__(self, http=None):
         self.api_key = os.getenv("GOOGLE_MAPS_API_KEY")
         self.base_url = "https://routes.googleapis.com/directions/v2:computeRoutes"
+        # Anything with a requests-style post(); the local stand-in in load tests.
+        # A session keeps connections alive between calls made through this instance
+        if http is None:
+            http = FakeRoutesTransport.from_env() if fake_providers_enabled() else requests.Session()
+        self.http = http
     
-    def get_route_with_tolls(self, origin, destination, preference='TRAFFIC_AWARE'):
+    def get_route_with_tolls(self, origin, destination, preference='TRAFFIC_AWARE', fallback=True,
+                             raise_errors=False):
         """
         Get route with real toll information from Google Routes API
         
@@ -19,10 +43,17 @@ class RoutesAPI:
             origin (str): Starting city
             destination (str): Destination city  
             preference (str): 'TRAFFIC_AWARE', 'TRAFFIC_AWARE_OPTIMAL', 'FUEL_EFFICIENT'
+            fallback (bool): Answer from static data when the API fails;
+                             False returns None instead so callers can try another provider
+            raise_errors (bool): Raise RoutesAPIError (or the transport error)
+                                 on a failed call instead, so callers can see
+                                 the status - e.g. stop a build on quota errors
         
         Returns:
             dict: Route data with real toll costs
         """
+        on_failure = self._fallback_estimation if fallback else (lambda origin, destination: None)
+
         headers = {
             'Content-Type': 'application/json',
             'X-Goog-Api-Key': self.api_key,
@@ -53,18 +84,26 @@ class RoutesAPI:
         }
         
         try:
-            response = requests.post(self.base_url, json=payload, headers=headers)
+            with span('provider.routes_api'):
+                try:
+                    response = self.http.post(self.base_url, json=payload, headers=headers, timeout=TIMEOUT_S)
+                except Exception as e:
+                    record_provider_call('routes_api', provider_error_status(e))
+                    raise
+            record_provider_call('routes_api', response.status_code)
             
             if response.status_code != 200:
                 logger.error(f"Routes API error {response.status_code}: {response.text}")
+                if raise_errors:
+                    raise RoutesAPIError(response.status_code, response.text[:200])
                 # Fallback to simple estimation
-                return self._fallback_estimation(origin, destination)
+                return on_failure(origin, destination)
             
             data = response.json()
             
             if 'routes' not in data or not data['routes']:
                 logger.warning(f"No routes found from {origin} to {destination}")
-                return self._fallback_estimation(origin, destination)
+                return on_failure(origin, destination)
             
             # Get the best route (first one is usually optimal)
             route = data['routes'][0]
@@ -99,12 +138,16 @@ class RoutesAPI:
                 'route_found': True
             }
             
+        except RoutesAPIError:
+            raise
         except requests.exceptions.RequestException as e:
             logger.error(f"Routes API error for {origin} to {destination}: {e}")
-            return self._fallback_estimation(origin, destination)
+            if raise_errors:
+                raise
+            return on_failure(origin, destination)
         except Exception as e:
             logger.error(f"Unexpected error: {e}")
-            return self._fallback_estimation(origin, destination)
+            return on_failure(origin, destination)
     
     def _fallback_estimation(self, origin, destination):
         """Fallback to static data when Routes API fails"""
@@ -129,49 +172,69 @@ class RoutesAPI:
         
         return None
 
-def build_matrix_with_routes_api(preference='distance', cities=None):
+def build_matrix_with_routes_api(preference='distance', cities=None, resume=True):
     """
     Build matrix using Routes API for real toll data
     
     Args:
         preference (str): 'distance', 'time', or 'toll'
         cities (list): List of cities
+        resume (bool): Reuse pairs checkpointed by an earlier, interrupted run
+                       of the same build job; False refetches everything
     
     Returns:
-        tuple: (matrix, cities)
+        tuple: (matrix, cities); raises build_jobs.BuildAborted if the run
+               stopped early (rerun to resume)
     """
     if cities is None:
         cities = ["Mumbai", "Delhi", "Bangalore", "Pune", "Chennai", "Kolkata", "Hyderabad", "Ahmedabad"]
     
+    from Toll.build_jobs import BuildJob
+    from Toll.edge_store import normalize_city, upsert_edges
+    from sqlalchemy.exc import SQLAlchemyError
+
     routes_api = RoutesAPI()
+
+    def fetch(source, destination):
+        # No static fallback here: a failed call must stay "failed" in the manifest,
+        # and a quota error must reach BuildJob.run to stop the build
+        route_data = routes_api.get_route_with_tolls(source, destination, preference, fallback=False,
+                                                     raise_errors=True)
+        if not route_data or not route_data['route_found']:
+            return None
+        # Use actual toll cost, fallback to distance-based if no toll data
+        toll = route_data['toll_cost_inr'] or route_data['distance_km'] * 2.5
+        return route_data['distance_km'], route_data['duration_hours'], toll
+
+    job = BuildJob(f'routes_api:{preference}', cities)
+    job.run(fetch, resume=resume)
+    edges = job.edges()
+
     n = len(cities)
+    index = {normalize_city(city): i for i, city in enumerate(cities)}
+    metric = {'distance': 2, 'time': 3, 'toll': 4}.get(preference, 2)
     matrix = [[float('inf')] * n for _ in range(n)]
     
     # Set diagonal to 0 (same city)
     for i in range(n):
         matrix[i][i] = 0
-    
-    # Get route data for each city pair
+
+    for edge in edges:
+        if edge[0] in index and edge[1] in index:
+            matrix[index[edge[0]]][index[edge[1]]] = edge[metric]
+
+    # Pairs the API never answered: estimate from static data as before
     for i in range(n):
         for j in range(n):
-            if i != j:
-                route_data = routes_api.get_route_with_tolls(cities[i], cities[j], preference)
-                
-                if route_data and route_data['route_found']:
-                    if preference == 'distance':
-                        matrix[i][j] = route_data['distance_km']
-                    elif preference == 'time':
-                        matrix[i][j] = route_data['duration_hours']
-                    elif preference == 'toll':
-                        # Use actual toll cost, fallback to distance-based if no toll data
-                        if route_data['toll_cost_inr'] > 0:
-                            matrix[i][j] = route_data['toll_cost_inr']
-                        else:
-                            # Fallback: estimate based on distance
-                            matrix[i][j] = route_data['distance_km'] * 2.5
-                
-                # Add small delay to avoid rate limiting
-                import time
-                time.sleep(0.1)
+            if matrix[i][j] == float('inf'):
+                estimate = routes_api._fallback_estimation(cities[i], cities[j])
+                if estimate:
+                    matrix[i][j] = {'distance': estimate['distance_km'], 'time': estimate['duration_hours'],
+                                    'toll': estimate['toll_cost_inr']}.get(preference, estimate['distance_km'])
+
+    try:
+        upsert_edges(edges)
+    except SQLAlchemyError as e:
+        logger.error(f"Could not store edges in route_data: {e}")
     
-    return matrix, cities
\ No newline at end of file
+    return matrix, cities
@@ -2,5 +2,10 @@ from Toll import app
 import os
 
 if __name__=='__main__':
+    # Single process only; the debug reloader runs this file twice and only
+    # its child (WERKZEUG_RUN_MAIN) serves requests
+    if os.getenv('REFRESH_SCHEDULER') == '1' and os.getenv('WERKZEUG_RUN_MAIN') == 'true':
+        from Toll.refresh_scheduler import RefreshScheduler
+        RefreshScheduler().start()
     app.run(debug=True)
 
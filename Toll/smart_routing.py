@@ -3,20 +3,68 @@
 
 import json
 import os
+import time
 from Toll.city_network import CITIES, is_city_in_network
 from Toll.direct_routing import get_direct_route
+from Toll.metrics import span
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 'precomputed' (flat Floyd-Warshall tables) or 'hierarchical' (regional
+# tables joined by border cities, see hierarchical_routing.py)
+ROUTING_MODE = os.getenv('ROUTING_MODE', 'precomputed')
+
+# '1' answers off-network places through their nearest hubs (hub_snapping.py)
+HUB_SNAPPING = os.getenv('HUB_SNAPPING', '0') == '1'
+
+PRECOMPUTED_PATH = 'precomputed_routes.json'
+# How often a process checks whether the refresh scheduler replaced the file
+RELOAD_CHECK_S = 30
+
 class SmartRouter:
+    # Class default so routers built without __init__ (benchmarks, tests) still work
+    _checked = 0.0
+
     def __init__(self):
-        self.precomputed_data = self.load_precomputed_data()
+        self._precomputed_data = None
+        self._loaded = False
+        self._mtime = None
+        self._checked = 0.0
+
+    @property
+    def precomputed_data(self):
+        """Floyd-Warshall results, read from disk on first use and again when the file changes"""
+        if not self._loaded or self._changed_on_disk():
+            self._precomputed_data = self.load_precomputed_data()
+            self._loaded = True
+        return self._precomputed_data
+
+    @precomputed_data.setter
+    def precomputed_data(self, data):
+        self._precomputed_data = data
+        self._loaded = True
+        self._mtime = self._file_mtime()
+
+    def _file_mtime(self):
+        try:
+            return os.path.getmtime(PRECOMPUTED_PATH)
+        except OSError:
+            return None
+
+    def _changed_on_disk(self):
+        # A stat at most every RELOAD_CHECK_S, so refreshed tables reach every worker
+        now = time.monotonic()
+        if now - self._checked < RELOAD_CHECK_S:
+            return False
+        self._checked = now
+        return self._file_mtime() != self._mtime
     
     def load_precomputed_data(self):
         """Step 4: Load saved Floyd-Warshall results"""
+        self._mtime = self._file_mtime()
         try:
-            with open('precomputed_routes.json', 'r') as f:
+            with open(PRECOMPUTED_PATH, 'r') as f:
                 return json.load(f)
         except FileNotFoundError:
             logger.warning("Precomputed routes not found. Run matrix_builder.py first.")
@@ -27,25 +75,51 @@ class SmartRouter:
         Smart routing decision engine:
         1. Check if both cities are in precomputed network
         2. Use Floyd-Warshall results if available
-        3. Fall back to direct Google Maps routing
-        4. Use Google Maps for final highway details (Step 6)
+        3. With HUB_SNAPPING, route off-network places through their nearest hubs
+        4. Fall back to direct Google Maps routing
+        5. Use Google Maps for final highway details (Step 6)
         """
         
+        if ROUTING_MODE == 'hierarchical':
+            from Toll.hierarchical_routing import get_hierarchical_route
+            with span('apsp.hierarchical'):
+                hierarchical_route = get_hierarchical_route(source, destination, preference)
+            if hierarchical_route:
+                return self.enhance_with_live_data(hierarchical_route)
+
         # Step 5: Use precomputed data if both cities are in network
-        if (self.precomputed_data and 
+        elif (self.precomputed_data and 
             is_city_in_network(source) and 
             is_city_in_network(destination)):
             
-            precomputed_route = self.get_precomputed_route(source, destination, preference)
+            with span('apsp.precomputed'):
+                precomputed_route = self.get_precomputed_route(source, destination, preference)
             if precomputed_route:
                 # Step 6: Enhance with live Google Maps data for highway details
                 enhanced_route = self.enhance_with_live_data(precomputed_route)
                 return enhanced_route
         
+        # Off-network places near hubs: local legs + precomputed hub route, no live call
+        if HUB_SNAPPING and not (is_city_in_network(source) and is_city_in_network(destination)):
+            from Toll.hub_snapping import snap_route
+            with span('hub_snapping'):
+                snapped_route = snap_route(source, destination, preference, self.get_hub_route)
+            if snapped_route:
+                return snapped_route
+
         # Fallback: Direct Google Maps routing for cities not in network
         logger.info(f"Using direct routing for {source} → {destination} (not in precomputed network)")
         return get_direct_route(source, destination, preference)
     
+    def get_hub_route(self, source, destination, preference):
+        """Hub-to-hub route from the tables of the current ROUTING_MODE, without live data"""
+        if ROUTING_MODE == 'hierarchical':
+            from Toll.hierarchical_routing import get_hierarchical_route
+            return get_hierarchical_route(source, destination, preference)
+        if not self.precomputed_data:
+            return None
+        return self.get_precomputed_route(source, destination, preference)
+
     def get_precomputed_route(self, source, destination, preference):
         """Step 5: Look up optimal route from Floyd-Warshall results"""
         try:
@@ -116,9 +190,10 @@ class SmartRouter:
         has_precomputed = self.precomputed_data is not None
         
         if both_in_network and has_precomputed:
-            return "floyd_warshall_enhanced"
+            strategy = "floyd_warshall_enhanced"
         else:
-            return "direct_google_maps"
+            strategy = "direct_google_maps"
+        return strategy
     
     def get_network_info(self):
         """Get information about the routing network"""
@@ -0,0 +1,40 @@
+# Startup timing
+# create_app() and the lazy clients record how long each phase takes (Flask
+# and extensions, route imports, schema checks, data preloads, first provider
+# client). The report is logged once the app is ready; benchmarks/startup.py
+# prints it from a fresh interpreter.
+
+from contextlib import contextmanager
+import threading
+import time
+
+PROCESS_STARTED = time.perf_counter()
+
+_phases = []  # (name, seconds) in completion order
+_lock = threading.Lock()
+
+
+@contextmanager
+def timed(name):
+    """Record the duration of a startup phase"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _phases.append((name, time.perf_counter() - started))
+
+
+def phases():
+    with _lock:
+        return list(_phases)
+
+
+def report():
+    """Human-readable table of recorded phases"""
+    lines = [f"{'phase':32s} {'ms':>9s}"]
+    for name, seconds in phases():
+        lines.append(f"{name:32s} {seconds * 1000:9.1f}")
+    lines.append(f"{'since Toll import':32s} {(time.perf_counter() - PROCESS_STARTED) * 1000:9.1f}")
+    return '\n'.join(lines)
+
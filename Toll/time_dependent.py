@@ -0,0 +1,257 @@
+# Time-of-day dependent travel times
+# The static TIME_MATRIX is a single snapshot. Here it is expanded into a
+# (buckets, n, n) tensor - one travel-time matrix per hour (or 15 minutes) -
+# saved as a .npy file that is memory-mapped at query time, so departures
+# in the future can be planned without any API call.
+#
+# The file is written once, outside requests - `python -m Toll.time_dependent`,
+# the preload at startup, or the refresh scheduler - always to a temporary
+# file that is renamed over the old one, so processes that have the old file
+# mapped keep a complete tensor. A request that finds no file uses the same
+# tensor built in memory from TIME_MATRIX and writes nothing.
+#
+# The tensor lives next to precomputed_routes.json (the working directory the
+# app starts in) unless TIME_BUCKETS_PATH says otherwise. The path is made
+# absolute at startup, so a later change of directory cannot split readers
+# and writers between two files.
+#
+# Configuration (environment, read at startup):
+#   TIME_BUCKETS_PATH        the .npy tensor; its .json metadata sits beside it
+#                            (default time_buckets.npy in the startup directory)
+
+from datetime import datetime, timedelta
+import heapq
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from Toll.static_data import CITIES, TIME_MATRIX
+from Toll.metrics import span
+
+logger = logging.getLogger(__name__)
+
+TIME_BUCKETS_PATH = os.path.abspath(os.getenv('TIME_BUCKETS_PATH', 'time_buckets.npy'))
+BUCKET_MINUTES = 60
+
+# Relative congestion by hour of day (1.0 = the static snapshot).
+# Morning and evening peaks around city exits dominate intercity trips.
+HOURLY_CONGESTION = [
+    0.85, 0.82, 0.80, 0.80, 0.82, 0.88,  # 00-05 night
+    0.97, 1.12, 1.25, 1.20, 1.08, 1.02,  # 06-11 morning peak
+    1.00, 1.00, 1.02, 1.05, 1.12, 1.25,  # 12-17
+    1.30, 1.22, 1.10, 1.00, 0.93, 0.88   # 18-23 evening peak
+]
+
+_tensor_cache = {}
+_build_lock = threading.Lock()
+
+
+def _congestion_factor(minute_of_day):
+    """Congestion factor at a minute of the day, interpolated between hours"""
+    hour, minute = divmod(minute_of_day, 60)
+    start = HOURLY_CONGESTION[hour % 24]
+    end = HOURLY_CONGESTION[(hour + 1) % 24]
+    return start + (end - start) * minute / 60
+
+
+def build_time_buckets(base_matrix=None, cities=None, bucket_minutes=BUCKET_MINUTES, path=TIME_BUCKETS_PATH):
+    """
+    Build the (buckets, n, n) travel-time tensor and write it to disk
+
+    Args:
+        base_matrix (list): N x N travel times in hours, defaults to static TIME_MATRIX
+        cities (list): City names matching base_matrix rows
+        bucket_minutes (int): Bucket width, must divide a day (e.g. 60 or 15)
+        path (str): Target .npy file, a .json sidecar with metadata is written next to it
+
+    Returns:
+        np.memmap: The written tensor
+    """
+    if (24 * 60) % bucket_minutes:
+        raise ValueError(f"bucket_minutes must divide a day, got {bucket_minutes}")
+
+    if base_matrix is None:
+        base_matrix, cities = TIME_MATRIX, CITIES
+    base = np.asarray(base_matrix, dtype=np.float32)
+    buckets = (24 * 60) // bucket_minutes
+
+    # Written beside the target and renamed over it: readers never map a half-written file
+    tmp = f"{path}.tmp.npy"
+    tensor = np.lib.format.open_memmap(tmp, mode='w+', dtype=np.float32, shape=(buckets,) + base.shape)
+    tensor[:] = _expand(base, bucket_minutes)
+    tensor.flush()
+    os.replace(tmp, path)
+
+    with open(_metadata_path(path) + '.tmp', 'w') as f:
+        json.dump({
+            'cities': list(cities),
+            'bucket_minutes': bucket_minutes,
+            'last_updated': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        }, f, indent=2)
+    os.replace(_metadata_path(path) + '.tmp', _metadata_path(path))
+
+    _tensor_cache.pop(path, None)
+    print(f"💾 {buckets} x {base.shape[0]} x {base.shape[1]} travel-time tensor saved to {path}")
+    return tensor
+
+
+def _expand(base, bucket_minutes):
+    """(buckets, n, n) tensor: the base matrix times the congestion factor mid-bucket"""
+    buckets = (24 * 60) // bucket_minutes
+    factors = np.array([_congestion_factor(b * bucket_minutes + bucket_minutes // 2)
+                        for b in range(buckets)], dtype=np.float32)
+    return factors[:, None, None] * np.asarray(base, dtype=np.float32)[None, :, :]
+
+
+def load_time_buckets(path=TIME_BUCKETS_PATH, build=False):
+    """
+    Memory-map the travel-time tensor
+
+    Args:
+        path (str): The .npy file
+        build (bool): Write the file from static data if it is missing (startup,
+                      CLI, scheduler); without it a missing file is answered
+                      with an in-memory tensor and nothing is written
+
+    Returns:
+        tuple: (tensor, cities, bucket_minutes)
+    """
+    cached = _tensor_cache.get(path)
+    if cached is not None and cached[0] == _mtime(path) and (cached[0] is not None or not build):
+        return cached[1]
+
+    if not os.path.exists(path) or not os.path.exists(_metadata_path(path)):
+        if not build:
+            logger.warning(f"{path} not found, using static TIME_MATRIX (build it: python -m Toll.time_dependent)")
+            # Cached under the missing file's mtime (None) until the file appears
+            _tensor_cache[path] = (None, (_expand(TIME_MATRIX, BUCKET_MINUTES), list(CITIES), BUCKET_MINUTES))
+            return _tensor_cache[path][1]
+        with _build_lock:
+            if not os.path.exists(path) or not os.path.exists(_metadata_path(path)):
+                logger.warning(f"{path} not found, building it from static TIME_MATRIX")
+                build_time_buckets(path=path)
+
+    # The file can be replaced while we run (replace_time_buckets); remap then
+    mtime = _mtime(path)
+    with open(_metadata_path(path)) as f:
+        meta = json.load(f)
+    tensor = np.load(path, mmap_mode='r')
+
+    _tensor_cache[path] = (mtime, (tensor, meta['cities'], meta['bucket_minutes']))
+    return _tensor_cache[path][1]
+
+
+def replace_time_buckets(tensor, path=TIME_BUCKETS_PATH):
+    """
+    Atomically swap in an updated tensor with the same cities and buckets;
+    processes that have the old file mapped keep reading it until they remap
+
+    Args:
+        tensor (np.ndarray): (buckets, n, n) travel times in hours
+        path (str): The .npy file to replace
+    """
+    tmp = f"{path}.tmp.npy"
+    np.save(tmp, np.asarray(tensor, dtype=np.float32))
+    os.replace(tmp, path)
+
+    with open(_metadata_path(path)) as f:
+        meta = json.load(f)
+    meta['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    with open(_metadata_path(path) + '.tmp', 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(_metadata_path(path) + '.tmp', _metadata_path(path))
+    _tensor_cache.pop(path, None)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def bucket_for(when, bucket_minutes=BUCKET_MINUTES):
+    """Index of the time bucket containing datetime `when`"""
+    return (when.hour * 60 + when.minute) // bucket_minutes
+
+
+def get_time_dependent_route(source, destination, departure=None, path=TIME_BUCKETS_PATH):
+    """
+    Fastest route for a given departure time
+
+    Runs Dijkstra on arrival times: each leg's travel time is read from the
+    bucket in which the traveller reaches the start of that leg.
+
+    Args:
+        source (str): Starting city
+        destination (str): Destination city
+        departure (datetime): Departure time, defaults to now
+
+    Returns:
+        dict: Route data with departure/arrival times, or None if no route
+    """
+    tensor, cities, bucket_minutes = load_time_buckets(path)
+    if source not in cities or destination not in cities:
+        return None
+
+    with span('apsp.time_dependent'):
+        return _time_dependent_search(tensor, cities, bucket_minutes, source, destination,
+                                      departure or datetime.now())
+
+
+def _time_dependent_search(tensor, cities, bucket_minutes, source, destination, departure):
+    src_idx = cities.index(source)
+    dest_idx = cities.index(destination)
+    n = len(cities)
+
+    elapsed = [float('inf')] * n  # hours since departure
+    previous = [-1] * n
+    elapsed[src_idx] = 0.0
+    heap = [(0.0, src_idx)]
+
+    while heap:
+        hours, u = heapq.heappop(heap)
+        if hours > elapsed[u]:
+            continue
+        if u == dest_idx:
+            break
+
+        bucket = bucket_for(departure + timedelta(hours=hours), bucket_minutes)
+        leg_times = tensor[bucket, u]
+        for v in range(n):
+            if v == u or not np.isfinite(leg_times[v]):
+                continue
+            arrival = hours + float(leg_times[v])
+            if arrival < elapsed[v]:
+                elapsed[v] = arrival
+                previous[v] = u
+                heapq.heappush(heap, (arrival, v))
+
+    if not np.isfinite(elapsed[dest_idx]):
+        return None
+
+    route_idx = [dest_idx]
+    while route_idx[-1] != src_idx:
+        route_idx.append(previous[route_idx[-1]])
+    route_idx.reverse()
+
+    duration_hours = elapsed[dest_idx]
+    return {
+        'route': [cities[i] for i in route_idx],
+        'duration_hours': duration_hours,
+        'departure': departure,
+        'arrival': departure + timedelta(hours=duration_hours),
+        'is_precomputed': True,
+        'data_source': f'Time-bucketed matrix ({bucket_minutes} min buckets)'
+    }
+
+
+def _metadata_path(path):
+    return os.path.splitext(path)[0] + '.json'
+
+
+if __name__ == '__main__':
+    build_time_buckets()
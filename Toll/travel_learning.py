@@ -0,0 +1,213 @@
+# Passive travel-time learning
+# Every live Directions answer carries a traffic-aware duration and a road
+# distance for the pair at the hour it was asked. Instead of discarding them
+# after rendering, get_direct_route records each one here. Observations are
+# buffered per process and folded into one row per (pair, hour of day) in
+# travel_stat: an exponentially weighted mean and variance, with readings more
+# than TRAVEL_OUTLIER_SIGMA deviations away rejected (a closure, a bad geocode)
+# unless they keep coming, in which case the road really has changed.
+#
+# apply_learned() then writes what has been learned back into the data the
+# routers use, without any dedicated API calls:
+#   - the hourly travel-time tensor (time_dependent.py), cell by cell
+#   - the edge store's distance/time for network pairs it already holds,
+#     which the refresh scheduler republishes into the all-pairs tables
+#
+# Configuration (environment, read at startup):
+#   TRAVEL_EWMA_ALPHA        weight of a new observation (default 0.2)
+#   TRAVEL_OUTLIER_SIGMA     rejection threshold in standard deviations (default 3)
+#   TRAVEL_MIN_SAMPLES       observations before a learned value is used (default 3)
+#   TRAVEL_FLUSH_S           how often a worker writes its observations (default 60)
+#
+# Usage: python -m Toll.travel_learning   (flush and apply once)
+
+from collections import defaultdict
+from datetime import datetime
+import logging
+import math
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from sqlalchemy.exc import SQLAlchemyError
+
+from Toll import db
+from Toll.edge_store import _app_context, normalize_city, upsert_edges
+from Toll.models import RouteData, TravelStat
+from Toll.time_dependent import TIME_BUCKETS_PATH, load_time_buckets, replace_time_buckets
+
+logger = logging.getLogger(__name__)
+
+ALPHA = float(os.getenv('TRAVEL_EWMA_ALPHA', 0.2))
+OUTLIER_SIGMA = float(os.getenv('TRAVEL_OUTLIER_SIGMA', 3))
+MIN_SAMPLES = int(os.getenv('TRAVEL_MIN_SAMPLES', 3))
+FLUSH_S = float(os.getenv('TRAVEL_FLUSH_S', 60))
+
+# A run of this many rejected readings is a real change, not an outlier
+MAX_REJECTED = 3
+# Deviation always tolerated, so a pair with near-identical readings does not
+# reject ordinary traffic noise
+MIN_TOLERANCE = 0.05
+# Edge store values are only rewritten when learning moved them this much
+MIN_CHANGE = 0.01
+
+
+def update_stat(stat, hours, distance_km):
+    """
+    Fold one observation into a TravelStat row
+
+    Returns:
+        bool: False if the observation was rejected as an outlier
+    """
+    if not stat.samples:
+        stat.hours_mean, stat.hours_var, stat.distance_km = hours, 0.0, distance_km
+        stat.samples, stat.rejected = 1, 0
+        return True
+
+    deviation = hours - stat.hours_mean
+    tolerance = max(OUTLIER_SIGMA * math.sqrt(stat.hours_var), MIN_TOLERANCE * stat.hours_mean)
+    if stat.samples >= MIN_SAMPLES and abs(deviation) > tolerance and stat.rejected < MAX_REJECTED:
+        stat.rejected += 1
+        return False
+
+    stat.hours_mean += ALPHA * deviation
+    stat.hours_var = (1 - ALPHA) * (stat.hours_var + ALPHA * deviation ** 2)
+    stat.distance_km += ALPHA * (distance_km - stat.distance_km)
+    stat.samples += 1
+    stat.rejected = 0
+    return True
+
+
+class TravelLog:
+    """Per-process buffer of live observations, flushed to travel_stat"""
+
+    def __init__(self, flush_interval=FLUSH_S):
+        self.flush_interval = flush_interval
+        self._observations = defaultdict(list)  # (source, destination, hour) -> [(hours, km)]
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def record(self, source, destination, distance_km, duration_hours, when=None):
+        """Remember one live answer; duration should be the traffic-aware one"""
+        if not (distance_km > 0 and duration_hours > 0):
+            return
+        hour = (when or datetime.now()).hour
+        key = (normalize_city(source), normalize_city(destination), hour)
+        with self._lock:
+            self._observations[key].append((float(duration_hours), float(distance_km)))
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """
+        Fold buffered observations into travel_stat
+
+        Returns:
+            tuple: (accepted, rejected) observation counts
+        """
+        with self._lock:
+            observations, self._observations = self._observations, defaultdict(list)
+            self._last_flush = time.monotonic()
+        if not observations:
+            return 0, 0
+
+        accepted = rejected = 0
+        now = datetime.utcnow()
+        try:
+            with _app_context():
+                for (source, destination, hour), readings in observations.items():
+                    stat = TravelStat.query.filter_by(source=source, destination=destination, hour=hour).first()
+                    if stat is None:
+                        stat = TravelStat(source=source, destination=destination, hour=hour,
+                                          hours_mean=0.0, hours_var=0.0, distance_km=0.0, samples=0, rejected=0)
+                        db.session.add(stat)
+                    for hours, km in readings:
+                        if update_stat(stat, hours, km):
+                            accepted += 1
+                        else:
+                            rejected += 1
+                    stat.updated_at = now
+                db.session.commit()
+        except SQLAlchemyError as e:
+            logger.warning(f"Could not store travel observations: {e}")
+            with _app_context():
+                db.session.rollback()
+            return 0, 0
+        if rejected:
+            logger.info(f"Travel learning: {accepted} observations used, {rejected} rejected as outliers")
+        return accepted, rejected
+
+
+travel_log = TravelLog()
+
+
+def learned_stats():
+    """TravelStat rows with enough samples to be trusted"""
+    with _app_context():
+        return TravelStat.query.filter(TravelStat.samples >= MIN_SAMPLES).all()
+
+
+def apply_learned(path=TIME_BUCKETS_PATH):
+    """
+    Write learned travel times into the time tensor and the edge store
+
+    Returns:
+        dict: Number of tensor cells and edge store edges updated
+    """
+    stats = learned_stats()
+    if not stats:
+        return {'tensor_cells': 0, 'edges': 0}
+
+    # Hourly tensor: every bucket inside a learned hour takes the learned value
+    tensor, cities, bucket_minutes = load_time_buckets(path, build=True)
+    index = {city: i for i, city in enumerate(cities)}
+    bucket_hours = np.arange(tensor.shape[0]) * bucket_minutes // 60
+    updated = np.array(tensor)
+    cells = 0
+    for stat in stats:
+        if stat.source in index and stat.destination in index:
+            buckets = bucket_hours == stat.hour
+            updated[buckets, index[stat.source], index[stat.destination]] = stat.hours_mean
+            cells += int(buckets.sum())
+    if cells and not np.allclose(updated, tensor):
+        replace_time_buckets(updated, path)
+
+    # Edge store: sample-weighted day average per pair, only where it moved
+    per_pair = defaultdict(list)
+    for stat in stats:
+        per_pair[(stat.source, stat.destination)].append(stat)
+    with _app_context():
+        stored = {(r.source, r.destination): r for r in RouteData.query.all()}
+    edges = []
+    for pair, pair_stats in per_pair.items():
+        row = stored.get(pair)
+        if row is None:
+            continue
+        weights = np.array([s.samples for s in pair_stats], dtype=float)
+        hours = float(np.average([s.hours_mean for s in pair_stats], weights=weights))
+        km = float(np.average([s.distance_km for s in pair_stats], weights=weights))
+        if abs(hours - row.time) > MIN_CHANGE * row.time or abs(km - row.distance) > MIN_CHANGE * row.distance:
+            edges.append((pair[0], pair[1], km, hours, row.toll))
+    if edges:
+        upsert_edges(edges)
+
+    logger.info(f"Applied learned travel times: {cells} tensor cells, {len(edges)} edges")
+    return {'tensor_cells': cells, 'edges': len(edges)}
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO)
+    travel_log.flush()
+    applied = apply_learned()
+    if applied['edges']:
+        from Toll.refresh_scheduler import apply_to_live_matrices
+        apply_to_live_matrices()
+    print(f"📈 {len(learned_stats())} learned (pair, hour) entries; updated {applied}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+# Weighted-cost routing: blend distance, time and toll into a single cost
+# e.g. 0.6*time + 0.4*toll for fleet customers. Each distinct weighting pays
+# one all-pairs run; repeat weightings are served from an LRU cache.
+
+from functools import lru_cache
+import logging
+
+import numpy as np
+
+from Toll.static_data import CITIES, DISTANCE_MATRIX, TIME_MATRIX, TOLL_MATRIX
+from Toll.floyd_warshall import floyd_warshall, reconstruct_path
+from Toll.metrics import span, record_cache
+
+logger = logging.getLogger(__name__)
+
+# Order of the metric axis in METRIC_STACK and in quantized weight tuples
+METRICS = ('distance', 'time', 'toll')
+
+# Weights are rounded to this step before hitting the cache, so 0.61/0.39
+# and 0.6/0.4 share one all-pairs result
+WEIGHT_STEP = 0.05
+# Grid steps in a full weighting; quantized weights always sum to exactly this
+WEIGHT_STEPS = round(1 / WEIGHT_STEP)
+CACHE_SIZE = 64
+
+# (3, n, n) tensor of the static metric matrices
+METRIC_STACK = np.array([DISTANCE_MATRIX, TIME_MATRIX, TOLL_MATRIX], dtype=float)
+
+# km, hours and INR live on very different scales - divide each metric by its
+# mean off-diagonal value so a weight of 0.5 means "half the importance"
+_off_diagonal = ~np.eye(len(CITIES), dtype=bool)
+METRIC_SCALES = METRIC_STACK[:, _off_diagonal].mean(axis=1)
+
+
+def quantize_weights(weights):
+    """
+    Normalize a weight mapping and round it onto the WEIGHT_STEP grid
+
+    Args:
+        weights (dict): e.g. {'time': 0.6, 'toll': 0.4}; missing metrics count as 0
+
+    Returns:
+        tuple: integer grid steps per metric, ordered as METRICS, summing to
+               WEIGHT_STEPS (largest-remainder rounding)
+    """
+    unknown = set(weights) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics in weights: {sorted(unknown)}")
+
+    w = np.array([float(weights.get(m) or 0) for m in METRICS])
+    if (w < 0).any() or w.sum() <= 0:
+        raise ValueError("Weights must be non-negative and not all zero")
+
+    exact = w / w.sum() * WEIGHT_STEPS
+    steps = np.floor(exact).astype(int)
+    # The steps lost to rounding down go to the largest remainders, so equal
+    # weightings always land on the same grid point and sum to one
+    short = WEIGHT_STEPS - steps.sum()
+    steps[np.argsort(steps - exact, kind='stable')[:max(short, 0)]] += 1
+    return tuple(int(s) for s in steps)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _weighted_apsp(quantized):
+    """Blend the metric stack with the given grid weights and run all-pairs"""
+    w = np.array(quantized, dtype=float)
+    w /= w.sum()
+    blended = np.tensordot(w / METRIC_SCALES, METRIC_STACK, axes=1)
+
+    logger.info(f"Running all-pairs for weights {dict(zip(METRICS, w.round(2)))}")
+    dist, next_node = floyd_warshall(blended)
+
+    # Cached arrays are shared between requests
+    dist.setflags(write=False)
+    next_node.setflags(write=False)
+    return dist, next_node
+
+
+def get_weighted_route(source, destination, weights):
+    """
+    Get the route minimizing a weighted blend of distance, time and toll
+
+    Args:
+        source (str): Starting city
+        destination (str): Destination city
+        weights (dict): Metric weights, e.g. {'time': 0.6, 'toll': 0.4}
+
+    Returns:
+        dict: Route data in the same shape as get_direct_route(), or None
+              if either city is not in the static network
+    """
+    if source not in CITIES or destination not in CITIES:
+        return None
+
+    quantized = quantize_weights(weights)
+    with span('cache.weighted_apsp'):
+        hits = _weighted_apsp.cache_info().hits
+        dist, next_node = _weighted_apsp(quantized)
+        record_cache('weighted_apsp', _weighted_apsp.cache_info().hits > hits)
+
+    src_idx = CITIES.index(source)
+    dest_idx = CITIES.index(destination)
+    if src_idx == dest_idx:
+        route = [source]
+    else:
+        route = reconstruct_path(src_idx, dest_idx, next_node, CITIES)
+    if not route:
+        return None
+
+    # Sum each real metric along the chosen legs
+    idx = [CITIES.index(city) for city in route]
+    totals = METRIC_STACK[:, idx[:-1], idx[1:]].sum(axis=1)
+
+    return {
+        'route': route,
+        'distance_km': float(totals[0]),
+        'duration_hours': float(totals[1]),
+        'toll_cost': float(totals[2]),
+        'weighted_cost': float(dist[src_idx][dest_idx]),
+        'weights': {m: round(s * WEIGHT_STEP, 2) for m, s in zip(METRICS, quantized)},
+        'is_precomputed': True,
+        'data_source': 'Weighted Floyd-Warshall'
+    }
+
+
+def weighted_cache_info():
+    """Hit/miss statistics of the weighted all-pairs cache"""
+    return _weighted_apsp.cache_info()
@@ -0,0 +1,15 @@
+# WSGI entry point for production servers
+#   gunicorn -c gunicorn.conf.py
+# Set SMARTROUTE_PRELOAD=0 to skip loading routing data and clients up front.
+
+import logging
+import os
+
+from Toll import create_app
+
+app = create_app(preload=os.getenv('SMARTROUTE_PRELOAD', '1') == '1')
+
+if os.getenv('REFRESH_SCHEDULER') == '1':
+    # A scheduler thread here would run in the gunicorn master (or once per worker)
+    logging.getLogger(__name__).warning(
+        "REFRESH_SCHEDULER=1 is ignored under gunicorn; run `python -m Toll.refresh_scheduler` as its own process")
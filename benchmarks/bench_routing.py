@@ -0,0 +1,329 @@
+# Microbenchmarks for the routing hot paths
+# Runs each benchmark on synthetic city networks (8 to 5,000 nodes) and canned
+# Directions payloads, records median time and peak memory, and compares both
+# against a saved JSON baseline.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.bench_routing --save-baseline     # record a baseline
+#   python -m benchmarks.bench_routing                     # compare, exit 1 on regression
+#   python -m benchmarks.bench_routing --threshold 0.5 --filter floyd
+
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+DEFAULT_SIZES = [8, 64, 500, 5000]
+DEFAULT_THRESHOLD = 0.25
+# Peak-memory growth below this many KiB is noise, whatever the ratio
+PEAK_SLACK_KB = 16
+
+HAVE_SCIPY = importlib.util.find_spec('scipy') is not None
+
+
+class Benchmark:
+    """
+    A named hot path measured at several network sizes
+
+    setup(n) builds the inputs outside the timed region and returns a
+    zero-argument callable that runs the code under test once, or a
+    (run, teardown) pair when it patches state that must be restored.
+    """
+
+    def __init__(self, name, setup, max_nodes=None, repeat=7):
+        self.name = name
+        self.setup = setup
+        self.max_nodes = max_nodes
+        self.repeat = repeat
+
+    def sizes(self, sizes):
+        return [n for n in sizes if self.max_nodes is None or n <= self.max_nodes]
+
+
+# ----------------------------------------------------------------------
+# Synthetic inputs
+# ----------------------------------------------------------------------
+
+def synthetic_matrix(n, seed=42):
+    """Random symmetric cost matrix with ~30% missing direct edges"""
+    rng = np.random.default_rng(seed)
+    matrix = rng.uniform(50, 2000, size=(n, n))
+    matrix = (matrix + matrix.T) / 2
+    matrix[rng.random((n, n)) < 0.3] = np.inf
+    np.fill_diagonal(matrix, 0)
+    return matrix
+
+
+def synthetic_grid(n, seed=42):
+    """Road-like CSR graph: a roughly square grid of two-way streets"""
+    from Toll.contraction_hierarchy import edges_to_csr
+    side = max(2, int(round(np.sqrt(n))))
+    ids = np.arange(side * side).reshape(side, side)
+    pairs = np.concatenate([
+        np.stack([ids[:, :-1].ravel(), ids[:, 1:].ravel()], axis=1),
+        np.stack([ids[:-1, :].ravel(), ids[1:, :].ravel()], axis=1)
+    ])
+    sources = np.concatenate([pairs[:, 0], pairs[:, 1]])
+    targets = np.concatenate([pairs[:, 1], pairs[:, 0]])
+    weights = np.random.default_rng(seed).uniform(10, 120, size=len(sources))
+    return edges_to_csr(side * side, sources, targets, weights)
+
+
+def road_matrix(n):
+    """Dense cost matrix of synthetic_grid(n): sparse, like a real road network"""
+    indptr, indices, weights = synthetic_grid(n)
+    nodes = len(indptr) - 1
+    matrix = np.full((nodes, nodes), np.inf)
+    matrix[np.repeat(np.arange(nodes), np.diff(indptr)), indices] = weights
+    np.fill_diagonal(matrix, 0)
+    return matrix
+
+
+def synthetic_cities(n):
+    return [f"City{i}" for i in range(n)]
+
+
+def chain_next_node(n):
+    """next_node matrix whose 0 -> n-1 path visits every node (worst case)"""
+    idx = np.arange(n, dtype=np.int32)
+    return np.where(idx[None, :] > idx[:, None], idx[:, None] + 1, -1).astype(np.int32)
+
+
+def synthetic_precomputed(n):
+    """
+    precomputed_routes.json-shaped dict for n cities
+
+    Sources share one row dict: lookups cost the same, and 5000 nodes would
+    otherwise need 75M floats before anything is timed.
+    """
+    cities = synthetic_cities(n)
+    rng = np.random.default_rng(7)
+    row = dict(zip(cities, rng.uniform(50, 2000, size=n).round(1).tolist()))
+    matrix = dict.fromkeys(cities, row)
+    paths = {src: {dst: [src, dst] for dst in cities[:50]} for src in cities}
+    return {
+        'distance_matrix': matrix, 'time_matrix': matrix, 'toll_matrix': matrix,
+        'distance_paths': paths, 'time_paths': paths, 'toll_paths': paths,
+        'cities': cities, 'last_updated': 'benchmark'
+    }
+
+
+class CannedGmaps:
+    """Stand-in for googlemaps.Client returning a fixed payload"""
+
+    def __init__(self, payload):
+        self.payload = payload
+
+    def directions(self, *args, **kwargs):
+        return self.payload
+
+
+# ----------------------------------------------------------------------
+# Benchmarks
+# ----------------------------------------------------------------------
+
+def setup_floyd_warshall(n):
+    from Toll.floyd_warshall import floyd_warshall
+    matrix = synthetic_matrix(n)
+    return lambda: floyd_warshall(matrix)
+
+
+def setup_floyd_warshall_road(n):
+    from Toll.floyd_warshall import floyd_warshall
+    matrix = road_matrix(n)
+    return lambda: floyd_warshall(matrix)
+
+
+def setup_reconstruct_path(n):
+    from Toll.floyd_warshall import reconstruct_path
+    next_node = chain_next_node(n)
+    cities = synthetic_cities(n)
+    return lambda: reconstruct_path(0, n - 1, next_node, cities)
+
+
+def setup_precomputed_route(n):
+    from Toll.smart_routing import SmartRouter
+    router = SmartRouter.__new__(SmartRouter)
+    router.precomputed_data = synthetic_precomputed(n)
+    cities = router.precomputed_data['cities']
+    pairs = [(cities[i % n], cities[(i * 7 + 3) % n]) for i in range(100)]
+
+    def run():
+        for src, dst in pairs:
+            router.get_precomputed_route(src, dst, 'time')
+    return run
+
+
+def setup_ch_query(n):
+    from Toll.contraction_hierarchy import ContractionHierarchy
+    hierarchy = ContractionHierarchy.build(*synthetic_grid(n))
+    nodes = hierarchy.node_count
+    pairs = [(i * 31 % nodes, (i * 97 + 13) % nodes) for i in range(100)]
+
+    def run():
+        for src, dst in pairs:
+            hierarchy.query(src, dst)
+    return run
+
+
+def setup_get_matrix(n):
+    from Toll.static_data import get_matrix
+
+    def run():
+        for preference in ('distance', 'time', 'toll'):
+            get_matrix(preference)
+    return run
+
+
+def setup_direct_route_scoring(n):
+    import Toll.direct_routing as direct_routing
+    from Toll.fake_providers import synthetic_directions
+    original = direct_routing.gmaps
+    direct_routing.gmaps = CannedGmaps(synthetic_directions('Mumbai', 'Delhi', steps=60))
+
+    def run():
+        for preference in ('time', 'distance', 'toll'):
+            direct_routing.get_direct_route('Mumbai', 'Delhi', preference)
+
+    def teardown():
+        direct_routing.gmaps = original
+    return run, teardown
+
+
+BENCHMARKS = [
+    # Dense graph: all_pairs picks Floyd-Warshall (numpy, numba or scipy),
+    # O(n^3), so 5000 nodes would take minutes
+    Benchmark('floyd_warshall', setup_floyd_warshall, max_nodes=500, repeat=3),
+    # Road-like sparse graph: all_pairs picks scipy's Dijkstra, which reaches
+    # 5000 nodes; without scipy it falls back to numpy Floyd-Warshall
+    Benchmark('floyd_warshall.road', setup_floyd_warshall_road,
+              max_nodes=None if HAVE_SCIPY else 500, repeat=3),
+    Benchmark('reconstruct_path', setup_reconstruct_path),
+    # 100 queries on a contracted street grid; preprocessing is in setup
+    Benchmark('contraction_hierarchy.query', setup_ch_query, repeat=3),
+    Benchmark('smart_router.get_precomputed_route', setup_precomputed_route),
+    # Static 8-city tables, network size does not apply
+    Benchmark('static_data.get_matrix', setup_get_matrix, max_nodes=8),
+    Benchmark('direct_routing.alternative_scoring', setup_direct_route_scoring, max_nodes=8),
+]
+
+
+# ----------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------
+
+def measure(bench, n):
+    """Median/min wall time over bench.repeat runs plus peak traced memory"""
+    run = bench.setup(n)
+    run, teardown = run if isinstance(run, tuple) else (run, None)
+    try:
+        run()  # warm-up
+
+        timings = []
+        for _ in range(bench.repeat):
+            gc.disable()
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+            gc.enable()
+
+        tracemalloc.start()
+        run()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        if teardown:
+            teardown()
+
+    return {
+        'median_s': statistics.median(timings),
+        'min_s': min(timings),
+        'peak_kb': peak / 1024,
+        'repeat': bench.repeat
+    }
+
+
+def run_benchmarks(sizes, name_filter=None):
+    results = {}
+    for bench in BENCHMARKS:
+        if name_filter and name_filter not in bench.name:
+            continue
+        for n in bench.sizes(sizes):
+            key = f"{bench.name}[n={n}]"
+            results[key] = measure(bench, n)
+            r = results[key]
+            print(f"{key:55s} median {r['median_s'] * 1000:10.3f} ms   peak {r['peak_kb']:10.1f} KiB")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Benchmarks whose median time or peak memory regressed past the threshold
+
+    Returns:
+        list: (key, 'median_s' or 'peak_kb', ratio to baseline) tuples
+    """
+    regressions = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        ratio = result['median_s'] / base['median_s'] if base['median_s'] else 1.0
+        if ratio > 1 + threshold:
+            regressions.append((key, 'median_s', ratio))
+        if 'peak_kb' in base and result['peak_kb'] - base['peak_kb'] > PEAK_SLACK_KB:
+            ratio = result['peak_kb'] / base['peak_kb'] if base['peak_kb'] else float('inf')
+            if ratio > 1 + threshold:
+                regressions.append((key, 'peak_kb', ratio))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Routing hot-path microbenchmarks")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="baseline JSON path")
+    parser.add_argument('--save-baseline', action='store_true', help="write this run as the new baseline")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="allowed slowdown vs baseline, 0.25 = 25%%")
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help="network sizes")
+    parser.add_argument('--filter', dest='name_filter', help="only run benchmarks containing this text")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(sorted(args.sizes), args.name_filter)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for key, metric, ratio in regressions:
+        label = 'time' if metric == 'median_s' else 'peak memory'
+        print(f"❌ {key} {label} is {ratio:.2f}x its baseline")
+    if regressions:
+        return 1
+    print(f"✅ No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
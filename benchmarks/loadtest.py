@@ -0,0 +1,180 @@
+# End-to-end load test for /get_the_route
+# Drives logged-in sessions through the Flask app and reports throughput and
+# p50/p95/p99 latency per routing strategy. Answers replayed from the result
+# cache (a result_cache-hit entry in Server-Timing) get their own 'cached' row,
+# since they repeat the original strategy's messages; --no-cache turns the
+# cache off for the in-process app instead. By default the app runs in-process
+# with the local provider stand-ins (Toll/fake_providers.py), so no Google
+# quota is used; --url points it at a running server instead.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.loadtest --users 20 --duration 30
+#   python -m benchmarks.loadtest --no-cache               # every request routed
+#   FAKE_LATENCY_MS=400 FAKE_429_BURST_RATE=0.01 python -m benchmarks.loadtest
+#   python -m benchmarks.loadtest --url http://localhost:5000 --users 5
+
+import argparse
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+PAIRS = [("Mumbai", "Pune"), ("Delhi", "Ahmedabad"), ("Bangalore", "Chennai"),
+         ("Hyderabad", "Mumbai"), ("Kolkata", "Delhi"), ("Pune", "Bangalore")]
+
+# (share of requests, form fields) per scenario
+SCENARIOS = [
+    (0.6, lambda: {'preference': random.choice(['distance', 'time', 'toll'])}),
+    (0.2, lambda: {'preference': 'weighted', 'time_weight': random.choice([0.5, 0.6, 0.7]),
+                   'toll_weight': 0.3, 'distance_weight': 0}),
+    (0.2, lambda: {'preference': 'time', 'departure': (datetime.now() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M')}),
+]
+
+CSRF_RE = re.compile(r'name="csrf_token" type="hidden" value="([^"]+)"')
+
+
+def classify(body, server_timing=''):
+    """Routing strategy the app used, read from the flashed message"""
+    # A cache hit replays the flash messages of the answer it stored
+    if 'result_cache-hit' in server_timing:
+        return 'cached'
+    if 'Weighted route' in body:
+        return 'weighted'
+    if 'Planned departure' in body:
+        return 'planned_departure'
+    if 'Direct route via' in body:
+        return 'direct_google_maps'
+    if 'Too many route requests' in body:
+        return 'rate_limited'
+    if 'estimated from the cost model' in body:
+        return 'model_estimate'
+    if 'Using offline estimates' in body:
+        return 'offline_fallback'
+    return 'error'
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+class InProcessSession:
+    """Logged-in Flask test client"""
+
+    def __init__(self, app, username):
+        self.client = app.test_client()
+        form = {'username': username, 'email_address': f'{username}@example.com',
+                'password1': 'loadtest1', 'password2': 'loadtest1'}
+        self.client.post('/Register', data=form)
+        self.client.post('/login', data={'username': username, 'password': 'loadtest1'})
+
+    def route(self, form):
+        response = self.client.post('/get_the_route', data=form, follow_redirects=True)
+        return response.status_code, response.get_data(as_text=True), response.headers.get('Server-Timing', '')
+
+
+class HttpSession:
+    """Logged-in requests session against a running server"""
+
+    def __init__(self, base_url, username):
+        import requests
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        self._post('/Register', {'username': username, 'email_address': f'{username}@example.com',
+                                 'password1': 'loadtest1', 'password2': 'loadtest1'})
+        self._post('/login', {'username': username, 'password': 'loadtest1'})
+
+    def _post(self, path, form):
+        page = self.session.get(self.base_url + path)
+        token = CSRF_RE.search(page.text)
+        if token:
+            form = dict(form, csrf_token=token.group(1))
+        return self.session.post(self.base_url + path, data=form)
+
+    def route(self, form):
+        response = self._post('/get_the_route', form)
+        return response.status_code, response.text, response.headers.get('Server-Timing', '')
+
+
+def make_app(cache=True):
+    """Import the app wired to the local provider stand-ins and a scratch DB"""
+    os.environ.setdefault('SMARTROUTE_FAKE_PROVIDERS', '1')
+    if not cache:
+        os.environ['RESULT_CACHE_SIZE'] = '0'
+    os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'loadtest.db'))
+    # A handful of users would otherwise exhaust their route buckets within
+    # seconds and measure the rate-limited path; export RATE_LIMIT_ENABLED=1 to test it
+    os.environ.setdefault('RATE_LIMIT_ENABLED', '0')
+    from Toll import create_app
+    app = create_app(preload=True)
+    app.config['WTF_CSRF_ENABLED'] = False
+    return app
+
+
+def run_user(session, deadline, results, lock):
+    weights = [share for share, _ in SCENARIOS]
+    while time.time() < deadline:
+        source, destination = random.choice(PAIRS)
+        _, make_fields = random.choices(SCENARIOS, weights=weights)[0]
+        form = dict(make_fields(), source=source, destination=destination)
+
+        started = time.perf_counter()
+        try:
+            status, body, server_timing = session.route(form)
+            strategy = classify(body, server_timing) if status == 200 else f'http_{status}'
+        except Exception:
+            strategy = 'exception'
+        elapsed = time.perf_counter() - started
+
+        with lock:
+            results[strategy].append(elapsed)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the routing endpoint")
+    parser.add_argument('--users', type=int, default=10, help="concurrent logged-in sessions")
+    parser.add_argument('--duration', type=float, default=20, help="seconds to run")
+    parser.add_argument('--url', help="base URL of a running server (default: in-process app)")
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--no-cache', action='store_true',
+                        help="disable the result cache (in-process app only; set RESULT_CACHE_SIZE=0 on a server)")
+    args = parser.parse_args(argv)
+    random.seed(args.seed)
+
+    if args.url:
+        sessions = [HttpSession(args.url, f"load{i}_{int(time.time())}") for i in range(args.users)]
+    else:
+        app = make_app(cache=not args.no_cache)
+        sessions = [InProcessSession(app, f"load{i}") for i in range(args.users)]
+
+    results = defaultdict(list)
+    lock = threading.Lock()
+    started = time.time()
+    deadline = started + args.duration
+    threads = [threading.Thread(target=run_user, args=(s, deadline, results, lock)) for s in sessions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.time() - started
+
+    total = sum(len(v) for v in results.values())
+    print(f"\n{total} requests from {args.users} users in {wall:.1f}s → {total / wall:.1f} req/s\n")
+    print(f"{'strategy':22s} {'count':>7s} {'req/s':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s} {'mean ms':>9s}")
+    for strategy, timings in sorted(results.items()):
+        print(f"{strategy:22s} {len(timings):7d} {len(timings) / wall:7.1f} "
+              f"{percentile(timings, 50) * 1000:9.1f} {percentile(timings, 95) * 1000:9.1f} "
+              f"{percentile(timings, 99) * 1000:9.1f} {statistics.mean(timings) * 1000:9.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
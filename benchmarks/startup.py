@@ -0,0 +1,31 @@
+# Startup timing report
+# Times a cold start in a fresh interpreter: importing Toll (what CLI tools
+# such as test_gmaps.py pay) and then create_app(), phase by phase.
+#
+# Usage (from the repository root):
+#   python -m benchmarks.startup            # lazy start, as a worker without preload
+#   python -m benchmarks.startup --preload  # gunicorn-master style start
+
+import argparse
+import sys
+import time
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Report SmartRoute startup timing")
+    parser.add_argument('--preload', action='store_true', help="also preload routing data and clients")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    import Toll
+    imported = time.perf_counter() - started
+    print(f"{'import Toll':32s} {imported * 1000:9.1f} ms")
+
+    from Toll import startup
+    Toll.create_app(preload=args.preload)
+    print(startup.report())
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
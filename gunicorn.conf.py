@@ -0,0 +1,26 @@
+# gunicorn settings for SmartRoute
+# The app is built and its routing data preloaded once in the master
+# (preload_app), then forked: workers share the parsed precomputed routes,
+# NumPy matrices and the memory-mapped time tensor copy-on-write and boot
+# without repeating the imports.
+#
+#   gunicorn -c gunicorn.conf.py
+#
+# /metrics is per worker (see Toll/metrics.py): for complete Prometheus
+# numbers run one single-worker instance per port and scrape each of them.
+
+import multiprocessing
+import os
+
+wsgi_app = 'Toll.wsgi:app'
+bind = os.getenv('BIND', '0.0.0.0:8000')
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+preload_app = True
+
+
+def post_fork(server, worker):
+    # Database connections opened in the master must not be shared across processes
+    from Toll import app, db
+    with app.app_context():
+        db.engine.dispose()
@@ -0,0 +1,74 @@
+# Cross-checks of the all-pairs shortest path backends (Toll/apsp.py)
+# Every installed backend must agree with the pure-Python reference on costs
+# and return next-hop matrices whose paths add up to those costs.
+#
+# Usage (from the repository root): python -m pytest tests
+
+import numpy as np
+import pytest
+
+from Toll.apsp import _random_graph, _solve_python, all_pairs, available_backends, path
+
+BACKENDS = available_backends()
+
+
+def assert_matches_reference(matrix, backend):
+    reference, _ = _solve_python(matrix.copy())
+    dist, nxt = all_pairs(matrix, backend=backend)
+    n = len(matrix)
+
+    # Same unreachable pairs, same costs everywhere else
+    assert np.array_equal(np.isinf(dist), np.isinf(reference))
+    assert np.allclose(dist[np.isfinite(dist)], reference[np.isfinite(reference)])
+
+    # -1 exactly on the diagonal and for unreachable pairs
+    assert ((nxt == -1) == (np.isinf(dist) | np.eye(n, dtype=bool))).all()
+
+    for i in range(n):
+        for j in range(n):
+            if i != j and np.isfinite(dist[i, j]):
+                hops = path(nxt, i, j)
+                assert hops[0] == i and hops[-1] == j
+                assert np.isclose(sum(matrix[a, b] for a, b in zip(hops, hops[1:])), dist[i, j])
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+@pytest.mark.parametrize('n', [1, 2, 7, 30, 70])
+@pytest.mark.parametrize('density', [0.02, 0.3, 1.0])
+def test_backend_agrees_with_python_on_random_graphs(backend, n, density):
+    # Non-negative weights with some zero-cost edges; sparse graphs leave pairs at inf
+    matrix = _random_graph(n, density, np.random.default_rng(n * 1000 + int(density * 100)))
+    assert_matches_reference(matrix, backend)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_disconnected_components_stay_unreachable(backend):
+    inf = np.inf
+    matrix = np.array([
+        [0, 4, inf, inf],
+        [1, 0, inf, inf],
+        [inf, inf, 0, 2],
+        [inf, inf, inf, 0],
+    ])
+    dist, nxt = all_pairs(matrix, backend=backend)
+    assert np.isinf(dist[0, 2]) and np.isinf(dist[3, 2]) and nxt[0, 2] == -1
+    assert dist[2, 3] == 2 and nxt[2, 3] == 3
+    assert_matches_reference(matrix, backend)
+
+
+@pytest.mark.parametrize('backend', BACKENDS)
+def test_shortcut_through_intermediate_node(backend):
+    matrix = np.array([
+        [0, 10, 3],
+        [np.inf, 0, np.inf],
+        [np.inf, 2, 0],
+    ])
+    dist, nxt = all_pairs(matrix, backend=backend)
+    assert dist[0, 1] == 5
+    assert path(nxt, 0, 1) == [0, 2, 1]
+
+
+def test_list_input_with_none_for_missing_edges():
+    dist, nxt = all_pairs([[0, 1, None], [None, 0, 1], [None, None, 0]], backend='python')
+    assert dist[0, 2] == 2 and np.isinf(dist[2, 0])
+    assert path(nxt, 0, 2) == [0, 1, 2]
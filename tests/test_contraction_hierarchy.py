@@ -0,0 +1,77 @@
+# Cross-checks of the contraction hierarchy (Toll/contraction_hierarchy.py)
+# Both query engines must return the all-pairs reference cost and a path of
+# original edges that adds up to it.
+#
+# Usage (from the repository root): python -m pytest tests
+
+import numpy as np
+import pytest
+
+from Toll.apsp import _random_graph, _solve_python
+from Toll.contraction_hierarchy import ContractionHierarchy, edges_to_csr
+
+ENGINES = ['_query_python']
+try:
+    import scipy  # noqa: F401
+    ENGINES.append('_query_scipy')
+except ImportError:
+    pass
+
+
+def hierarchy_for(matrix):
+    sources, targets = np.nonzero(np.isfinite(matrix) & ~np.eye(len(matrix), dtype=bool))
+    csr = edges_to_csr(len(matrix), sources, targets, matrix[sources, targets])
+    return ContractionHierarchy.build(*csr)
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+@pytest.mark.parametrize('n, density', [(12, 0.3), (40, 0.08), (40, 0.5)])
+def test_queries_match_reference(engine, n, density):
+    # Whole-number weights keep float32 storage exact
+    matrix = np.round(_random_graph(n, density, np.random.default_rng(n + int(density * 100))))
+    reference, _ = _solve_python(matrix.copy())
+    query = getattr(hierarchy_for(matrix), engine)
+
+    for i in range(n):
+        for j in range(n):
+            if i == j:
+                continue
+            cost, hops = query(i, j)
+            if np.isinf(reference[i, j]):
+                assert cost == np.inf and hops == []
+                continue
+            assert cost == pytest.approx(reference[i, j])
+            assert hops[0] == i and hops[-1] == j
+            assert sum(matrix[a, b] for a, b in zip(hops, hops[1:])) == pytest.approx(cost)
+
+
+def test_save_load_round_trip(tmp_path):
+    matrix = np.round(_random_graph(20, 0.3, np.random.default_rng(5)))
+    hierarchy = hierarchy_for(matrix)
+    hierarchy.save(tmp_path / 'ch.npz')
+    loaded = ContractionHierarchy.load(tmp_path / 'ch.npz')
+    for i, j in [(0, 19), (3, 7), (11, 2)]:
+        assert loaded.query(i, j) == hierarchy.query(i, j)
+
+
+def test_pruned_interpreter_search_stays_exact():
+    # Planar towns joined to their nearest neighbours; straight-line km never overestimates
+    rng = np.random.default_rng(3)
+    xy = rng.uniform(0, 100, size=(60, 2))
+    d = np.hypot(*(xy[:, None, :] - xy[None, :, :]).transpose(2, 0, 1))
+    matrix = np.full_like(d, np.inf)
+    near = np.argsort(d, axis=1)[:, 1:4]
+    rows = np.repeat(np.arange(60), 3)
+    matrix[rows, near.ravel()] = matrix[near.ravel(), rows] = np.round(d[rows, near.ravel()] * 1.2) + 1
+    np.fill_diagonal(matrix, 0)
+    reference, _ = _solve_python(matrix.copy())
+    hierarchy = hierarchy_for(matrix)
+
+    def straight_line(a, b):
+        return np.atleast_1d(np.hypot(*(xy[a] - xy[b]).T))
+
+    for i in range(0, 60, 7):
+        for j in range(60):
+            cost, hops = hierarchy._query_python(i, j, straight_line)
+            expected = reference[i, j]
+            assert cost == pytest.approx(expected) if np.isfinite(expected) else cost == np.inf
@@ -0,0 +1,50 @@
+# Query normalization behind the route result cache (Toll/result_cache.py)
+# The result URL carries a normalized query; normalizing it again on the GET
+# must give the same query, or the cache key and the submitted marker differ.
+#
+# Usage (from the repository root): python -m pytest tests
+
+import numpy as np
+import pytest
+
+from Toll.result_cache import normalize_query, parse_steps, query_weights
+
+
+def renormalize(query):
+    """What /route does with the query string of a result URL"""
+    return normalize_query(query['source'], query['destination'], query['preference'],
+                           steps=query.get('weights'), departure=query.get('departure'))
+
+
+@pytest.mark.parametrize('weights', [
+    {'time': 0.5, 'toll': 0.3},
+    {'distance': 1, 'time': 1, 'toll': 1},
+    {'time': 0.61, 'toll': 0.39},
+    {'distance': 0.05},
+])
+def test_weighted_query_is_a_fixed_point(weights):
+    query = normalize_query(' mumbai ', 'Pune', 'weighted', weights=weights)
+    assert renormalize(query) == query
+    # Going through the weights dict lands on the same grid point too
+    again = normalize_query('Mumbai', 'Pune', 'weighted', weights=query_weights(query))
+    assert again == query
+
+
+def test_random_weightings_are_fixed_points():
+    rng = np.random.default_rng(11)
+    for _ in range(500):
+        w = rng.random(3) + 1e-3
+        query = normalize_query('Delhi', 'Pune', 'weighted', weights=dict(zip(('distance', 'time', 'toll'), w)))
+        assert renormalize(query) == query
+        assert abs(sum(query_weights(query).values()) - 1) < 1e-9
+
+
+def test_partial_steps_are_quantized():
+    assert parse_steps('0,12,7') == (0, 13, 7)
+    assert parse_steps('0,13,7') == (0, 13, 7)
+
+
+@pytest.mark.parametrize('value', ['a,b,c', '1,2', '0,0,0'])
+def test_bad_steps(value):
+    with pytest.raises(ValueError):
+        parse_steps(value)
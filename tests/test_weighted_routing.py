@@ -0,0 +1,39 @@
+# Weight quantization for weighted-cost routing (Toll/weighted_routing.py)
+#
+# Usage (from the repository root): python -m pytest tests
+
+import numpy as np
+import pytest
+
+from Toll.weighted_routing import METRICS, WEIGHT_STEPS, quantize_weights
+
+
+def test_steps_always_sum_to_a_full_weighting():
+    rng = np.random.default_rng(3)
+    for _ in range(2000):
+        w = rng.random(3) * (rng.random(3) < 0.8)
+        if w.sum() == 0:
+            continue
+        steps = quantize_weights(dict(zip(METRICS, w)))
+        assert sum(steps) == WEIGHT_STEPS
+        assert all(s >= 0 for s in steps)
+
+
+@pytest.mark.parametrize('weights, expected', [
+    ({'time': 0.5, 'toll': 0.3}, (0, 13, 7)),  # 12.5 / 7.5: the tie goes to the first metric
+    ({'distance': 1, 'time': 1, 'toll': 1}, (7, 7, 6)),
+    ({'time': 0.61, 'toll': 0.39}, (0, 12, 8)),
+    ({'toll': 0.001}, (0, 0, 20)),
+])
+def test_largest_remainder_rounding(weights, expected):
+    assert quantize_weights(weights) == expected
+
+
+def test_equal_weightings_share_a_grid_point():
+    assert quantize_weights({'time': 0.6, 'toll': 0.4}) == quantize_weights({'time': 3, 'toll': 2})
+
+
+@pytest.mark.parametrize('weights', [{}, {'time': 0}, {'time': -1, 'toll': 2}, {'speed': 1}])
+def test_invalid_weights(weights):
+    with pytest.raises(ValueError):
+        quantize_weights(weights)